@@ -0,0 +1,330 @@
+'''
+Micro-benchmarks for every built-in matcher, runnable unchanged on CPython and on the MicroPython unix port.
+
+Each matcher is timed for `should` and `should_not`, on their passing and failing paths, with small and large
+operands, reporting the time (ns/op) and the memory allocated (bytes/op) by each expectation.
+
+    python benchmarks.py                                  # print the results
+    python benchmarks.py --save baseline.json             # ... and store them
+    python benchmarks.py --compare baseline.json          # ... and flag regressions against a stored run
+    python benchmarks.py --collections                    # ... including collections of up to 1M elements
+    python benchmarks.py --compiled                       # compare `should.compile()` with the infix form
+    python benchmarks.py --modes                          # overhead of an expectation in each mode
+    micropython benchmarks.py --compare baseline.json --threshold 25 --only close_to
+'''
+from ushould_dsl import *
+from ushould_dsl import utils, schemas
+import sys
+from array import array
+
+try:
+    import json
+except ImportError:
+    import ujson as json
+
+SMALL = 3
+LARGE = 1000
+
+ITERATIONS = {SMALL: 1000, LARGE: 100}
+
+# Sizes of the collections searched by the `--collections` cases, with their labels and iterations.
+COLLECTION_SIZES = ((10000, '10k', 10), (100000, '100k', 3), (1000000, '1m', 1))
+
+# Each case is timed this many times and the fastest round is kept, to filter out noise from other processes.
+ROUNDS = 5
+
+DEFAULT_THRESHOLD = 10
+
+class Box(object):
+    def __init__(self, size):
+        self.items = list(range(size))
+    def add_items(self, *items):
+        self.items.extend(items)
+    def item_count(self):
+        return len(self.items)
+    def nothing(self):
+        pass
+
+class Shelf(object):
+    def __init__(self, size):
+        self._box = Box(size)
+    def box(self):
+        return self._box
+
+class Record(object):
+    def __init__(self, size, last=0):
+        self.items = list(range(size))
+        self.last = last
+
+def raise_value_error():
+    raise ValueError('invalid value')
+
+def do_nothing():
+    pass
+
+def cases(size):
+    '''
+        Returns (name, matcher factory, left value matching it, left value not matching it) for each matcher,
+        built with operands of the given size.
+    '''
+    items = list(range(size))
+    other_items = items[:-1] + [-1]
+    text = 'a' * size
+    mapping = dict((i, i) for i in items)
+    box = Box(size)
+    shelf = Shelf(size)
+
+    return [
+        ('be',                              lambda: be(items),                          items,          list(items)),
+        ('be_empty',                        lambda: be_empty,                           [],             items),
+        ('be_greater_than',                 lambda: be_greater_than(-1),                size,           -size),
+        ('be_greater_than_or_equal_to',     lambda: be_greater_than_or_equal_to(0),     size,           -size),
+        ('be_instance_of',                  lambda: be_instance_of(list),               items,          text),
+        ('be_into',                         lambda: be_into(items),                     size - 1,       -1),
+        ('be_kind_of',                      lambda: be_kind_of(list),                   items,          text),
+        ('be_less_than',                    lambda: be_less_than(size + 1),             size,           size + 2),
+        ('be_less_than_or_equal_to',        lambda: be_less_than_or_equal_to(size),     size,           size + 1),
+        ('be_like',                         lambda: be_like(r'a+$'),                    text,           text + 'b'),
+        ('be_thrown_by',                    lambda: be_thrown_by(raise_value_error),    ValueError,     KeyError),
+        ('change',                          lambda: change(box.item_count),             (box.add_items, 1), box.nothing),
+        ('close_to',                        lambda: close_to(size, delta=0.5),          size + 0.25,    size + 1),
+        ('contain',                         lambda: contain(size - 1),                  items,          other_items),
+        ('end_with',                        lambda: end_with('a'),                      text,           text + 'b'),
+        ('equal_to',                        lambda: equal_to(items),                    list(items),    other_items),
+        ('equal_to_ignoring_case',          lambda: equal_to_ignoring_case(text),       text.upper(),   text + 'b'),
+        ('have',                            lambda: have(size).items,                   items,          other_items[1:]),
+        ('have[attribute]',                 lambda: have(size).items,                   box,            Box(size + 1)),
+        ('have[chain]',                     lambda: have(size).items_on_box,            shelf,          Shelf(size + 1)),
+        ('have_at_least',                   lambda: have_at_least(size).items,          items,          other_items[1:]),
+        ('have_at_most',                    lambda: have_at_most(size).items,           items,          items + [0]),
+        ('have_same_attribute_values_as',   lambda: have_same_attribute_values_as(Record(size)), Record(size), Record(size, 1)),
+        ('include',                         lambda: include(size - 1),                  items,          other_items),
+        ('include_all_of',                  lambda: include_all_of(items),              items,          other_items),
+        ('include_any_of',                  lambda: include_any_of(items),              items,          [-1]),
+        ('include_in_any_order',            lambda: include_in_any_order(items),        items,          other_items),
+        ('include_keys',                    lambda: include_keys(*items),               mapping,        {-1: -1}),
+        ('include_values',                  lambda: include_values(*items),             mapping,        {-1: -1}),
+        ('respond_to',                      lambda: respond_to('items'),                box,            items),
+        ('start_with',                      lambda: start_with('a'),                    text,           'b' + text),
+        ('throw',                           lambda: throw(ValueError),                  raise_value_error, do_nothing),
+    ]
+
+def collection_cases(size):
+    '''
+        Returns the cases of the matchers looking for many elements in, or comparing, big collections (of about
+        *size* nodes, for `equal_to`). Each matcher is built once and reused, like when the same expectation is
+        checked against many inputs.
+    '''
+    items = list(range(size))
+    negatives = [-i - 1 for i in items]
+    expected = items[::size // 100]
+    mapping = dict((i, i) for i in items)
+    negative_mapping = dict((i, i) for i in negatives)
+    nested = [[i] for i in items]
+    nested_expected = nested[::size // 100]
+
+    records = [{'id': i, 'tags': [i, -i]} for i in range(size // 4)]
+    other_records = [{'id': i, 'tags': [i, -i]} for i in range(size // 4)]
+    other_records[-1]['tags'][1] = 0
+    invalid_records = records[:-1] + [{'id': -1, 'tags': [str(size)]}]
+
+    samples = array('d', [i / 10 for i in items])
+    other_samples = array('d', samples)
+    other_samples[-1] += 1
+
+    def reused(matcher):
+        return lambda: matcher
+
+    return [
+        ('include_all_of',                  reused(include_all_of(expected)),           items,          items[1:]),
+        ('include_all_of[unhashable]',      reused(include_all_of(nested_expected)),    nested,         nested[1:]),
+        ('include_any_of',                  reused(include_any_of(expected)),           items,          negatives),
+        ('include_any_of[unhashable]',      reused(include_any_of(nested_expected)),    nested,         [[i] for i in negatives]),
+        ('include_in_any_order',            reused(include_in_any_order(expected)),     items,          items[1:]),
+        ('include_keys',                    reused(include_keys(*expected)),            mapping,        negative_mapping),
+        ('include_values',                  reused(include_values(*expected)),          mapping,        negative_mapping),
+        ('equal_to',                        reused(equal_to(records)),                  other_records[:-1] + records[-1:], other_records),
+        ('close_to',                        reused(close_to(samples, delta=1e-9)),      array('d', samples), other_samples),
+        ('conform_to',                      reused(conform_to([{'id': schemas.in_range(0), 'tags': [int]}])), records, invalid_records),
+        ('equal_to[diff]',                  reused(equal_to(records, diff=True)),       other_records[:-1] + records[-1:], other_records),
+    ]
+
+def expectation(infix, make_matcher, left_value):
+    def check():
+        try:
+            left_value |infix| make_matcher()
+        except (Should_NotSatisfied, ShouldNot_NotSatisfied):
+            pass
+    return check
+
+def timed(function, iterations):
+    best = None
+    for _ in range(ROUNDS):
+        start = utils.ticks_us()
+        for _ in range(iterations):
+            function()
+        elapsed = utils.ticks_diff(utils.ticks_us(), start)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000 // iterations
+
+def measure(results, case, label, iterations, repeat):
+    name, make_matcher, matching, not_matching = case
+    paths = (
+        ('should', should, 'pass', matching),
+        ('should', should, 'fail', not_matching),
+        ('should_not', should_not, 'pass', not_matching),
+        ('should_not', should_not, 'fail', matching),
+    )
+    for infix_name, infix, path, left_value in paths:
+        check = expectation(infix, make_matcher, value(left_value))
+        check()
+        key = '{}/{}/{}/{}'.format(name, infix_name, path, label)
+        results[key] = {
+            'ns_per_op': timed(check, iterations),
+            'bytes_per_op': utils.allocated_bytes(check, repeat),
+        }
+        print('{:<60} {:>10} ns/op {:>8} bytes/op'.format(
+            key, results[key]['ns_per_op'], results[key]['bytes_per_op']))
+
+def run(only=None, collections=False):
+    results = {}
+    for size, label in ((SMALL, 'small'), (LARGE, 'large')):
+        for case in cases(size):
+            if only is None or case[0].split('[')[0] in only:
+                measure(results, case, label, ITERATIONS[size], 10)
+    if collections:
+        for size, label, iterations in COLLECTION_SIZES:
+            for case in collection_cases(size):
+                if only is None or case[0].split('[')[0] in only:
+                    measure(results, case, label, iterations, 1)
+    return results
+
+def compare_compiled(only=None):
+    '''
+        Prints the calls per second of each matcher on its passing `should` path, written as an infix expression
+        (building the matcher in every call, like in a test) and as a compiled expectation.
+    '''
+    combined = ('all_of', lambda: all_of(be_greater_than(0), be_less_than(10), be_into([1, 2, 3])), 2, 5)
+    for name, make_matcher, matching, not_matching in cases(SMALL) + [combined]:
+        if only is not None and name not in only:
+            continue
+        left_value = value(matching)
+
+        def infix():
+            left_value |should| make_matcher()
+
+        check = should.compile(make_matcher())
+        infix_ns = timed(infix, ITERATIONS[SMALL])
+        compiled_ns = timed(lambda: check(matching), ITERATIONS[SMALL])
+        print('{:<40} infix {:>10} calls/s   compiled {:>10} calls/s   x{:.1f}'.format(
+            name, calls_per_second(infix_ns), calls_per_second(compiled_ns), infix_ns / max(compiled_ns, 1)))
+
+def compare_modes():
+    '''
+        Prints the time taken by a passing expectation, in its infix and compiled forms, in each mode.
+    '''
+    check = should.compile(be_greater_than(0))
+
+    def infix():
+        1 |should| be_greater_than(0)
+
+    def compiled():
+        check(1)
+
+    def empty():
+        pass
+
+    baseline = timed(empty, ITERATIONS[SMALL])
+    modes = ((OFF, 1), (SAMPLED, 100), (SAMPLED, 10), (ENFORCED, 1))
+    try:
+        for mode, every in modes:
+            set_mode(mode, every=every)
+            label = mode if mode != SAMPLED else '{} 1/{}'.format(mode, every)
+            print('{:<20} infix {:>8} ns/op   compiled {:>8} ns/op'.format(
+                label, timed(infix, ITERATIONS[SMALL]) - baseline, timed(compiled, ITERATIONS[SMALL]) - baseline))
+    finally:
+        reset_mode()
+
+def calls_per_second(ns_per_op):
+    return 1000000000 // max(ns_per_op, 1)
+
+def compare(results, baseline, threshold):
+    '''
+        Returns the keys of the results that are slower, or allocate more, than the baseline by more than the
+        threshold (a percentage).
+    '''
+    regressions = []
+    limit = 1 + threshold / 100
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        for metric in ('ns_per_op', 'bytes_per_op'):
+            before = baseline[key][metric]
+            after = results[key][metric]
+            if after > before * limit and after - before > 0:
+                regressions.append('{} {}: {} -> {}'.format(key, metric, before, after))
+    return regressions
+
+def main(args):
+    save_path = None
+    compare_path = None
+    threshold = DEFAULT_THRESHOLD
+    only = None
+    collections = False
+    compiled = False
+    modes = False
+
+    args = list(args)
+    while args:
+        option = args.pop(0)
+        if option == '--save':
+            save_path = args.pop(0)
+        elif option == '--compare':
+            compare_path = args.pop(0)
+        elif option == '--threshold':
+            threshold = float(args.pop(0))
+        elif option == '--only':
+            only = args.pop(0).split(',')
+        elif option == '--collections':
+            collections = True
+        elif option == '--compiled':
+            compiled = True
+        elif option == '--modes':
+            modes = True
+        else:
+            print(__doc__)
+            return 2
+
+    if compiled:
+        compare_compiled(only)
+        return 0
+    if modes:
+        compare_modes()
+        return 0
+
+    results = run(only, collections)
+    implementation = sys.implementation.name
+
+    if save_path is not None:
+        with open(save_path, 'w') as output:
+            json.dump({'implementation': implementation, 'results': results}, output)
+
+    if compare_path is not None:
+        with open(compare_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['implementation'] != implementation:
+            print("baseline was run on {}, not {}".format(baseline['implementation'], implementation))
+            return 2
+        regressions = compare(results, baseline['results'], threshold)
+        print("\n----------------------------------------------------------------------")
+        if regressions:
+            print("{} regressions beyond {}%:".format(len(regressions), threshold))
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("No regressions beyond {}%".format(threshold))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
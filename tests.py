@@ -1,8 +1,18 @@
 from ushould_dsl import *
-from ushould_dsl import utils
+from ushould_dsl import utils, runner
+import sys
 import time
 
 
+def _failure_of(expectation):
+    '''Returns the message of the failure raised by calling *expectation*, which must fail.'''
+    try:
+        expectation()
+    except (Should_NotSatisfied, ShouldNot_NotSatisfied, Expectations_NotSatisfied) as e:
+        return str(e)
+    raise AssertionError("the expectation didn't fail")
+
+
 class CustomTests:
     def set_up(self):
         pass
@@ -145,6 +155,33 @@ class CustomTests:
         value('Hello World')        |should     | be_like(r"Hello W.+")
         value('Hello\nWorld')       |should     | be_like(r"Hello.+")
         value('123 is a number')    |should_not | be_like(r'^[12]+ is a number')
+
+    def test_compiled_patterns_are_cached(self):
+        import re
+        pattern = re.compile(r"Hello W.+")
+        value('Hello World')        |should     | be_like(pattern)
+        value('Hola World')         |should_not | be_like(pattern)
+
+        utils.compile_pattern(r'cached \d+') |should| be(utils.compile_pattern(r'cached \d+'))
+
+        for i in range(utils.PATTERN_CACHE_SIZE * 2):
+            utils.compile_pattern(r'pattern %d' % i)
+        value(utils._pattern_cache) |should| have_at_most(utils.PATTERN_CACHE_SIZE).patterns
+
+        # The pattern used the most recently stays cached, whatever the order of the dictionary.
+        hot = utils.compile_pattern(r'hot \d+')
+        for i in range(utils.PATTERN_CACHE_SIZE * 2):
+            utils.compile_pattern(r'cold %d' % i)
+            utils.compile_pattern(r'hot \d+') |should| be(hot)
+
+        # Other caches evict their oldest entries, whatever the order of the dictionary.
+        cache, order = {}, []
+        for key in 'abcab':
+            utils.remember(cache, order, key, key.upper(), 2)
+        order |should| equal_to(['a', 'b'])
+        cache |should| equal_to({'a': 'A', 'b': 'B'})
+        utils.remember(cache, order, 'd', 'D', 2)
+        cache |should| equal_to({'b': 'B', 'd': 'D'})
     
     def test_be_empty(self):
         value([])                   |should     |   be_empty
@@ -403,6 +440,10 @@ class CustomTests:
         value((raise_foo, 'what a pro?')) |should_not| throw(Foo, message_regex=r'what a .+!')
         value((raise_foo, 'what da hell!')) |should_not| throw(Foo, message_regex=r'what a .+!')
 
+        import re
+        value((raise_foo, 'what a pro!')) |should| throw(Foo, message_regex=re.compile(r'what a .+!'))
+        value((raise_foo, 'what da hell!')) |should_not| throw(Foo, message_regex=re.compile(r'what a .+!'))
+
         # value((raise_foo, 'what a pro!')) |should| throw(Foo, message_regex="what a .+ yeah") # Should throw error
         
         # value((raise_foo, 'what a pro!')) |should_not| throw(Foo, message_regex=r'what a .+!') # Should throw error
@@ -636,24 +677,1064 @@ class CustomTests:
         # value(my_car) |should_not| have_at_most(4).wheels # Should throw error
 
 
-def run_tests():
-    tests = CustomTests()
-    tests.set_up()
+    def test_infix_is_thread_safe(self):
+        try:
+            import _thread
+        except ImportError:
+            return
+
+        n_threads = 8
+        n_iterations = 2000
+        lock = _thread.allocate_lock()
+        state = {'finished': 0, 'errors': []}
+
+        def worker(offset):
+            errors = []
+            for i in range(n_iterations):
+                expected = offset * n_iterations + i
+                try:
+                    value(expected) |should| equal_to(expected)
+                    value(expected) |should_not| equal_to(expected + 1)
+                except Exception as e:
+                    errors.append(e)
+            with lock:
+                state['errors'].extend(errors)
+                state['finished'] += 1
+
+        for offset in range(n_threads):
+            _thread.start_new_thread(worker, (offset,))
+
+        while state['finished'] < n_threads:
+            time.sleep(0.01)
+
+        value(state['errors']) |should| be_empty
+
+
+    def test_matchers_are_slotted(self):
+        import sys
+        if sys.implementation.name != 'cpython':
+            return
+
+        hasattr(value(1), '__dict__') |should| be(False)
+        equal_to(1)                 |should_not | respond_to('__dict__')
+        close_to(1, delta=0.1)      |should_not | respond_to('__dict__')
+        throw(ZeroDivisionError)    |should_not | respond_to('__dict__')
+        change(lambda: 0)           |should_not | respond_to('__dict__')
+        include_keys('a')           |should_not | respond_to('__dict__')
+
+        class be_the_double_of(matcher):
+            def should_match(self, left_value=None):
+                self._expected = self.right_value * 2
+                return left_value == self._expected
+
+        4 |should| be_the_double_of(2)
+        be_the_double_of(2) |should| respond_to('__dict__')
+
+
+    def test_values(self):
+        from array import array
+
+        values([1, 2, 3])               |should     | be_greater_than(0)
+        values([1, 2, 3])               |should_not | be_greater_than(3)
+        values((1, 2, 3))               |should     | be_less_than(4)
+        values(range(10))               |should     | be_greater_than_or_equal_to(0)
+        values(range(10, 0, -1))        |should     | be_less_than_or_equal_to(10)
+        values(range(0))                |should     | be_greater_than(5)
+        values(b'abc')                  |should     | be_greater_than(96)
+        values(bytearray(b'abc'))       |should     | be_into(b'abc')
+        values(memoryview(b'abc'))      |should_not | be_less_than(97)
+        values(array('i', [5, 6, 7]))   |should     | be_into([5, 6, 7])
+        values(array('d', [0.9, 1.1]))  |should     | close_to(1, delta=0.1)
+        values(array('d', [0.5, 1.5]))  |should_not | close_to(1, delta=0.1)
+        values(array('d', [1.0, 2.0]))  |should     | be_kind_of(float)
+        values(b'abc')                  |should_not | be_kind_of(str)
+        values(['a', 'b'])              |should     | be_instance_of(str)
+        values(['a', 'b'])              |should     | be_into('abc')
+        values([[1], [2]])              |should     | be_into([[1], [2], [3]])
+        values(x * 2 for x in range(5)) |should     | be_less_than(9)
+        values(['ab', 'abc'])           |should     | start_with('ab')
+
+        failures = []
+        try:
+            values([1, -1, 2, -3]) |should| be_greater_than(0)
+        except Should_NotSatisfied as e:
+            failures.append(str(e))
+        try:
+            values(array('d', [1.0, float('nan'), 3.0])) |should| be_greater_than(0)
+        except Should_NotSatisfied as e:
+            failures.append(str(e))
+        try:
+            values(x for x in ['abc', 'xyz', 'abd']) |should_not| start_with('ab')
+        except ShouldNot_NotSatisfied as e:
+            failures.append(str(e))
+
+        value(failures) |should| have(3).messages
+        value(failures[0]) |should| include("but 2 failed")
+        value(failures[0]) |should| include("[1] expected '-1' to be greater than '0'.")
+        value(failures[0]) |should| include("[3] expected '-3' to be greater than '0'.")
+        value(failures[1]) |should| include("[1] expected 'nan'")
+        value(failures[2]) |should| include("[0] 'abc' does start with 'ab'")
+        value(failures[2]) |should| include("[2] 'abd' does start with 'ab'")
+
+
+    def test_soft_expectations(self):
+        with soft_expectations() as soft:
+            value(1)        |should     | equal_to(1)
+            value('abc')    |should_not | start_with('x')
+        value(soft.failures) |should| be_empty
+
+        class be_counted(matcher):
+            formatted = []
+            def should_match(self, left_value=None):
+                return left_value == self.right_value
+            def message_for_failed_should(self, left):
+                be_counted.formatted.append(left)
+                raise Should_NotSatisfied("expected '{}' to be counted as '{}'.".format(left, self.right_value))
+
+        try:
+            with soft_expectations() as soft:
+                value(1)        |should     | be_counted(2)
+                value([1, 2])   |should     | include(3)
+                value('abc')    |should_not | start_with('ab')
+                values([1, -1]) |should     | be_greater_than(0)
+                value(4)        |should     | be_counted(4)
+        except Expectations_NotSatisfied as e:
+            error = e
+
+        value(error.failures)       |should| have(4).failures
+        value(be_counted.formatted) |should| be_empty
+
+        report = str(error)
+        value(be_counted.formatted) |should| equal_to([1])
+        value(report) |should| start_with("4 expectations were not satisfied:")
+        value(report) |should| include("1) expected '1' to be counted as '2'.")
+        value(report) |should| include("2) expected '[1, 2]' to include '3'.")
+        value(report) |should| include("3) 'abc' does start with 'ab'")
+        value(report) |should| include("[1] expected '-1' to be greater than '0'.")
+
+        def raise_inside_block():
+            with soft_expectations():
+                value(1) |should| equal_to(2)
+                raise KeyError('boom')
+        raise_inside_block |should| throw(KeyError)
+        (lambda: value(1) |should| equal_to(2)) |should| throw(Should_NotSatisfied)
+
+
+    def test_failure_messages_are_bounded(self):
+        message = _failure_of(lambda: value(5) |should| be_into([1, 2, 3]))
+        value(message) |should| equal_to("expected '5' to be into '[1, 2, 3]'.")
+
+        big = list(range(100000))
+        message = _failure_of(lambda: value(big) |should| include_all_of([1, -1, -2]))
+        value(message) |should| end_with("missing 2 of 3 elements: [-1, -2]")
+        value(message) |should| include("49, ...(99950 more)]")
+        value(len(message)) |should| be_less_than(utils.MAX_CHARS + 100)
+
+        value(-1) |should_not| be_into({'a': big})
+
+        utils.set_repr_budget(max_chars=40, max_items=3, max_depth=1)
+        try:
+            message = _failure_of(lambda: value([[1, 2], [3]]) |should| equal_to([[1, 2, 3, 4, 5]]))
+            value(message) |should| equal_to("expected '[[...], [...]]' to be '[[...]]'.")
+
+            message = _failure_of(lambda: value('x' * 100) |should| start_with('y'))
+            value(message) |should| equal_to("'{}...' does not start with 'y'".format('x' * 40))
+
+            message = _failure_of(lambda: value({}) |should| include_keys('a', 'b', 'c', 'd', 'e'))
+            value(message) |should| be_like(r"expected target to include keys '\w', '\w', '\w' and 2 other keys$")
+
+            message = _failure_of(lambda: values([-1, -2, -3, -4, -5]) |should| be_greater_than(0))
+            value(message) |should| end_with("[2] expected '-3' to be greater than '0'.\n  ...(2 more)")
+        finally:
+            utils.set_repr_budget(max_chars=1000, max_items=50, max_depth=4)
+
+    def test_runner(self):
+        module_name = __name__
+        test_ids = runner.discover([sys.modules[module_name]])
+
+        test_ids |should| include('{}.CustomTests.test_runner'.format(module_name))
+        test_ids |should_not| include('{}._RunnerExamples.test_failing'.format(module_name))
+        test_ids |should| equal_to(sorted(test_ids))
+
+        results = [runner.run_test('{}._RunnerExamples.{}'.format(module_name, name))
+                   for name in ('test_passing', 'test_failing', 'test_raising', 'test_missing')]
+        [result.status for result in results] |should| equal_to([runner.PASSED, runner.FAILED, runner.ERROR, runner.ERROR])
+        value(results[1].details) |should| include("expected '2' to be '3'.")
+        value(results[2].details) |should| include('ZeroDivisionError')
+        results[0].elapsed_us |should| be_greater_than_or_equal_to(0)
+
+    def test_collection_matchers_with_unhashable_elements(self):
+        value([[1], {'a': 1}, 3])   |should     | include_all_of([{'a': 1}, [1]])
+        value([[1], {'a': 1}, 3])   |should_not | include_all_of([{'a': 1}, [2]])
+        value([[1], {'a': 1}, 3])   |should     | include_in_any_order([3, [1]])
+        value([[1], {'a': 1}, 3])   |should     | include_any_of([[2], 3])
+        value([[1], {'a': 1}])      |should     | include_any_of([[1]])
+        value([[1], {'a': 1}])      |should_not | include_any_of([[2], 5])
+        value({1, 2, 3})            |should_not | include_any_of([[1]])
+        value({'a': [1], 'b': 2})   |should     | include_values([1], 2)
+        value({'a': [1], 'b': 2})   |should_not | include_values([3])
+
+        try:
+            value({'a': [1], 'b': 2}) |should_not| include_values([1], 3)
+            raise AssertionError("include_values should have failed")
+        except ShouldNot_NotSatisfied as exception:
+            str(exception) |should| equal_to("expected target to not include value '[1]'")
+
+    def test_collection_matchers_can_be_reused(self):
+        matcher = include_all_of(iter([1, 2]))
+        value([1, 2, 3]) |should| matcher
+        value((2, 1))    |should| matcher
+        value({1: 0, 2: 0}.keys()) |should| matcher
+        value(iter([3, 2, 1])) |should| matcher
+        value([1, 3])    |should_not| matcher
+
+        keys = include_keys('a', 'b')
+        value({'a': 1, 'b': 2}) |should| keys
+        value({'b': 2, 'a': 1, 'c': 3}) |should| keys
+        value({'c': 3}) |should_not| keys
+
+    def test_streaming_matchers(self):
+        consumed = []
+        def stream(size):
+            for index in range(size):
+                consumed.append(index)
+                yield index
+
+        value(stream(5))        |should     | have(5).items
+        value(stream(5))        |should_not | have(4).items
+        value(stream(2))        |should_not | have_at_least(3).items
+        value(stream(2))        |should     | have_at_most(2).items
+
+        del consumed[:]
+        value(stream(10 ** 9)) |should| have_at_least(3).items
+        consumed |should| equal_to([0, 1, 2])
+
+        del consumed[:]
+        value(stream(10 ** 9)) |should_not| have_at_most(3).items
+        consumed |should| have(4).items
+
+        del consumed[:]
+        value(stream(10 ** 9)) |should| include(5)
+        value(stream(10 ** 9)) |should| include_all_of([2, 4])
+        value(stream(10 ** 9)) |should| include_any_of([-1, 1])
+        consumed |should| equal_to([0, 1, 2, 3, 4, 5, 0, 1, 2, 3, 4, 0, 1])
+
+        try:
+            value(stream(10 ** 9)) |should| have(3).items
+            raise AssertionError("have should have failed")
+        except Should_NotSatisfied as exception:
+            str(exception) |should| equal_to("expected 3 'items', got at least 4")
+
+        try:
+            value(stream(3)) |should| include_all_of([2, 7])
+            raise AssertionError("include_all_of should have failed")
+        except Should_NotSatisfied as exception:
+            value(str(exception)) |should| end_with("missing 1 of 2 elements: [7]")
+
+    def test_combinators(self):
+        class be_even(simple_matcher):
+            def matcher(self):
+                return (lambda x, y: x % 2 == 0, "%s is %seven%s")
+
+        between = all_of(be_greater_than(0), all_of(be_less_than(10), be_even('')))
+        len(between.right_value) |should| equal_to(3)
+
+        4   |should     | between
+        5   |should_not | between
+        4   |should     | any_of(be_less_than(0), be_even(''))
+        -1  |should_not | any_of(be_greater_than(0), be_even(''))
+        4   |should     | none_of(be_less_than(0), equal_to(3))
+        4   |should_not | none_of(equal_to(3), equal_to(4))
+        value('Hello') |should| all_of(be_like('H.+'), have(5).letters)
+        values([2, 4, 8]) |should| between
+
+        len(none_of(equal_to(1), any_of(equal_to(2), equal_to(3))).right_value) |should| equal_to(3)
+
+        evaluated = []
+        class record(matcher):
+            def should_match(self, left_value=None):
+                evaluated.append(self.right_value)
+                return self.right_value
+        1 |should| any_of(record(False), record(True), record(True))
+        1 |should_not| all_of(record(True), record(False), record(True))
+        evaluated |should| equal_to([False, True, True, False])
+
+        try:
+            5 |should| between
+            raise AssertionError("all_of should have failed")
+        except Should_NotSatisfied as exception:
+            str(exception) |should| equal_to("expected '5' to satisfy all of 3 matchers, but 1 failed:\n  - 5 is not even")
+
+        try:
+            4 |should_not| any_of(be_less_than(0), equal_to(4))
+            raise AssertionError("any_of should have failed")
+        except ShouldNot_NotSatisfied as exception:
+            str(exception) |should| equal_to(
+                "expected '4' not to satisfy any of 2 matchers, but 1 did:\n  - expected '4' not to be '4'.")
+
+    def test_compiled_expectations(self):
+        positive = should.compile(be_greater_than(0))
+        for left in range(1, 100):
+            positive(left)
+
+        try:
+            positive(-1)
+            raise AssertionError("compiled expectation should have failed")
+        except Should_NotSatisfied as exception:
+            str(exception) |should| equal_to("expected '-1' to be greater than '0'.")
+
+        not_blank = should_not.compile(be_like(r'\s*$'))
+        not_blank('sensor')
+        try:
+            not_blank('  ')
+            raise AssertionError("compiled expectation should have failed")
+        except ShouldNot_NotSatisfied:
+            pass
 
-    verbosity = False
+        in_range = should.compile(all_of(be_greater_than_or_equal_to(0), be_less_than(10)))
+        in_range(0)
+        in_range(9)
+        try:
+            with soft_expectations():
+                in_range(10)
+                in_range(-1)
+                in_range(5)
+            raise AssertionError("soft expectations should have failed")
+        except Expectations_NotSatisfied as exception:
+            len(exception.failures) |should| equal_to(2)
+
+    def test_modes(self):
+        evaluated = []
+        class record(matcher):
+            def should_match(self, left_value=None):
+                evaluated.append(left_value)
+                return False
+            def message_for_failed_should(self, left):
+                raise Should_NotSatisfied("recorded")
+
+        def failures(infix, count):
+            failed = 0
+            for left in range(count):
+                try:
+                    left |infix| record(None)
+                except Should_NotSatisfied:
+                    failed += 1
+            return failed
+
+        try:
+            set_mode(OFF)
+            failures(should, 10) |should| equal_to(0)
+            values([1, 2]) |should| record(None)
+            should.compile(record(None))(1)
+            evaluated |should| equal_to([])
+
+            set_mode(SAMPLED, every=4)
+            failures(should, 12) |should| equal_to(3)
+            set_mode(SAMPLED, rate=0.5)
+            get_mode() |should| equal_to((SAMPLED, 2))
+
+            module_should, module_should_not = infixes_for('tests.modes')
+            set_mode(OFF)
+            failures(module_should, 3) |should| equal_to(0)
+            set_mode(ENFORCED, scope='tests.modes')
+            set_mode(OFF)
+            failures(module_should, 3) |should| equal_to(3)
+            failures(should, 3) |should| equal_to(0)
+
+            reset_mode('tests.modes')
+            failures(module_should, 3) |should| equal_to(0)
+        finally:
+            reset_mode()
+            reset_mode('tests.modes')
+
+        failures(should, 3) |should| equal_to(3)
+
+        try:
+            set_mode('sometimes')
+            raise AssertionError("set_mode should have failed")
+        except ValueError:
+            pass
 
-    method_list = [attribute for attribute in dir(CustomTests) if utils.isfunction(getattr(CustomTests, attribute)) and not attribute.startswith('__') and attribute != "set_up"]
-    
-    n_tests = 0
-    time_before = time.time()
-    for m in method_list:
-        getattr(tests, m)()
-        if verbosity:
-            print("{} () ... ok".format(m))
-        else:
-            print(".", end="")
-        n_tests += 1
-    time_after = time.time()
-    
-    print("\n----------------------------------------------------------------------")
-    print("Ran {} tests in {}s".format(n_tests, round(time_after - time_before,3)))
+    def test_instrumentation(self):
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+
+        regular_infix_match = type(should).infix_match
+        regular_infix_match_async = type(should_async).infix_match_async
+        events = []
+        enable_instrumentation(lambda *event: events.append(event))
+        try:
+            1 |should| be_greater_than(0)
+            2 |should| be_greater_than(0)
+            check = should_not.compile(equal_to(1))
+            check(2)
+            try:
+                check(1)
+            except ShouldNot_NotSatisfied:
+                pass
+
+            # the expectations below are counted too
+            snapshot = instrumentation_snapshot()
+            recorded = events[:]
+            counters = snapshot['be_greater_than']['should']
+            counters['evaluations'] |should| equal_to(2)
+            counters['failures'] |should| equal_to(0)
+            counters['max_us'] |should| be_less_than_or_equal_to(counters['total_us'])
+            snapshot['equal_to'] |should| include_keys('should_not')
+            snapshot['equal_to']['should_not']['failures'] |should| equal_to(1)
+            [event[:2] + event[3:] for event in recorded] |should| equal_to([
+                ('be_greater_than', 'should', True),
+                ('be_greater_than', 'should', True),
+                ('equal_to', 'should_not', True),
+                ('equal_to', 'should_not', False),
+            ])
+
+            reset_instrumentation()
+            instrumentation_snapshot() |should| equal_to({})
+
+            async def evaluate_async():
+                await (1 |should_async| be_greater_than(0))
+                await should_not_async.compile(equal_to(1))(2)
+            asyncio.run(evaluate_async())
+            snapshot = instrumentation_snapshot()
+            snapshot['be_greater_than']['should_async']['evaluations'] |should| equal_to(1)
+            snapshot['equal_to']['should_not_async']['failures'] |should| equal_to(0)
+        finally:
+            disable_instrumentation()
+
+        type(should).infix_match |should| be(regular_infix_match)
+        type(should_async).infix_match_async |should| be(regular_infix_match_async)
+        1 |should| be_greater_than(0)
+        instrumentation_snapshot() |should| equal_to({})
+
+    def test_equal_to_with_diff(self):
+        expected = {'name': 'sensor', 'readings': [1, 2, {'unit': 'C'}], 'tags': {'a', 'b'}}
+        value({'name': 'sensor', 'readings': [1, 2, {'unit': 'C'}], 'tags': {'b', 'a'}}) |should| equal_to(expected, diff=True)
+        value({'name': 'sensor'}) |should_not| equal_to(expected, diff=True)
+        value([1, (2, 3)]) |should_not| equal_to([1, [2, 3]], diff=True)
+
+        cyclic, other_cyclic = [1], [1]
+        cyclic.append(cyclic)
+        other_cyclic.append(other_cyclic)
+        cyclic |should| equal_to(other_cyclic, diff=True)
+
+        deep = nested = []
+        other_deep = other_nested = []
+        for _ in range(10000):
+            nested.append([])
+            other_nested.append([])
+            nested, other_nested = nested[0], other_nested[0]
+        deep |should| equal_to(other_deep, diff=True)
+        other_nested.append(1)
+        deep |should_not| equal_to(other_deep, diff=True)
+
+        try:
+            value({'name': 'sensr', 'readings': [1, 3], 'tags': {'a'}, 'extra': 0}) |should| equal_to(expected, diff=True)
+            raise AssertionError("equal_to should have failed")
+        except Should_NotSatisfied as exception:
+            report = str(exception).split(', 5 differences:\n')[1].split('\n')
+            report |should| include_in_any_order([
+                "  ['name']: expected 'sensor', got 'sensr' (first difference at index 4)",
+                "  ['readings']: expected 3 elements, got 2",
+                "  ['readings'][1]: expected 2, got 3",
+                "  ['tags']: missing 'b'",
+                "  ['extra']: unexpected 0",
+            ])
+
+    def test_close_to_with_tolerances_and_sequences(self):
+        from array import array
+        value(100)  |should     | close_to(95, rel_tol=0.05)
+        value(100)  |should_not | close_to(90, rel_tol=0.05)
+        value(100)  |should     | close_to(90, rel_tol=0.05, abs_tol=10)
+        value(0)    |should_not | close_to(1e-12, rel_tol=1e-9)
+        value(0.3)  |should     | close_to(0.1 + 0.2, delta=0)
+        value(10 ** 20) |should_not| close_to(10 ** 20 + 1000, delta=0)
+        value(10 ** 20) |should| close_to(10 ** 20 + 1000, delta=1000)
+        value(float('nan')) |should_not| close_to(1, delta=10)
+        value(float('inf')) |should| close_to(float('inf'), delta=0)
+
+        close_to |should| throw(TypeError)
+        (lambda: close_to(1, delta=1, abs_tol=1)) |should| throw(TypeError)
+        (lambda: close_to(1, delta=-1)) |should| throw(ValueError, message="tolerances can't be negative")
+
+        samples = array('d', [i / 10 for i in range(100)])
+        expected = [i / 10 + 1e-12 for i in range(100)]
+        samples             |should| close_to(expected, delta=1e-9)
+        samples             |should| close_to(expected, rel_tol=1e-9, abs_tol=1e-11)
+        bytes([1, 2, 3])    |should| close_to(2, delta=1)
+        [1.0, 1.25]         |should_not| close_to(1, delta=0.1)
+
+        expected[50] += 0.5
+        expected[20] += 0.25
+        message = _failure_of(lambda: samples |should| close_to(expected, delta=0.1))
+        message |should| end_with("but 2 weren't; the worst is at index 50, '5.0' instead of '5.500000000001' (off by '0.5000000000010001')")
+        message = _failure_of(lambda: [1, 2] |should| close_to([1, 2, 3], delta=1))
+        message |should| equal_to("expected 3 numbers, as many as in '[1, 2, 3]', got 2")
+
+        # Numbers of any type, not only int and float.
+        from fractions import Fraction
+        from decimal import Decimal
+        Fraction(1, 3)      |should| close_to(0.333, delta=0.001)
+        Decimal('2.5')      |should| close_to(Decimal('2.4'), delta=Decimal('0.2'))
+        Fraction(1, 2)      |should_not| close_to(0.4, delta=0.01)
+        [Fraction(1, 2)]    |should| close_to(Fraction(1, 2), delta=0)
+
+        # A shared matcher reports its own evaluation.
+        far = close_to([1, 2, 3], delta=0.1)
+        first = far.should_match([1, 2, 4])
+        far.should_match([1, 2])
+        str(utils.failure_message(far.message_for_failed_should, [1, 2, 4], first)) |should| include(
+            "but 1 weren't; the worst is at index 2")
+
+    def test_have_same_attribute_values_as_with_slots_and_fields(self):
+        class Point(object):
+            __slots__ = ('x', 'y')
+            def __init__(self, x, y):
+                self.x = x
+                self.y = y
+
+        class Point3D(Point):
+            __slots__ = ('z',)
+            def __init__(self, x, y, z):
+                Point.__init__(self, x, y)
+                self.z = z
+
+        class Reading(object):
+            _fields = ('value',)
+            def __init__(self, value):
+                self.value = value
+
+        Point(1, 2)         |should     | have_same_attribute_values_as(Point(1, 2))
+        Point(1, 2)         |should_not | have_same_attribute_values_as(Point(1, 3))
+        Point3D(1, 2, 3)    |should     | have_same_attribute_values_as(Point3D(1, 2, 3))
+        Point3D(1, 2, 3)    |should_not | have_same_attribute_values_as(Point3D(1, 2, 4))
+        Point3D(1, 2, 3)    |should_not | have_same_attribute_values_as(Point(1, 2))
+        Reading(1)          |should_not | have_same_attribute_values_as(Reading(2))
+
+        left = Reading(1)
+        left.unit = 'C'
+        left |should_not| have_same_attribute_values_as(Reading(1))
+
+        message = _failure_of(lambda: Point3D(1, 5, 6) |should| have_same_attribute_values_as(Point3D(1, 2, 3)))
+        message |should| end_with(", but attribute y: expected 2, got 5")
+
+        message = _failure_of(lambda: left |should| have_same_attribute_values_as(Reading(2), full_report=True))
+        message |should| end_with(", but 2 attributes differ:\n  value: expected 2, got 1\n  unit: unexpected 'C'")
+
+    def test_async_expectations(self):
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError('invalid value')
+
+        async def succeed():
+            await asyncio.sleep(0)
+
+        async def double(number):
+            await asyncio.sleep(0.001)
+            return number * 2
+
+        async def check(number):
+            counter = [0]
+
+            async def increment():
+                await asyncio.sleep(0)
+                counter[0] += 1
+
+            async def count():
+                return counter[0]
+
+            await (double(number)       |should_async       | equal_to(number * 2))
+            await (fail                 |should_async       | throw(ValueError, message='invalid value'))
+            await (fail()               |should_async       | throw(ValueError))
+            await (succeed              |should_not_async   | throw(ValueError))
+            await (ValueError           |should_async       | be_thrown_by(fail))
+            await (increment            |should_async       | change(count).by(1))
+            await (succeed              |should_async       | complete_within(1000))
+            await (asyncio.sleep(1)     |should_not_async   | complete_within(10))
+
+        async def main():
+            started = utils.ticks_us()
+            await asyncio.gather(*[check(number) for number in range(100)])
+            # The 100 checks run concurrently, so the 10 ms timeouts add up to about 10 ms, not one second.
+            utils.ticks_diff(utils.ticks_us(), started) |should| be_less_than(500000)
+
+            checks = should_async.compile(be_greater_than(0))
+            await asyncio.gather(*[checks(number) for number in range(1, 100)])
+
+            # Gathered checks of a shared matcher report their own timing, even in a report built afterwards.
+            in_time = should_async.compile(complete_within(50))
+            async def check_softly():
+                with soft_expectations():
+                    await asyncio.gather(in_time(asyncio.sleep(1)), in_time(succeed))
+            try:
+                await check_softly()
+                message = "didn't fail"
+            except (Should_NotSatisfied, Expectations_NotSatisfied) as e:
+                # Tasks only report to the blocks opened in other tasks on CPython.
+                message = str(e)
+            message |should| include("to complete within 50 ms, but it was cancelled after ")
+
+            try:
+                await (asyncio.sleep(1) |should_async| complete_within(10))
+                message = "didn't fail"
+            except Should_NotSatisfied as e:
+                message = str(e)
+            message |should| include('to complete within 10 ms, but it was cancelled after')
+
+            set_mode(OFF)
+            try:
+                await (1 |should_async| equal_to(2))
+            finally:
+                reset_mode()
+
+        asyncio.run(main())
+
+        # Coroutine functions can't be checked synchronously.
+        (lambda: fail |should| throw(ValueError)) |should| throw(TypeError)
+        (lambda: succeed |should| change(lambda: 0)) |should| throw(TypeError)
+        # ... but generators aren't taken for coroutines.
+        (lambda: (number for number in range(3))) |should_not| throw(TypeError)
+
+    def test_soft_expectations_in_tasks(self):
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+
+        async def failing():
+            try:
+                with soft_expectations():
+                    1 |should| equal_to(2)
+                    await asyncio.sleep(0.005)
+                    # the block of passing() is open by now
+                    3 |should| equal_to(4)
+            except Expectations_NotSatisfied as e:
+                return e.failures
+
+        async def passing():
+            with soft_expectations() as soft:
+                await asyncio.sleep(0.01)
+                5 |should| equal_to(5)
+            return soft.failures
+
+        async def main():
+            return await asyncio.gather(failing(), passing())
+
+        failed, passed = asyncio.run(main())
+        value(failed) |should| have(2).items
+        value(passed) |should| be_empty
+
+    def test_eventually(self):
+        try:
+            import asyncio
+        except ImportError:
+            import uasyncio as asyncio
+
+        readings = iter([1, 2, 3, 4, 5, 6, 7, 8])
+        read = lambda: next(readings)
+        read |should| eventually(be_greater_than(3), interval_ms=1)
+        read() |should| equal_to(5)
+
+        queue = []
+        (len, queue) |should_not| eventually(be_greater_than(0), timeout_ms=20, interval_ms=5, backoff=1)
+
+        # should_not fails as soon as the state is reached, even partway through the timeout.
+        readings = iter([0, 0, 1, 0, 0, 0])
+        started = utils.ticks_ms()
+        message = _failure_of(lambda: (lambda: next(readings)) |should_not| eventually(equal_to(1), timeout_ms=1000,
+            interval_ms=5, backoff=1))
+        utils.ticks_diff(utils.ticks_ms(), started) |should| be_less_than(500)
+        message |should| include("never to satisfy the matcher within 1000 ms, but attempt 3, after ")
+        message |should| end_with("got '1': expected '1' not to be '1'.")
+
+        started = utils.ticks_ms()
+        message = _failure_of(lambda: (lambda: 'idle') |should| eventually(equal_to('ready'), timeout_ms=50,
+            interval_ms=1, backoff=2))
+        utils.ticks_diff(utils.ticks_ms(), started) |should| be_greater_than_or_equal_to(50)
+        # Sleeps of 1, 2, 4, 8, 16 ms and what is left until the deadline, so 7 attempts unless sleeps overrun.
+        message |should| include("but the last of ")
+        message |should| end_with("got 'idle': expected 'idle' to be 'ready'.")
+
+        (lambda: eventually(equal_to(1), backoff=0.5)) |should| throw(ValueError)
+
+        state = {'ready': False}
+
+        async def get_ready():
+            await asyncio.sleep(0.01)
+            state['ready'] = True
+
+        async def is_ready():
+            return state['ready']
+
+        async def main():
+            task = asyncio.create_task(get_ready())
+            await (is_ready |should_async| eventually(be(True), timeout_ms=1000, interval_ms=2))
+            await task
+
+        asyncio.run(main())
+
+    def test_performance_budgets(self):
+        def build(size):
+            return list(range(size))
+
+        (build, 10)             |should     | run_faster_than(ms=100)
+        (time.sleep, 0.005)     |should_not | run_faster_than(ms=1, repeat=3, warmup=0)
+        (lambda: None)          |should     | run_faster_than(us=50000, statistic=P95)
+        (build, 10)             |should     | allocate_less_than(bytes=4000)
+        (build, 10000)          |should_not | allocate_less_than(bytes=4000, repeat=3)
+
+        message = _failure_of(lambda: (build, 10000) |should| allocate_less_than(bytes=4000, repeat=4))
+        message |should| include("to allocate less than 4000 bytes (median), got ")
+        message |should| include(", over 4 runs)")
+
+        (lambda: run_faster_than(ms=1, us=1000)) |should| throw(TypeError)
+        (lambda: run_faster_than(ms=1, statistic='mean')) |should| throw(ValueError)
+        (lambda: 1 |should| run_faster_than(ms=1)) |should| throw(TypeError)
+        [build, 10] |should| run_faster_than(ms=100)
+
+        # A shared matcher reports the runs of the failed evaluation, even when the report is built afterwards.
+        check = should.compile(run_faster_than(ms=2, repeat=1, warmup=0))
+        def fail_softly():
+            with soft_expectations():
+                check((time.sleep, 0.005))
+                check(lambda: None)
+        message = _failure_of(fail_softly)
+        message |should| include("to run faster than 2.0 ms (median), got ")
+        message |should_not| include("got 0.")
+
+    def test_have_resolves_collections_once(self):
+        class Team(object):
+            def __init__(self, size):
+                self.calls = 0
+                self._players = list(range(size))
+            def players(self):
+                self.calls += 1
+                return self._players
+
+        class Game(object):
+            def __init__(self, size):
+                self.calls = 0
+                self.team = Team(size)
+            def field(self):
+                self.calls += 1
+                return self.team
+
+        for size in (2, 3, 4):
+            team = Team(size)
+            team |should| have(size).players
+            team.calls |should| equal_to(1)
+
+            game = Game(size)
+            game |should| have(size).players_on_field
+            game |should_not| have_at_least(size + 1).players_on_field
+            game.calls |should| equal_to(2)
+            game.team.calls |should| equal_to(2)
+
+        team = Team(1)
+        team._players = None
+        (lambda: team |should| have(1).players) |should| throw(TypeError, message="target's 'players()' does not return an iterable")
+        (lambda: team |should| have(1).goals) |should| throw(TypeError, message="target does not have a 'goals' collection, nor it is an iterable")
+        (lambda: Game(1) |should| have(1).goals_on_field) |should| throw(TypeError, message="target does not have a 'goals_on_field' collection, nor it is an iterable")
+
+    def test_change_snapshot_strategies(self):
+        from array import array
+
+        class Buffer(object):
+            def __init__(self, size):
+                self.items = list(range(size))
+                self.revision = 0
+            def append(self, item):
+                self.items.append(item)
+                self.revision += 1
+            def touch(self, index):
+                self.items[index] += 1
+
+        buffer = Buffer(100000)
+        items = lambda: buffer.items
+
+        (buffer.append, 1)  |should     | change(items, snapshot=LENGTH).by(1)
+        (buffer.append, 1)  |should     | change(items, snapshot=LENGTH).from_(100001).to(100002)
+        (buffer.touch, 5)   |should_not | change(items, snapshot=LENGTH)
+        (buffer.touch, 5)   |should     | change(items, snapshot=FINGERPRINT)
+        (buffer.touch, 5)   |should_not | change(lambda: buffer, snapshot=version_attribute('revision'))
+        (buffer.append, 1)  |should     | change(lambda: buffer, snapshot=version_attribute('revision')).by(1)
+        (lambda: None)      |should_not | change(items, snapshot=FINGERPRINT)
+
+        nested = {'readings': [[1, 2], [3]]}
+        (lambda: nested['readings'][1].append(4)) |should| change(lambda: nested, snapshot=DEEP_COPY)
+        (lambda: nested['readings'][1].append(4)) |should_not| change(lambda: nested, snapshot=SHALLOW_COPY)
+        (lambda: nested['readings'][1].append(4)) |should| change(lambda: nested, snapshot=FINGERPRINT)
+
+        samples = array('i', range(1000))
+        def sample():
+            samples[500] = -1
+        sample |should| change(lambda: samples, snapshot=FINGERPRINT)
+
+        # Swapped elements change the fingerprint, whatever their distance.
+        ordered = list(range(40))
+        for distance in (1, 13, 26):
+            swapped = ordered[:]
+            swapped[3], swapped[3 + distance] = swapped[3 + distance], swapped[3]
+            utils.fingerprint(swapped) |should_not| equal_to(utils.fingerprint(ordered))
+
+        # Every bit of the elements counts, and integers whose hashes collide differ.
+        for before, after in (([-1], [-2]), ([0], [2 ** 25]), ([1.5], [1.5 + 2 ** 25])):
+            utils.fingerprint(after) |should_not| equal_to(utils.fingerprint(before))
+            changing = before[:]
+            (lambda: changing.__setitem__(0, after[0])) |should| change(lambda: changing, snapshot=FINGERPRINT)
+
+        looped = [1, 2]
+        looped.append(looped)
+        (looped.append, 3) |should| change(lambda: looped, snapshot=FINGERPRINT)
+        (lambda: None) |should_not| change(lambda: looped, snapshot=FINGERPRINT)
+
+        # Objects hashed by identity are deep-copied, so that changes of their attributes are seen.
+        class Probe:
+            def __init__(self):
+                self.level = 0
+        probe = Probe()
+        utils.fingerprint([probe]) |should| be(None)
+        (lambda: setattr(probe, 'level', 1)) |should| change(lambda: [probe], snapshot=FINGERPRINT)
+
+        # Neither the length nor the fingerprint copy the buffer.
+        copied = utils.allocated_bytes(lambda: (buffer.touch, 5) |should| change(items))
+        fingerprinted = utils.allocated_bytes(lambda: (buffer.touch, 5) |should| change(items, snapshot=FINGERPRINT))
+        measured = utils.allocated_bytes(lambda: (buffer.append, 1) |should| change(items, snapshot=LENGTH))
+        copied |should| be_greater_than(400000)
+        fingerprinted |should| be_less_than(10000)
+        measured |should| be_less_than(10000)
+
+        (lambda: change(items, snapshot=FINGERPRINT).by(1)) |should| throw(TypeError,
+            message="change can't check by() with the fingerprint snapshot, which only tells if the result changed")
+        message = _failure_of(lambda: (buffer.touch, 5) |should| change(items, snapshot=LENGTH))
+        message |should| equal_to("result's length should have changed, but is still {}".format(len(buffer.items)))
+
+    def test_match_snapshot(self):
+        import os
+        from ushould_dsl import snapshots
+
+        path = 'test_snapshots.bin'
+        try:
+            with snapshots.SnapshotStore(path) as store:
+                for number in range(300):
+                    {'parser': number, 'tokens': ['a'] * (number % 7)} |should| match_snapshot('parser/{}'.format(number), store=store)
+                (1, 'two', None) |should| match_snapshot('tuple', store=store)
+
+            size = os.stat(path)[6]
+            with snapshots.SnapshotStore(path) as store:
+                len(store.names()) |should| equal_to(301)
+                {'parser': 42, 'tokens': []} |should| match_snapshot('parser/42', store=store)
+                [1, 'two', None] |should| match_snapshot('tuple', store=store)
+                {'parser': 42, 'tokens': ['b']} |should_not| match_snapshot('parser/42', store=store)
+                message = _failure_of(lambda: 1 |should_not| match_snapshot('missing', store=store))
+                message |should| end_with("not to match the snapshot 'missing', but there is no such snapshot")
+                message = _failure_of(lambda: b'\x00' |should| match_snapshot('bytes', store=store))
+                message |should| include("to match the snapshot 'bytes', but it can't be stored as JSON: ")
+                'bytes' |should_not| be_into(store.names())
+                message = _failure_of(lambda: {'parser': 43, 'tokens': ['a', 'a']} |should| match_snapshot('parser/42',
+                    store=store))
+                message |should| end_with("to match the snapshot 'parser/42', 2 differences:\n"
+                    "  ['parser']: expected 42, got 43\n"
+                    "  ['tokens']: expected 0 elements, got 2")
+                os.stat(path)[6] |should| equal_to(size)
+
+            with snapshots.SnapshotStore(path, update=True) as store:
+                {'parser': 43} |should| match_snapshot('parser/42', store=store)
+                store.get('parser/42') |should| equal_to({'parser': 43})
+                store.compact()
+                os.stat(path)[6] |should| be_less_than(size)
+                store.get('parser/42') |should| equal_to({'parser': 43})
+                store.get('parser/299') |should| equal_to({'parser': 299, 'tokens': ['a'] * 5})
+
+            # Snapshots stored without closing the store are found again, and an interrupted write loses nothing else.
+            store = snapshots.SnapshotStore(path)
+            [1, 2] |should| match_snapshot('unindexed', store=store)
+            store._file.close()
+            with open(path, 'ab') as file:
+                file.write(b'\x01\xff\x00')
+            size = os.stat(path)[6]
+            with snapshots.SnapshotStore(path) as store:
+                store.get('unindexed') |should| equal_to([1, 2])
+                store.get('parser/299') |should| equal_to({'parser': 299, 'tokens': ['a'] * 5})
+                # Reading leaves the file as it is.
+                os.stat(path)[6] |should| equal_to(size)
+                'interrupted' |should| match_snapshot('interrupted', store=store)
+            with snapshots.SnapshotStore(path) as store:
+                len(store.names()) |should| equal_to(303)
+                store.get('interrupted') |should| equal_to('interrupted')
+            (path + '.tmp') |should_not| be_into(os.listdir('.'))
+
+            # A store that can't be opened isn't taken for a missing one.
+            (lambda: snapshots.SnapshotStore('.').names()) |should| throw(OSError)
+
+            with open(path, 'wb') as file:
+                file.write(b'not a store')
+            (lambda: snapshots.SnapshotStore(path).names()) |should| throw(ValueError)
+        finally:
+            os.remove(path)
+
+    def test_conform_to(self):
+        from ushould_dsl import schemas
+        from ushould_dsl.schemas import Schema, optional, nullable, record, list_of, in_range, matching, one_of
+
+        schema = Schema({
+            'id': int,
+            'name': matching('[a-z_]+$'),
+            optional('score'): in_range(0, 100),
+            'state': one_of('on', 'off'),
+            'parent': nullable(int),
+            'readings': [{'at': int, 'value': (int, float)}],
+            'tags': list_of(str, max_length=2),
+            'meta': record({'version': int}, extra=False),
+        })
+        payload = {'id': 1, 'name': 'probe', 'state': 'on', 'parent': None, 'readings': [{'at': 0, 'value': 1.5}],
+            'tags': ['a'], 'meta': {'version': 2}}
+        payload |should| conform_to(schema)
+        [payload] * 1000 |should| conform_to([schema.spec])
+        {'id': 1} |should_not| conform_to(schema)
+
+        invalid = {'id': True, 'name': 'Probe', 'score': 101, 'state': 'off', 'parent': 'probe',
+            'readings': [{'at': '0', 'value': 1}, {'value': None}, 3], 'tags': ['a', 1, 'c'], 'meta': {'version': 2, 'v': 1}}
+        message = _failure_of(lambda: invalid |should| conform_to(schema))
+        message |should| end_with("to conform to the schema, 11 violations:\n"
+            "  ['id']: expected int, got True\n"
+            "  ['name']: expected a string like '[a-z_]+$', got 'Probe'\n"
+            "  ['score']: expected int or float between 0 and 100, got 101\n"
+            "  ['parent']: expected int, got 'probe'\n"
+            "  ['readings'][0]['at']: expected int, got '0'\n"
+            "  ['readings'][1]['at']: missing\n"
+            "  ['readings'][1]['value']: expected int or float, got None\n"
+            "  ['readings'][2]: expected a dictionary, got 3\n"
+            "  ['tags']: expected at most 2 elements, got 3\n"
+            "  ['tags'][1]: expected str, got 1\n"
+            "  ['meta']['v']: unexpected key")
+        len(schema.violations(invalid, limit=3)) |should| equal_to(3)
+        invalid |should_not| conform_to(schema)
+        (lambda: conform_to({'id': 'int'})) |should| throw(TypeError)
+
+        closed = Schema(record({'a': int, optional('b'): int}, extra=False))
+        [schemas.describe(violation) for violation in closed.violations({'a': 1, 'c': 2})] |should| equal_to(
+            ["['c']: unexpected key"])
+        {'a': 1, 'c': 2} |should_not| conform_to(closed)
+        {'a': 1, 'b': 2} |should| conform_to(closed)
+
+        # Deep payloads are walked without recursion.
+        deep_schema, deep_payload = int, 0
+        for _ in range(200):
+            deep_schema, deep_payload = [{'child': deep_schema}], [{'child': deep_payload}]
+        deep_payload |should| conform_to(deep_schema)
+
+    def test_static_failures(self):
+        checks = [
+            (should.compile(equal_to(1)), 2),                   (should_not.compile(equal_to(1)), 1),
+            (should.compile(be(None)), 0),                      (should_not.compile(be(None)), None),
+            (should.compile(be_greater_than(0)), -1),           (should_not.compile(be_greater_than(0)), 1),
+            (should.compile(be_greater_than_or_equal_to(0)), -1), (should_not.compile(be_greater_than_or_equal_to(0)), 0),
+            (should.compile(be_less_than(100)), 120),           (should_not.compile(be_less_than(100)), 99),
+            (should.compile(be_less_than_or_equal_to(100)), 120), (should_not.compile(be_less_than_or_equal_to(100)), 100),
+            (should.compile(be_into((1, 2, 3))), 4),            (should_not.compile(be_into((1, 2, 3))), 2),
+            (should.compile(start_with('ab')), 'ba'),           (should_not.compile(start_with('ab')), 'abc'),
+            (should.compile(end_with('ab')), 'ba'),             (should_not.compile(end_with('ab')), 'cab'),
+        ]
+        enable_static_failures()
+        try:
+            failures = []
+            for check, left_value in checks:
+                try:
+                    check(left_value)
+                except (Should_NotSatisfied, ShouldNot_NotSatisfied) as e:
+                    failures.append((e, str(e)))
+            len(failures) |should| equal_to(len(checks))
+            failures[0][0] |should| be(failures[2][0])
+            failures[1][0] |should| be(failures[3][0])
+            failures[8][1] |should| equal_to("expected '120' to be less than '100'.")
+            failures[-1][1] |should| equal_to("'cab' does end with 'ab'")
+
+            def fail_softly():
+                with soft_expectations():
+                    120 |should| be_less_than(100)
+                    2 |should| be_into([0, 1])
+            message = _failure_of(fail_softly)
+            message |should| equal_to("2 expectations were not satisfied:\n"
+                "  1) expected '120' to be less than '100'.\n"
+                "  2) expected '2' to be into '[0, 1]'.")
+
+            # On MicroPython, neither the passing nor the failing checks allocate, even with the heap locked, like
+            # in a hard interrupt handler. CPython allocates frames and tracebacks whatever the exceptions, so this is
+            # only checked on MicroPython.
+            import gc
+            if not hasattr(gc, 'mem_alloc'):
+                return
+            import micropython
+            passing = [(should.compile(be_less_than(100)), 99), (should_not.compile(start_with('ab')), 'ba')]
+            gc.collect()
+            before = gc.mem_alloc()
+            micropython.heap_lock()
+            try:
+                for check, left_value in checks:
+                    try:
+                        check(left_value)
+                    except (Should_NotSatisfied, ShouldNot_NotSatisfied):
+                        pass
+                for check, left_value in passing:
+                    check(left_value)
+            finally:
+                micropython.heap_unlock()
+            gc.mem_alloc() - before |should| equal_to(0)
+        finally:
+            disable_static_failures()
+
+        (lambda: 120 |should| be_less_than(100)) |should| throw(Should_NotSatisfied, message="expected '120' to be less than '100'.")
+
+    def test_shared_matchers_report_their_own_evaluation(self):
+        # A matcher evaluated again before the first failure is reported, e.g. by another thread, still reports it.
+        def report(matcher, left_value):
+            return str(utils.failure_message(matcher.message_for_failed_should, left_value, matcher.should_match(left_value)))
+
+        missing_three = include_all_of([1, 2, 3])
+        first = missing_three.should_match(iter([1, 2]))
+        missing_three.should_match(iter([]))
+        str(utils.failure_message(missing_three.message_for_failed_should, [1, 2], first)) |should| end_with(
+            "missing 1 of 3 elements: [3]")
+        report(missing_three, [3]) |should| end_with("missing 2 of 3 elements: [1, 2]")
+
+        combined = all_of(be_kind_of(list), include_all_of([1, 2]))
+        first = combined.should_match([3, 1])
+        combined.should_match(-1)
+        str(utils.failure_message(combined.message_for_failed_should, [3, 1], first)) |should| end_with(
+            "but 1 failed:\n  - '[3, 1]' does not include all of '[1, 2]', missing 1 of 2 elements: [2]")
+        report(any_of(equal_to(1), equal_to(2)), 3) |should| include("but 2 failed")
+
+        class Point(object):
+            __slots__ = ('x', 'y')
+            def __init__(self, x, y):
+                self.x = x
+                self.y = y
+
+        same_point = have_same_attribute_values_as(Point(1, 2), full_report=True)
+        first = same_point.should_match(Point(1, 3))
+        same_point.should_match(Point(0, 2))
+        str(utils.failure_message(same_point.message_for_failed_should, Point(1, 3), first)) |should| end_with(
+            ", but attribute y: expected 2, got 3")
+
+
+class _RunnerExamples:
+    def test_passing(self):
+        2 |should| equal_to(2)
+
+    def test_failing(self):
+        2 |should| equal_to(3)
+
+    def test_raising(self):
+        1 / 0
+
+
+def run_tests():
+    return runner.run([sys.modules[__name__]])
@@ -1,8 +1,14 @@
 from .matchers import *
+from .infixes import soft_expectations, infixes_for, async_infixes_for, set_mode, reset_mode, get_mode, OFF, SAMPLED, ENFORCED
+from .infixes import enable_instrumentation, disable_instrumentation, instrumentation_snapshot, reset_instrumentation
+from .infixes import enable_static_failures, disable_static_failures
+from .exceptions import Expectations_NotSatisfied
 
 class value:
     '''Necessary in order to circumvent the fact that you can't apply 'or' operator with strings in micropython.'''
 
+    __slots__ = ('_value',)
+
     def __init__(self, input_value):
         self._value = input_value
     
@@ -10,6 +16,18 @@ class value:
         # value() | infix
         return infix.__ror__(self._value)
 
+class values:
+    '''Applies an expectation to every element of an iterable in a single pass, reporting all the failing elements at once.'''
+
+    __slots__ = ('_values',)
+
+    def __init__(self, input_values):
+        self._values = input_values
+
+    def __or__(self, infix):
+        # values() | infix
+        return infix.bind_all(self._values)
+
 
 def aliases(**kwargs):
     for k in kwargs:
@@ -4,6 +4,21 @@ class Should_NotSatisfied(Exception):
 class ShouldNot_NotSatisfied(Exception):
     pass
 
+'''
+Exception raised by `soft_expectations` when its block ends, gathering every failed expectation.
+The failure messages are only built when the exception is converted to a string.
+'''
+class Expectations_NotSatisfied(Exception):
+    def __init__(self, failures):
+        super().__init__(failures)
+        self.failures = failures
+
+    def __str__(self):
+        lines = ["{} expectations were not satisfied:".format(len(self.failures))]
+        for number, failure in enumerate(self.failures):
+            lines.append("  {}) {}".format(number + 1, failure))
+        return "\n".join(lines)
+
 '''
 Exception raised for functionality expected from the original Should DSL,
 but it is limited by MicroPython to run as intended. 
@@ -1,39 +1,591 @@
+from .exceptions import Should_NotSatisfied, ShouldNot_NotSatisfied, Expectations_NotSatisfied
+from . import utils
+
+try:
+    from _thread import get_ident as _get_ident
+except ImportError:
+    def _get_ident():
+        return 0
+
+try:
+    from contextvars import ContextVar
+except ImportError:
+    ContextVar = None
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import uasyncio as asyncio
+    except ImportError:
+        asyncio = None
+
+# The active `soft_expectations` block of each task (or thread). Tasks started inside a block report to it too.
+if ContextVar is not None:
+    _collector = ContextVar('soft_expectations', default=None)
+
+    def _current_collector():
+        return _collector.get()
+
+    def _push_collector(collector):
+        return _collector.set(collector)
+
+    def _pop_collector(token):
+        _collector.reset(token)
+else:
+    # Without contextvars (on MicroPython), blocks are kept by task, or by thread outside of the event loop.
+    _collectors = {}
+
+    def _context():
+        if asyncio is not None:
+            try:
+                task = asyncio.current_task()
+            except RuntimeError:
+                task = None
+            if task is not None:
+                return task
+        return _get_ident()
+
+    def _current_collector():
+        # get_ident() may return a long integer on MicroPython, which isn't worth allocating without collectors.
+        return _collectors.get(_context()) if _collectors else None
+
+    def _push_collector(collector):
+        context = _context()
+        previous = _collectors.get(context)
+        _collectors[context] = collector
+        return context, previous
+
+    def _pop_collector(saved):
+        context, previous = saved
+        if previous is None:
+            del _collectors[context]
+        else:
+            _collectors[context] = previous
+
+OFF = 'off'
+SAMPLED = 'sampled'
+ENFORCED = 'enforced'
+
+class _Policy:
+    '''How the expectations of a scope are evaluated. A scope without a mode of its own follows the global one.'''
+
+    __slots__ = ('mode', 'every', 'explicit', '_seen')
+
+    def __init__(self, mode=ENFORCED, every=1, explicit=False):
+        self.mode = mode
+        self.every = every
+        self.explicit = explicit
+        self._seen = 0
+
+    def skips(self):
+        '''Tells if the next expectation must be skipped. Only called when the mode isn't ENFORCED.
+        The sampling counter isn't locked, so with several threads the rate is approximate.'''
+        if self.mode == OFF:
+            return True
+        self._seen += 1
+        if self._seen < self.every:
+            return True
+        self._seen = 0
+        return False
+
+_global_policy = _Policy(explicit=True)
+_scoped_policies = {}
+
+def _scoped_policy(scope):
+    if scope is None:
+        return _global_policy
+    policy = _scoped_policies.get(scope)
+    if policy is None:
+        policy = _scoped_policies[scope] = _Policy(_global_policy.mode, _global_policy.every)
+    return policy
+
+def set_mode(mode, every=1, rate=None, scope=None):
+    '''Sets how expectations are evaluated, globally or for a scope created with `infixes_for`:
+
+    - OFF: expectations don't evaluate their matcher and always pass;
+    - SAMPLED: only 1 in *every* expectations is evaluated (or a *rate* between 0 and 1 of them);
+    - ENFORCED: every expectation is evaluated (the default).
+
+    Setting the global mode also changes the scopes that haven't set a mode of their own.'''
+    if mode not in (OFF, SAMPLED, ENFORCED):
+        raise ValueError("unknown mode '{}'".format(mode))
+    if rate is not None:
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be between 0 and 1")
+        every = max(1, int(round(1 / rate)))
+    if mode != SAMPLED:
+        every = 1
+
+    policy = _scoped_policy(scope)
+    policy.mode = mode
+    policy.every = every
+    policy.explicit = True
+    policy._seen = 0
+    if scope is None:
+        for scoped in _scoped_policies.values():
+            if not scoped.explicit:
+                scoped.mode = mode
+                scoped.every = every
+                scoped._seen = 0
+
+def reset_mode(scope=None):
+    '''Makes a scope follow the global mode again, or sets the global mode back to ENFORCED.'''
+    if scope is None:
+        set_mode(ENFORCED)
+    else:
+        policy = _scoped_policy(scope)
+        policy.explicit = False
+        policy.mode = _global_policy.mode
+        policy.every = _global_policy.every
+        policy._seen = 0
+
+def get_mode(scope=None):
+    '''Returns the mode and the sampling interval of the global mode, or of a scope.'''
+    policy = _scoped_policy(scope)
+    return policy.mode, policy.every
+
+class _Expectation:
+    '''Binds the left value of a single expression to the infix that evaluates it.
+
+    A new (small) instance is created for every `left |infix| right` expression, so
+    the `should` and `should_not` singletons never hold per-expression state and can
+    be shared safely between threads and interleaved tasks.'''
+
+    __slots__ = ('_infix', '_left_value')
+
+    def __init__(self, infix, left_value):
+        self._infix = infix
+        self._left_value = left_value
+
+    def __or__(self, right):
+        # (other | should) | right
+        return self._infix.evaluate(self._left_value, right)
+
+class _SkippedExpectation:
+    '''Stands for an expectation that isn't evaluated, in the OFF and SAMPLED modes.'''
+
+    __slots__ = ()
+
+    def __or__(self, right):
+        return None
+
+_skipped = _SkippedExpectation()
+
+async def _nothing():
+    pass
+
+class _SkippedAsyncExpectation:
+    '''Stands for an expectation of `should_async` that isn't evaluated, which must still be awaitable.'''
+
+    __slots__ = ()
+
+    def __or__(self, right):
+        return _nothing()
+
+_skipped_async = _SkippedAsyncExpectation()
+
+class _BatchExpectation(_Expectation):
+    '''Binds a whole iterable of left values, created by `values(...) |infix|`.'''
+
+    __slots__ = ()
+
+    def __or__(self, right):
+        # (values(...) | should) | right
+        return self._infix.evaluate_all(self._left_value, right)
+
+def _batch_report(failures):
+    lines = ["expected every value to satisfy the expectation, but {} failed:".format(len(failures))]
+    for index, message in failures[:utils.MAX_ITEMS]:
+        lines.append("  [{}] {}".format(index, message))
+    if len(failures) > utils.MAX_ITEMS:
+        lines.append("  ...({} more)".format(len(failures) - utils.MAX_ITEMS))
+    return "\n".join(lines)
+
+class soft_expectations:
+    '''Collects the failures of the expectations evaluated inside a `with` block, in the current task (or thread),
+    instead of raising on the first one. When the block ends, a single `Expectations_NotSatisfied` is raised
+    with all of them.
+
+    Each failure keeps a reference to its matcher and left value, and its message is built only
+    when the report is rendered, so a matcher instance shouldn't be reused for other expectations
+    inside the block if its message depends on the state of its last evaluation (e.g. `throw`, `change`).'''
+
+    __slots__ = ('failures', '_saved')
+
+    def __init__(self):
+        self.failures = []
+
+    def __enter__(self):
+        self._saved = _push_collector(self)
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        _pop_collector(self._saved)
+
+        if exception_type is None and self.failures:
+            raise Expectations_NotSatisfied(self.failures)
+        return False
+
+    def record(self, message_for_failure, left_value):
+        self.failures.append(utils.lazy(utils.failure_message, message_for_failure, left_value))
+
 class Infix:
+    __slots__ = ('_policy',)
+
+    _skipped = _skipped
+
+    def __init__(self, scope=None):
+        self._policy = _scoped_policy(scope)
+
     def __ror__(self, left):
         # other | should
-        self.left_value = left
-        return self
+        policy = self._policy
+        if policy.mode != ENFORCED and policy.skips():
+            return self._skipped
+        return _Expectation(self, left)
 
-    def __or__(self, right):
-        # should | other
-        self.statement  = self.infix_match(right)
-    
-    def infix_match(self, right):
+    def bind_all(self, left_values):
+        # values(...) | should
+        policy = self._policy
+        if policy.mode != ENFORCED and policy.skips():
+            return self._skipped
+        return _BatchExpectation(self, left_values)
+
+    def evaluate(self, left_value, right):
+        raise NotImplementedError()
+
+    def evaluate_all(self, left_values, right):
+        raise NotImplementedError()
+
+    def infix_match(self, left_value, right):
+        raise NotImplementedError()
+
+    def compile(self, right):
         raise NotImplementedError()
 
+    def fail(self, message_for_failure, left_value, outcome=False):
+        if outcome is not False:
+            message_for_failure = utils.explain(message_for_failure, outcome)
+        collector = _current_collector()
+        if collector is None:
+            message_for_failure(left_value)
+        else:
+            collector.record(message_for_failure, left_value)
+
 class Should(Infix):
-    def __or__(self, other):
-        super().__or__(other)
+    __slots__ = ()
+
+    def evaluate(self, left_value, other):
+        matched = self.infix_match(left_value, other)
+        if not matched:
+            self.fail(other.message_for_failed_should, left_value, matched)
+
+    def evaluate_all(self, left_values, other):
+        failures = other.failures_for_should(left_values)
+        if failures:
+            self.fail(self.message_for_failed_all, failures)
+
+    def infix_match(self, left_value, right):
+        return right.should_match(left_value)
 
-        try:
-            assert self.statement
-        except:
-            other.message_for_failed_should(self.left_value)
-    
-    def infix_match(self, right):
-        return right.should_match(self.left_value)
+    def compile(self, other):
+        '''Returns a function checking `left_value |should| other` for the left value it is called with, without
+        the allocations and the dispatch of the infix form. The matcher is shared by every call.'''
+        should_match = other.should_match
+        message_for_failed_should = other.message_for_failed_should
+        fail = self.fail
+        policy = self._policy
+
+        def check(left_value):
+            if policy.mode != ENFORCED and policy.skips():
+                return
+            matched = should_match(left_value)
+            if not matched:
+                fail(message_for_failed_should, left_value, matched)
+        return check
+
+    def message_for_failed_all(self, failures):
+        raise Should_NotSatisfied(utils.message("{}", utils.lazy(_batch_report, failures)))
 
 class ShouldNot(Infix):
-    def __or__(self, other):
-        super().__or__(other)
+    __slots__ = ()
+
+    def evaluate(self, left_value, other):
+        matched = self.infix_match(left_value, other)
+        if not matched:
+            self.fail(other.message_for_failed_should_not, left_value, matched)
+
+    def evaluate_all(self, left_values, other):
+        failures = other.failures_for_should_not(left_values)
+        if failures:
+            self.fail(self.message_for_failed_all, failures)
+
+    def infix_match(self, left_value, right):
+        return right.should_not_match(left_value)
+
+    def compile(self, other):
+        '''Returns a function checking `left_value |should_not| other` for the left value it is called with, without
+        the allocations and the dispatch of the infix form. The matcher is shared by every call.'''
+        should_not_match = other.should_not_match
+        message_for_failed_should_not = other.message_for_failed_should_not
+        fail = self.fail
+        policy = self._policy
+
+        def check(left_value):
+            if policy.mode != ENFORCED and policy.skips():
+                return
+            matched = should_not_match(left_value)
+            if not matched:
+                fail(message_for_failed_should_not, left_value, matched)
+        return check
+
+    def message_for_failed_all(self, failures):
+        raise ShouldNot_NotSatisfied(utils.message("{}", utils.lazy(_batch_report, failures)))
+
+class AsyncShould(Should):
+    '''`should` for asynchronous code: `left |should_async| matcher` returns a coroutine, which evaluates the
+    *should_match_async* method of the matcher when awaited. Awaitable left values are awaited, and matchers of
+    callables (e.g. `throw`, `change`) await the coroutine functions they call.'''
+
+    __slots__ = ()
+
+    _skipped = _skipped_async
+
+    async def evaluate(self, left_value, other):
+        matched = await self.infix_match_async(left_value, other)
+        if not matched:
+            self.fail(other.message_for_failed_should, left_value, matched)
+
+    async def evaluate_all(self, left_values, other):
+        Should.evaluate_all(self, left_values, other)
+
+    async def infix_match_async(self, left_value, right):
+        return await right.should_match_async(left_value)
+
+    def compile(self, other):
+        '''Returns a coroutine function checking `left_value |should_async| other` for the left value it is called
+        with. The matcher is shared by every call.'''
+        should_match_async = other.should_match_async
+        message_for_failed_should = other.message_for_failed_should
+        fail = self.fail
+        policy = self._policy
+
+        async def check(left_value):
+            if policy.mode != ENFORCED and policy.skips():
+                return
+            matched = await should_match_async(left_value)
+            if not matched:
+                fail(message_for_failed_should, left_value, matched)
+        return check
+
+class AsyncShouldNot(ShouldNot):
+    '''`should_not` for asynchronous code, see `AsyncShould`.'''
+
+    __slots__ = ()
 
-        try:
-            assert self.statement
-        except:
-            other.message_for_failed_should_not(self.left_value)
+    _skipped = _skipped_async
 
-    def infix_match(self, right):
-        return right.should_not_match(self.left_value)
+    async def evaluate(self, left_value, other):
+        matched = await self.infix_match_async(left_value, other)
+        if not matched:
+            self.fail(other.message_for_failed_should_not, left_value, matched)
+
+    async def evaluate_all(self, left_values, other):
+        ShouldNot.evaluate_all(self, left_values, other)
+
+    async def infix_match_async(self, left_value, right):
+        return await right.should_not_match_async(left_value)
+
+    def compile(self, other):
+        '''Returns a coroutine function checking `left_value |should_not_async| other` for the left value it is
+        called with. The matcher is shared by every call.'''
+        should_not_match_async = other.should_not_match_async
+        message_for_failed_should_not = other.message_for_failed_should_not
+        fail = self.fail
+        policy = self._policy
+
+        async def check(left_value):
+            if policy.mode != ENFORCED and policy.skips():
+                return
+            matched = await should_not_match_async(left_value)
+            if not matched:
+                fail(message_for_failed_should_not, left_value, matched)
+        return check
+
+# The exceptions raised by the comparison matchers while static failures are enabled, by class.
+_static_failures = None
+
+# CPython chains the tracebacks of an exception instance raised again and again.
+_KEEPS_TRACEBACK = hasattr(Exception(), '__traceback__')
+
+def enable_static_failures():
+    '''Makes the comparison matchers (`equal_to`, `be`, `be_greater_than`, `be_greater_than_or_equal_to`,
+    `be_less_than`, `be_less_than_or_equal_to`, `be_into`, `start_with` and `end_with`) raise preallocated exceptions,
+    whose messages are set in place and only rendered when printed. Compiled expectations of those matchers then
+    neither allocate when they pass nor when they fail, e.g. in a hard interrupt handler or with a nearly exhausted
+    heap.
+
+    Every failure raises the same exception, which must be handled before the next one; `soft_expectations` and
+    `values(...)` copy the messages they keep. The exceptions are shared by the whole program, so static failures
+    are only meant for a single context (one interrupt handler, or a single thread): concurrent failures overwrite
+    each other's messages. Not allocating is only guaranteed on MicroPython.'''
+    global _static_failures
+    if _static_failures is None:
+        _static_failures = {
+            Should_NotSatisfied: Should_NotSatisfied(utils.static_message()),
+            ShouldNot_NotSatisfied: ShouldNot_NotSatisfied(utils.static_message()),
+        }
+
+def disable_static_failures():
+    '''Makes the comparison matchers build a new exception for every failure again.'''
+    global _static_failures
+    _static_failures = None
+
+def comparison_failure(exception_class, template, left, right):
+    '''Returns the exception to raise for a failed comparison, preallocated while static failures are enabled.'''
+    if _static_failures is None:
+        return exception_class(utils.message(template, left, right))
+    exception = _static_failures[exception_class]
+    failure = exception.args[0]
+    failure.template = template
+    failure.left = left
+    failure.right = right
+    if _KEEPS_TRACEBACK:
+        exception.__traceback__ = None
+    return exception
 
 should      = Should()
 should_not  = ShouldNot()
+
+should_async      = AsyncShould()
+should_not_async  = AsyncShouldNot()
+
+def infixes_for(scope):
+    '''Returns a `should` and a `should_not` whose mode can be set apart from the global one, through
+    `set_mode(..., scope=scope)`. Usually called once per module:
+
+        should, should_not = infixes_for(__name__)
+    '''
+    return Should(scope), ShouldNot(scope)
+
+def async_infixes_for(scope):
+    '''Returns a `should_async` and a `should_not_async` following the mode of a scope, see `infixes_for`.'''
+    return AsyncShould(scope), AsyncShouldNot(scope)
+
+class _Instrumentation:
+    '''Counters of the evaluations of each matcher class, by infix. Counters aren't locked, so evaluations racing
+    between threads may be lost.'''
+
+    __slots__ = ('counters', 'callback', 'originals')
+
+    def __init__(self, callback):
+        self.counters = {}
+        self.callback = callback
+        self.originals = {}
+
+    def record(self, matcher_name, infix_name, elapsed_us, matched):
+        by_infix = self.counters.get(matcher_name)
+        if by_infix is None:
+            by_infix = self.counters[matcher_name] = {}
+        counters = by_infix.get(infix_name)
+        if counters is None:
+            counters = by_infix[infix_name] = {'evaluations': 0, 'failures': 0, 'total_us': 0, 'max_us': 0}
+        counters['evaluations'] += 1
+        if not matched:
+            counters['failures'] += 1
+        counters['total_us'] += elapsed_us
+        if elapsed_us > counters['max_us']:
+            counters['max_us'] = elapsed_us
+        if self.callback is not None:
+            self.callback(matcher_name, infix_name, elapsed_us, bool(matched))
+
+_instrumentation = None
+
+def _instrumented_infix_match(infix_name, infix_match):
+    def instrumented(self, left_value, right):
+        start = utils.ticks_us()
+        matched = infix_match(self, left_value, right)
+        _instrumentation.record(type(right).__name__, infix_name, utils.ticks_diff(utils.ticks_us(), start), matched)
+        return matched
+    return instrumented
+
+def _instrumented_infix_match_async(infix_name, infix_match_async):
+    async def instrumented(self, left_value, right):
+        start = utils.ticks_us()
+        matched = await infix_match_async(self, left_value, right)
+        _instrumentation.record(type(right).__name__, infix_name, utils.ticks_diff(utils.ticks_us(), start), matched)
+        return matched
+    return instrumented
+
+def _instrumented_compile(self, other):
+    # Goes through evaluate(), and so through the instrumented infix_match().
+    evaluate = self.evaluate
+    policy = self._policy
+
+    def check(left_value):
+        if policy.mode != ENFORCED and policy.skips():
+            return
+        evaluate(left_value, other)
+    return check
+
+def _instrumented_compile_async(self, other):
+    evaluate = self.evaluate
+    policy = self._policy
+
+    async def check(left_value):
+        if policy.mode != ENFORCED and policy.skips():
+            return
+        await evaluate(left_value, other)
+    return check
+
+def enable_instrumentation(callback=None):
+    '''Starts counting the evaluations, failures and time spent (in microseconds) in `should_match` and
+    `should_not_match`, by matcher class and infix. *callback*, if given, is called after every evaluation with
+    the matcher class name, the infix name ('should', 'should_not', 'should_async' or 'should_not_async'), the time
+    spent and whether it matched. The time spent by asynchronous expectations includes the time given to other tasks
+    while they wait.
+
+    The instrumented methods replace the regular ones while enabled, so that disabling it leaves no overhead at
+    all. Expectations compiled before enabling it aren't instrumented. Checks of `values(...)` aren't either.'''
+    global _instrumentation
+    if _instrumentation is not None:
+        _instrumentation.callback = callback
+        return
+    _instrumentation = _Instrumentation(callback)
+    for infix_class, infix_name in ((Should, 'should'), (ShouldNot, 'should_not')):
+        _instrumentation.originals[infix_class] = (infix_class.infix_match, infix_class.compile)
+        infix_class.infix_match = _instrumented_infix_match(infix_name, infix_class.infix_match)
+        infix_class.compile = _instrumented_compile
+    for infix_class, infix_name in ((AsyncShould, 'should_async'), (AsyncShouldNot, 'should_not_async')):
+        _instrumentation.originals[infix_class] = (infix_class.infix_match_async, infix_class.compile)
+        infix_class.infix_match_async = _instrumented_infix_match_async(infix_name, infix_class.infix_match_async)
+        infix_class.compile = _instrumented_compile_async
+
+def disable_instrumentation():
+    '''Stops the instrumentation, restoring the regular methods. Returns the last snapshot of its counters.'''
+    global _instrumentation
+    if _instrumentation is None:
+        return {}
+    snapshot = instrumentation_snapshot()
+    for infix_class, (infix_match, compile) in _instrumentation.originals.items():
+        if issubclass(infix_class, (AsyncShould, AsyncShouldNot)):
+            infix_class.infix_match_async = infix_match
+        else:
+            infix_class.infix_match = infix_match
+        infix_class.compile = compile
+    _instrumentation = None
+    return snapshot
+
+def instrumentation_snapshot():
+    '''Returns a copy of the counters, as {matcher class name: {infix name: {'evaluations', 'failures', 'total_us',
+    'max_us'}}}.'''
+    if _instrumentation is None:
+        return {}
+    return dict((matcher_name, dict((infix_name, dict(counters)) for infix_name, counters in by_infix.items()))
+        for matcher_name, by_infix in _instrumentation.counters.items())
+
+def reset_instrumentation():
+    '''Clears the counters, keeping the instrumentation enabled.'''
+    if _instrumentation is not None:
+        _instrumentation.counters = {}
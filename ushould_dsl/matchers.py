@@ -1,11 +1,21 @@
 import re
 from .exceptions import Should_NotSatisfied, ShouldNot_NotSatisfied, MicroPythonNotImplemented
-from . import utils
-from .infixes import should, should_not
+from . import utils, snapshots, schemas, infixes
+from .infixes import should, should_not, should_async, should_not_async
 import copy
 import sys
 
+try:
+    import asyncio
+except ImportError:
+    try:
+        import uasyncio as asyncio
+    except ImportError:
+        asyncio = None
+
 class matcher:
+    __slots__ = ('right_value',)
+
     def __init__(self, right_value):
         self.right_value = right_value
 
@@ -14,6 +24,14 @@ class matcher:
 
     def should_not_match(self, left_value=None):
         return not self.should_match(left_value)
+
+    async def should_match_async(self, left_value=None):
+        '''Evaluates the matcher for `should_async`. By default, awaits the left value when it's awaitable, and
+        matches its result.'''
+        return self.should_match(await utils.awaited(left_value))
+
+    async def should_not_match_async(self, left_value=None):
+        return not await self.should_match_async(left_value)
     
     def message_for_failed_should(self, left):
         raise NotImplementedError()
@@ -21,294 +39,831 @@ class matcher:
     def message_for_failed_should_not(self, left):
         raise NotImplementedError()
 
+    def failures_for_should(self, left_values):
+        '''Evaluates `should` for every element of an iterable in a single pass.
+        Returns a list of (index, message) pairs for the elements that failed.'''
+        failures = []
+        for index, left_value in enumerate(left_values):
+            matched = self.should_match(left_value)
+            if not matched:
+                failures.append((index, utils.failure_message(self.message_for_failed_should, left_value, matched)))
+        return failures
+
+    def failures_for_should_not(self, left_values):
+        '''Evaluates `should_not` for every element of an iterable in a single pass.
+        Returns a list of (index, message) pairs for the elements that failed.'''
+        failures = []
+        for index, left_value in enumerate(left_values):
+            matched = self.should_not_match(left_value)
+            if not matched:
+                failures.append((index, utils.failure_message(self.message_for_failed_should_not, left_value,
+                    matched)))
+        return failures
+
+class _batch_matcher(matcher):
+    '''Base for stateless matchers that know how to check whole sequences without evaluating the matcher per element.'''
+
+    __slots__ = ()
+
+    def failures_for_should(self, left_values):
+        return self._failures(left_values, True, self.message_for_failed_should)
+
+    def failures_for_should_not(self, left_values):
+        return self._failures(left_values, False, self.message_for_failed_should_not)
+
+    def _failures(self, left_values, expected, message_for_failure):
+        if self._all_hold(left_values, expected):
+            return []
+        return [(index, utils.lazy(utils.failure_message, message_for_failure, left_value))
+            for index, left_value in self._failed_items(left_values, expected)]
+
+    def _all_hold(self, left_values, expected):
+        return False
+
+    def _failed_items(self, left_values, expected):
+        raise NotImplementedError()
+
+class _ordering_matcher(_batch_matcher):
+    '''Base for comparisons whose result holds for a whole range of values once it holds for its bounds.'''
+
+    __slots__ = ()
+
+    def _all_hold(self, left_values, expected):
+        bounds = utils.bounds(left_values)
+        if bounds is None:
+            return False
+        return self.should_match(bounds[0]) is expected and self.should_match(bounds[1]) is expected
+
+class _collection_matcher(matcher):
+    '''Base for matchers looking for the elements of an expected collection. The expected elements are hashed once,
+    when the matcher is created; unhashable ones (lists, dictionaries...) are compared one by one.'''
+
+    __slots__ = ('_hashable', '_unhashable')
+
+    def __init__(self, right_value):
+        self.right_value = right_value
+        self._hashable, self._unhashable = utils.split_hashable(right_value)
+
+    def _missing(self, left_value):
+        '''Returns the expected elements not included in left_value, iterating it at most once and stopping as
+        soon as every expected element was found.'''
+        if utils.has_fast_lookup(left_value):
+            # Sets and dictionaries can't hold unhashable elements.
+            return [element for element in self._hashable if element not in left_value] + list(self._unhashable)
+
+        remaining = set(self._hashable)
+        unhashable = list(self._unhashable)
+        if not remaining and not unhashable:
+            return []
+        if not unhashable and hasattr(left_value, '__len__'):
+            # Discarding the elements of a container from the expected ones in a single C-level pass, without
+            # copying it, is faster than the loop below even though it can't stop early.
+            try:
+                remaining.difference_update(left_value)
+                return list(remaining)
+            except TypeError:
+                remaining = set(self._hashable)
+        for element in left_value:
+            if remaining:
+                try:
+                    if element in remaining:
+                        remaining.remove(element)
+                        if not remaining and not unhashable:
+                            return []
+                    continue
+                except TypeError:
+                    pass
+            if element in unhashable:
+                unhashable.remove(element)
+                if not remaining and not unhashable:
+                    return []
+        return list(remaining) + unhashable
+
+    def _found(self, left_value):
+        '''Returns the expected elements included in left_value.'''
+        missing = self._missing(left_value)
+        return [element for element in self._hashable if element not in missing] + \
+            [element for element in self._unhashable if element not in missing]
+
+    def _includes_any(self, left_value):
+        '''Checks if left_value includes any of the expected elements, stopping at the first one found.'''
+        if utils.has_fast_lookup(left_value):
+            for element in self._hashable:
+                if element in left_value:
+                    return True
+            return False
+
+        hashable = self._hashable
+        unhashable = self._unhashable
+        if not hashable:
+            for element in left_value:
+                if element in unhashable:
+                    return True
+            return False
+        for element in left_value:
+            try:
+                if element in hashable:
+                    return True
+            except TypeError:
+                if element in unhashable:
+                    return True
+        return False
+
 class equal_to_ignoring_case(matcher):
     '''Checks equality of strings ignoring case.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (self.right_value.lower() == left_value.lower())
     
     def message_for_failed_should(self, left_value):
-        raise Should_NotSatisfied("expected '{}' to be equal to '{}'.".format(left_value, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to be equal to '{}'.", left_value, self.right_value))
 
     def message_for_failed_should_not(self, left_value):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be equal to '{}'.".format(left_value, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to be equal to '{}'.", left_value, self.right_value))
 
 class equal_to(matcher):
     '''Checks object equality (not identity).
     This matcher can check string equality ignoring case too.
-    A bonus: you can combine this feature with the diff parameter too.'''
+    A bonus: you can combine this feature with the diff parameter too.
+    With *diff*, nested dictionaries, lists, tuples and sets are compared without recursion (and with cycles),
+    and the failure message lists the paths that differ.'''
+
+    __slots__ = ('case_sensitive', 'diff')
 
-    def __init__(self, right_value, case_sensitive=True):
+    def __init__(self, right_value, case_sensitive=True, diff=False):
         self.right_value = right_value
         self.case_sensitive = case_sensitive
+        self.diff = diff
 
     def should_match(self, left_value=None):
-        if self.case_sensitive:
-            return (self.right_value == left_value)
-        else:
+        if not self.case_sensitive:
             return equal_to_ignoring_case.should_match(self, left_value)
+        if self.diff:
+            for _ in utils.differences(left_value, self.right_value):
+                return False
+            return True
+        return (self.right_value == left_value)
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be '{}'.".format(left, self.right_value))
+        if self.diff:
+            left_value, right_value = left, self.right_value
+            if not self.case_sensitive:
+                left_value, right_value = left.lower(), right_value.lower()
+            raise Should_NotSatisfied(utils.message("expected '{}' to be '{}', {}", left, self.right_value,
+                utils.lazy(utils.diff_report, left_value, right_value)))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be '{}'.", left, self.right_value)
 
 class include(matcher):
     '''Verify if an object is contained (*be_into*) or contains (*contain*) another.
     The *contain* and *include* matchers do exactly the same job.'''
+
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (self.right_value in left_value)
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to be '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to be '{}'.", left, self.right_value))
 
 class be(matcher):
     '''Checks object identity (*is*).'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (self.right_value is left_value)
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be '{}'.", left, self.right_value)
 
 class include(matcher):
     '''Verify if an object contains another. The `include` and `contain` matchers do exactly the same job.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (self.right_value in left_value)
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to include '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to include '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to include '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to include '{}'.", left, self.right_value))
 
 class contain(include):
     '''Verify if an object contains another. The `contain` and `include` matchers do exactly the same job.'''
 
+    __slots__ = ()
+
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to contain '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to contain '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to contain '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to contain '{}'.", left, self.right_value))
 
-class be_into(matcher):
+class be_into(_batch_matcher):
     '''Verify if an object is contained in another.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (left_value in self.right_value)
-    
+
+    def _lookup(self):
+        if isinstance(self.right_value, (list, tuple)):
+            try:
+                return frozenset(self.right_value)
+            except TypeError:
+                pass
+        return self.right_value
+
+    def _all_hold(self, left_values, expected):
+        if not expected or not hasattr(left_values, '__len__'):
+            return False
+        lookup = self._lookup()
+        if not isinstance(lookup, (set, frozenset)):
+            return False
+        try:
+            return lookup.issuperset(left_values)
+        except TypeError:
+            return False
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        lookup = self._lookup()
+        failed = []
+        for index, left_value in enumerate(left_values):
+            try:
+                found = left_value in lookup
+            except TypeError:
+                found = left_value in right_value
+            if found is not expected:
+                failed.append((index, left_value))
+        return failed
+
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be into '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be into '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be into '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be into '{}'.", left, self.right_value)
 
-class be_greater_than(matcher):
+class be_greater_than(_ordering_matcher):
     '''Simply check the return of comparisons.'''
+
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (left_value > self.right_value)
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        return [(index, left_value) for index, left_value in enumerate(left_values)
+            if (left_value > right_value) is not expected]
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be greater than '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be greater than '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be greater than '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be greater than '{}'.", left, self.right_value)
 
-class be_greater_than_or_equal_to(matcher):
+class be_greater_than_or_equal_to(_ordering_matcher):
     '''Simply check the return of comparisons.'''
+
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (left_value >= self.right_value)
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        return [(index, left_value) for index, left_value in enumerate(left_values)
+            if (left_value >= right_value) is not expected]
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be greater than or equal to '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be greater than or equal to '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be greater than or equal to '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be greater than or equal to '{}'.", left, self.right_value)
 
-class be_less_than(matcher):
+class be_less_than(_ordering_matcher):
     '''Simply check the return of comparisons.'''
+
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (left_value < self.right_value)
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        return [(index, left_value) for index, left_value in enumerate(left_values)
+            if (left_value < right_value) is not expected]
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be less than '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be less than '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be less than '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be less than '{}'.", left, self.right_value)
 
-class be_less_than_or_equal_to(matcher):
+class be_less_than_or_equal_to(_ordering_matcher):
     '''Simply check the return of comparisons.'''
+
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (left_value <= self.right_value)
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        return [(index, left_value) for index, left_value in enumerate(left_values)
+            if (left_value <= right_value) is not expected]
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be less than or equal to '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "expected '{}' to be less than or equal to '{}'.", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be less than or equal to '{}'.".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "expected '{}' not to be less than or equal to '{}'.", left, self.right_value)
 
-class be_kind_of(matcher):
+class be_kind_of(_batch_matcher):
     '''Verifies if an object is of a given type.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return isinstance(left_value, self.right_value)
 
+    def _all_hold(self, left_values, expected):
+        element_type = utils.element_type(left_values)
+        if element_type is None:
+            return False
+        return issubclass(element_type, self.right_value) is expected
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        return [(index, left_value) for index, left_value in enumerate(left_values)
+            if isinstance(left_value, right_value) is not expected]
+
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' is not a kind of '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("'{}' is not a kind of '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' is a kind of '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("'{}' is a kind of '{}'.", left, self.right_value))
 
 class be_instance_of(be_kind_of):
     '''Same as `be_kind_of`, but using *instance* word.'''
+
+    __slots__ = ()
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be an instance of '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to be an instance of '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be an instance of '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to be an instance of '{}'.", left, self.right_value))
 
 class be_like(matcher):
     '''Checks matching against a regular expression.'''
 
+    __slots__ = ('flags', '_pattern')
+
     def __init__(self, right_value, flags=0):
-        self.right_value = right_value
+        self.right_value = utils.pattern_source(right_value)
         self.flags = flags
         
         if self.flags != 0:
             raise MicroPythonNotImplemented("MicroPython does not implement flags for matching in regex.")
 
+        self._pattern = utils.compile_pattern(right_value, self.flags)
+
     def should_match(self, left_value=None):
-        return re.match(self.right_value, left_value, self.flags) is not None
+        return self._pattern.match(left_value) is not None
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be like '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to be like '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be like '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to be like '{}'.", left, self.right_value))
 
 class _be_empty(matcher):
     '''Verifies if an object is empty. Works for lists, strings, tuples, dictionaries, and any object that implements *__len__()*.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return (utils.is_empty(left_value))
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected '{}' to be empty.".format(left))
+        raise Should_NotSatisfied(utils.message("expected '{}' to be empty.", left))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected '{}' not to be empty.".format(left))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to be empty.", left))
 
 class be_thrown_by(matcher):
     '''Check the raising of exceptions.'''
 
+    __slots__ = ()
+
+    def _call(self):
+        if type(self.right_value) is tuple:
+            fun = self.right_value[0]
+            return fun(*self.right_value[1:])
+        return self.right_value()
+
     def should_match(self, left_value=None):
         try:
-            if type(self.right_value) is tuple:
-                fun = self.right_value[0]
-                fun(*self.right_value[1:])
+            result = self._call()
+        except left_value:
+            return True
+        except Exception as e:
+            return False
+
+        utils.not_awaitable(result)
+        return False
+
+    async def should_match_async(self, left_value=None):
+        try:
+            if utils.is_awaitable(self.right_value, True):
+                await self.right_value
             else:
-                self.right_value()
+                await utils.awaited(self._call())
         except left_value:
             return True
         except Exception as e:
             return False
-        
+
         return False
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' is not thrown by '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("'{}' is not thrown by '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' is thrown by '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("'{}' is thrown by '{}'.", left, self.right_value))
+
+def _is_number(input_value):
+    # Any number (Fraction, Decimal, numpy scalars...) isn't iterable, unlike the sequences close_to compares.
+    return isinstance(input_value, (int, float)) or not utils.has_iterable_type(input_value)
+
+class close_to(_batch_matcher):
+    '''Checks if a number is close to another, given a delta.
+    The tolerance can also be relative (*rel_tol*) to the greatest magnitude of both numbers, alone or combined with
+    the absolute one (*delta*, or *abs_tol*), in which case the greatest tolerance applies.
+    Sequences of numbers (lists, `array.array`, buffers...) are compared in a single pass, either to a number or to
+    the number at the same index of another sequence.'''
+
+    __slots__ = ('delta', 'rel_tol')
+
+    def __init__(self, right_value, delta=None, rel_tol=None, abs_tol=None):
+        if delta is not None and abs_tol is not None:
+            raise TypeError("close_to takes either delta or abs_tol")
+        if delta is None:
+            delta = abs_tol
+        if delta is None and rel_tol is None:
+            raise TypeError("close_to needs a delta, abs_tol or rel_tol")
+        if (delta or 0) < 0 or (rel_tol or 0) < 0:
+            raise ValueError("tolerances can't be negative")
+        self.right_value = right_value
+        self.delta = delta or 0
+        self.rel_tol = rel_tol or 0
+
+    def _excess(self, left_value, right_value):
+        '''How far left_value is beyond the tolerance around right_value; 0 or less when they are close.'''
+        if left_value == right_value:
+            return 0
+        magnitude = max(abs(left_value), abs(right_value))
+        excess = abs(left_value - right_value) - max(self.rel_tol * magnitude, self.delta)
+        if type(left_value) is float or type(right_value) is float:
+            # The slack absorbs the rounding of the subtraction, e.g. 4 - 4.9 is -0.9000000000000004. Subtracting
+            # integers is exact.
+            excess -= utils.FLOAT_SLACK * magnitude
+        if excess != excess:
+            return utils.INFINITY
+        return excess
+
+    def should_match(self, left_value=None):
+        if _is_number(left_value):
+            return self._excess(left_value, self.right_value) <= 0
+        return self._match_sequence(left_value)
+
+    def _match_sequence(self, left_values):
+        '''Returns True, or the (lengths, failures, worst) details of the failure in `utils.unmatched`.'''
+        right_value = self.right_value
+        excess = self._excess
+        failures = 0
+        worst = None
+        worst_excess = 0
+        if _is_number(right_value):
+            index = 0
+            for left_value in left_values:
+                difference = excess(left_value, right_value)
+                if difference > 0:
+                    failures += 1
+                    if difference > worst_excess:
+                        worst, worst_excess = (index, left_value, right_value), difference
+                index += 1
+        else:
+            if len(left_values) != len(right_value):
+                return utils.unmatched(((len(left_values), len(right_value)), 0, None))
+            for index in range(len(left_values)):
+                left_value = left_values[index]
+                difference = excess(left_value, right_value[index])
+                if difference > 0:
+                    failures += 1
+                    if difference > worst_excess:
+                        worst, worst_excess = (index, left_value, right_value[index]), difference
+        if worst is None:
+            return True
+        return utils.unmatched((None, failures, worst))
 
-class close_to(matcher):
-    '''Checks if a number is close to another, given a delta.'''
+    def _all_hold(self, left_values, expected):
+        # Being close is an interval check, so it holds for every value between two bounds that pass.
+        # Being far away isn't, as the bounds may lie on opposite sides of the interval.
+        if not expected or not _is_number(self.right_value):
+            return False
+        bounds = utils.bounds(left_values)
+        if bounds is None:
+            return False
+        return bool(self.should_match(bounds[0]) and self.should_match(bounds[1]))
+
+    def _failed_items(self, left_values, expected):
+        right_value = self.right_value
+        excess = self._excess
+        return [(index, left_value) for index, left_value in enumerate(left_values)
+            if (excess(left_value, right_value) <= 0) is not expected]
+
+    def _tolerance(self):
+        if not self.rel_tol:
+            return "+/- '{}'".format(self.delta)
+        if not self.delta:
+            return "a relative '{}'".format(self.rel_tol)
+        return "+/- '{}' or a relative '{}'".format(self.delta, self.rel_tol)
+
+    def message_for_failed_should(self, left, details=None):
+        if details is None and not _is_number(left):
+            details = self._match_sequence(left).details
+        if details is not None:
+            lengths, failures, worst = details
+            if lengths is not None:
+                raise Should_NotSatisfied(utils.message("expected {} numbers, as many as in '{}', got {}", lengths[1],
+                    self.right_value, lengths[0]))
+            index, left_value, right_value = worst
+            raise Should_NotSatisfied(utils.message(
+                "expected every number to be close to '{}' (within {}), but {} weren't; the worst is at index {}, "
+                "'{}' instead of '{}' (off by '{}')", self.right_value, self._tolerance(), failures, index,
+                left_value, right_value, abs(left_value - right_value)))
+        raise Should_NotSatisfied(utils.message("expected to be close to '{}' (within {}), got '{}'", self.right_value, self._tolerance(), left))
 
-    def __init__(self, right_value, delta):
-        self.right_value = right_value
-        self.delta = delta
+    def message_for_failed_should_not(self, left):
+        if not _is_number(left):
+            raise ShouldNot_NotSatisfied(utils.message("expected some number not to be close to '{}' (within {}), got '{}'", self.right_value, self._tolerance(), left))
+        raise ShouldNot_NotSatisfied(utils.message("expected not to be close to '{}' (within {}), got '{}'", self.right_value, self._tolerance(), left))
+
+class complete_within(matcher):
+    '''Checks if an awaitable, a coroutine function or a callable completes within a time limit, in milliseconds.
+    With `should_async`, the awaitable is cancelled as soon as it runs out of time, without blocking the event loop;
+    with `should`, the callable is run to its end, and then timed.'''
+
+    __slots__ = ()
 
     def should_match(self, left_value=None):
-        return abs(round(self.right_value - left_value, 3)) <= round(self.delta, 3)
+        return self._verdict(self._run(left_value), True)
 
-    def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected to be close to '{}' (within +/- '{}'), got '{}'".format(self.right_value, self.delta, left))
+    def should_not_match(self, left_value=None):
+        return self._verdict(self._run(left_value), False)
+
+    async def should_match_async(self, left_value=None):
+        return self._verdict(await self._run_async(left_value), True)
+
+    async def should_not_match_async(self, left_value=None):
+        return self._verdict(await self._run_async(left_value), False)
+
+    def _run(self, left_value):
+        '''Returns whether the run timed out, and how long it took, in milliseconds.'''
+        start = utils.ticks_us()
+        utils.not_awaitable(left_value())
+        return False, utils.ticks_diff(utils.ticks_us(), start) / 1000
+
+    async def _run_async(self, left_value):
+        start = utils.ticks_us()
+        if not utils.is_awaitable(left_value, True):
+            left_value = left_value()
+        if utils.is_awaitable(left_value, True):
+            try:
+                await asyncio.wait_for(left_value, self.right_value / 1000)
+            except asyncio.TimeoutError:
+                return True, utils.ticks_diff(utils.ticks_us(), start) / 1000
+        return False, utils.ticks_diff(utils.ticks_us(), start) / 1000
+
+    def _verdict(self, timing, positive):
+        timed_out, elapsed_ms = timing
+        completed = not timed_out and elapsed_ms <= self.right_value
+        return True if completed == positive else utils.unmatched(timing)
+
+    def message_for_failed_should(self, left, timing=None):
+        if timing is None:
+            # The awaitable can't be run again.
+            raise Should_NotSatisfied(utils.message("expected {} to complete within {} ms", left, self.right_value))
+        timed_out, elapsed_ms = timing
+        if timed_out:
+            raise Should_NotSatisfied(utils.message("expected {} to complete within {} ms, but it was cancelled after {} ms",
+                left, self.right_value, elapsed_ms))
+        raise Should_NotSatisfied(utils.message("expected {} to complete within {} ms, but it took {} ms",
+            left, self.right_value, elapsed_ms))
+
+    def message_for_failed_should_not(self, left, timing=None):
+        if timing is None:
+            raise ShouldNot_NotSatisfied(utils.message("expected {} not to complete within {} ms", left,
+                self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected {} not to complete within {} ms, but it took {} ms",
+            left, self.right_value, timing[1]))
+
+class conform_to(matcher):
+    '''Validates a payload against a `schemas.Schema` (or the declaration of one, compiled on the spot), reporting
+    every violation with its path. *limit* stops the validation after that many violations.'''
+
+    __slots__ = ('limit',)
+
+    def __init__(self, right_value, limit=None):
+        self.right_value = right_value if isinstance(right_value, schemas.Schema) else schemas.Schema(right_value)
+        self.limit = limit
+
+    def should_match(self, left_value=None):
+        violations = self.right_value.violations(left_value, self.limit)
+        return utils.unmatched(violations) if violations else True
+
+    def should_not_match(self, left_value=None):
+        return self.right_value.violations(left_value, 1) != []
+
+    def message_for_failed_should(self, left, violations=None):
+        if violations is None:
+            violations = self.right_value.violations(left, self.limit)
+        raise Should_NotSatisfied(utils.message("expected '{}' to conform to the schema, {}", left,
+            utils.lazy(schemas.report, violations)))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected not to be close to '{}' (within +/- '{}'), got '{}'".format(self.right_value, self.delta, left))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to conform to the schema.", left))
 
 class end_with(matcher):
     '''Verifies if a string ends with a given suffix.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return left_value.endswith(self.right_value)
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' does not end with '{}'".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "'{}' does not end with '{}'", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' does end with '{}'".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "'{}' does end with '{}'", left, self.right_value)
 
-class include_all_of(matcher):
+class include_all_of(_collection_matcher):
     '''Check if an iterable includes all elements of another.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
-        return set(self.right_value).issubset(left_value)
+        missing = self._missing(left_value)
+        # Given to the failure message, as iterators can't be scanned again.
+        return utils.unmatched(missing) if missing else True
 
-    def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' does not include all of '{}'".format(left, self.right_value))
+    def _missing_summary(self, left, missing):
+        if missing is None:
+            missing = self._missing(left)
+        return utils.lazy(utils.missing_summary, missing, len(self._hashable) + len(self._unhashable))
+
+    def message_for_failed_should(self, left, missing=None):
+        raise Should_NotSatisfied(utils.message("'{}' does not include all of '{}', {}", left, self.right_value,
+            self._missing_summary(left, missing)))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' does include all of '{}'".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("'{}' does include all of '{}'", left, self.right_value))
 
 class include_in_any_order(include_all_of):
     '''Check if an iterable includes all elements of another. Do the same as `include_all_of`.'''
 
-    def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' does not include in any order '{}'".format(left, self.right_value))
+    __slots__ = ()
+
+    def message_for_failed_should(self, left, missing=None):
+        raise Should_NotSatisfied(utils.message("'{}' does not include in any order '{}', {}", left, self.right_value,
+            self._missing_summary(left, missing)))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' does include in any order '{}'".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("'{}' does include in any order '{}'", left, self.right_value))
 
-class include_any_of(matcher):
+class include_any_of(_collection_matcher):
     '''Checks if an iterable includes any element of another.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
-        return not set(self.right_value).isdisjoint(left_value)
+        return self._includes_any(left_value)
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' does not include any of '{}'.".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("'{}' does not include any of '{}'.", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' does include any of '{}'.".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("'{}' does include any of '{}'.", left, self.right_value))
+
+class match_snapshot(matcher):
+    '''Compares a value with the snapshot of the given name, like `equal_to` with *diff*. Snapshots are read from a
+    `snapshots.SnapshotStore` (the default one unless *store* is given); a snapshot that doesn't exist yet is
+    stored, and, if the store is in update mode, so is one that doesn't match.'''
+
+    __slots__ = ('store',)
+
+    def __init__(self, right_value, store=None):
+        self.right_value = right_value
+        self.store = store
+
+    def _compare(self, left_value, create):
+        '''Returns True if the value matches the snapshot, or `utils.unmatched` with whether it differs from it (rather
+        than not being comparable with it) and the reason why.'''
+        store = self.store or snapshots.default_store()
+        try:
+            actual = store.normalize(left_value)
+        except (TypeError, ValueError) as error:
+            return utils.unmatched((False, utils.message("but it can't be stored as JSON: {}", str(error))))
+        if self.right_value not in store:
+            if not create:
+                return utils.unmatched((False, "but there is no such snapshot"))
+            store.put(self.right_value, actual)
+            return True
+        expected = store.get(self.right_value)
+        for _ in utils.differences(actual, expected):
+            if create and store.update:
+                store.put(self.right_value, actual)
+                return True
+            return utils.unmatched((True, utils.lazy(utils.diff_report, actual, expected)))
+        return True
+
+    def should_match(self, left_value=None):
+        return self._compare(left_value, True)
+
+    def should_not_match(self, left_value=None):
+        outcome = self._compare(left_value, False)
+        if outcome is True:
+            return utils.unmatched((False, None))
+        differs, reason = outcome.details
+        return True if differs else outcome
+
+    def message_for_failed_should(self, left, details=None):
+        if details is None:
+            outcome = self._compare(left, False)
+            details = outcome.details if outcome is not True else (False, None)
+        reason = details[1]
+        if reason is None:
+            raise Should_NotSatisfied(utils.message("expected '{}' to match the snapshot '{}'.", left,
+                self.right_value))
+        raise Should_NotSatisfied(utils.message("expected '{}' to match the snapshot '{}', {}", left, self.right_value,
+            reason))
+
+    def message_for_failed_should_not(self, left, details=None):
+        if details is None:
+            outcome = self.should_not_match(left)
+            details = outcome.details if outcome is not True else (True, None)
+        reason = details[1]
+        if reason is None:
+            raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to match the snapshot '{}'.", left,
+                self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected '{}' not to match the snapshot '{}', {}", left,
+            self.right_value, reason))
 
 class start_with(matcher):
     '''Verifies if a string starts with a given prefix.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return left_value.startswith(self.right_value)
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("'{}' does not start with '{}'".format(left, self.right_value))
+        raise infixes.comparison_failure(Should_NotSatisfied, "'{}' does not start with '{}'", left, self.right_value)
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("'{}' does start with '{}'".format(left, self.right_value))
+        raise infixes.comparison_failure(ShouldNot_NotSatisfied, "'{}' does start with '{}'", left, self.right_value)
 
 class throw(matcher):
     '''Check the raising of exceptions.'''
 
+    __slots__ = ('_expected_message', '_expected_message_regex', '_expected_message_pattern',
+                 '_expected_exception', '_left_value', '_actual_exception', '_actual_message')
+
     def __init__(self, right_value, message=None, message_regex=None):
         self._expected_message = message
-        self._expected_message_regex = message_regex
+        self._expected_message_regex = None
+        self._expected_message_pattern = None
+        if message_regex is not None:
+            self._expected_message_regex = utils.pattern_source(message_regex)
+            self._expected_message_pattern = utils.compile_pattern(message_regex)
         if isinstance(right_value, Exception):
             self._expected_exception = right_value.__class__
             if message is None and message_regex is None:
@@ -316,26 +871,47 @@ class throw(matcher):
         else:
             self._expected_exception = right_value
     
-    def should_match(self, left_value=None):
+    def _call(self, left_value):
         self._left_value = left_value
         if utils.is_iterable(left_value):
             args = left_value[1:]
             left_value = left_value[0]
         else:
             args = []
+        return left_value(*args)
+
+    def should_match(self, left_value=None):
         try:
-            left_value(*args)
-            self._actual_exception = None
-            return False
+            result = self._call(left_value)
+        except self._expected_exception:
+            return self._caught(sys.exc_info()[1])
+        except Exception:
+            return self._caught(sys.exc_info()[1])
+        utils.not_awaitable(result)
+        self._actual_exception = None
+        return False
+
+    async def should_match_async(self, left_value=None):
+        try:
+            if utils.is_awaitable(left_value, True):
+                self._left_value = left_value
+                await left_value
+            else:
+                await utils.awaited(self._call(left_value))
         except self._expected_exception:
-            e = sys.exc_info()[1]
-            self._actual_exception = self._expected_exception
-            self._actual_message = str(e)
-            return self._handle_expected_message() and self._handle_expected_regex()
+            return self._caught(sys.exc_info()[1])
         except Exception:
-            e = sys.exc_info()[1]
+            return self._caught(sys.exc_info()[1])
+        self._actual_exception = None
+        return False
+
+    def _caught(self, e):
+        if not isinstance(e, self._expected_exception):
             self._actual_exception = e.__class__
             return False
+        self._actual_exception = self._expected_exception
+        self._actual_message = str(e)
+        return self._handle_expected_message() and self._handle_expected_regex()
     
     def _using_message(self):
         return self._expected_message is not None
@@ -354,32 +930,52 @@ class throw(matcher):
     def _handle_expected_regex(self):
         if not self._using_regex():
             return True
-        return re.match(self._expected_message_regex, self._actual_message) is not None
+        return self._expected_message_pattern.match(self._actual_message) is not None
 
     def message_for_failed_should(self, left):
-        message = "expected to throw %r" % self._expected_exception.__name__
+        template = "expected to throw {!r}"
+        args = [self._expected_exception.__name__]
         if self._using_message():
-            message += " with the message %r" % self._expected_message
+            template += " with the message {!r}"
+            args.append(self._expected_message)
         elif self._using_regex():
-            message += " with a message that matches %r" % self._expected_message_regex
+            template += " with a message that matches {!r}"
+            args.append(self._expected_message_regex)
         if self._got_exception():
-            message += ', got %r' % self._actual_exception.__name__
+            template += ", got {!r}"
+            args.append(self._actual_exception.__name__)
             if self._using_message():
-                message += ' with %r' % self._actual_message
+                template += " with {!r}"
+                args.append(self._actual_message)
             elif self._using_regex():
-                message += ' with no match for %r' % self._actual_message
+                template += " with no match for {!r}"
+                args.append(self._actual_message)
         else:
-            message += ', got no exception'
-        raise Should_NotSatisfied(message)
+            template += ", got no exception"
+        raise Should_NotSatisfied(utils.message(template, *args))
 
     def message_for_failed_should_not(self, left):
-        message = "expected not to throw %r" % self._expected_exception.__name__
+        template = "expected not to throw {!r}"
+        args = [self._expected_exception.__name__]
         if self._using_message():
-            message += " with the message %r" % self._expected_message
+            template += " with the message {!r}"
+            args.append(self._expected_message)
         elif self._using_regex():
-            message += " with a message that matches %r" % self._expected_message_regex
+            template += " with a message that matches {!r}"
+            args.append(self._expected_message_regex)
 
-        raise ShouldNot_NotSatisfied("%s, but got it" % message)
+        raise ShouldNot_NotSatisfied(utils.message(template + ", but got it", *args))
+
+# How `have` gets to the collection it counts, found once per (target type, collection name):
+_DIRECT = 0         # the target is the collection
+_ATTRIBUTE = 1      # an attribute of the target, or the result of a method of it
+_CHAIN = 2          # 'x_on_y': the x attribute (or method result) of the y attribute (or method result) of the target
+
+HAVE_PLAN_CACHE_SIZE = 64
+_have_plans = {}
+_have_plan_order = []
+
+_UNSET = object()
 
 class have(matcher):
     '''Checks the element count of a given collection.
@@ -387,6 +983,8 @@ class have(matcher):
     It also works with non-iterable objects, if the qualifier is an attribute name or method that contains the collection to be count.
     And allows counting collections within field objects.'''
 
+    __slots__ = ('_collection_name', '_humanized_collection_name', 'left_value', '_collection', '_count')
+
     def __getattr__(self, collection_name):
         self._collection_name = collection_name
         self._humanized_collection_name = collection_name.replace('_', ' ')
@@ -394,76 +992,149 @@ class have(matcher):
 
     def should_match(self, left_value):
         self.left_value = left_value
-        if hasattr(self.left_value, self._collection_name) and not utils.is_iterable(self.left_value):
-            self._collection = getattr(self.left_value, self._collection_name)
-            if not utils.is_iterable(self._collection):
-                if callable(self._collection):
-                    self._collection = self._collection()
-                    if not utils.is_iterable(self._collection):
-                        raise TypeError("target's '%s()' does not return an iterable" % self._collection_name)
-                else:
-                    raise TypeError("target's %r is not an iterable" % self._collection_name)
-        elif utils.is_iterable(self.left_value):
-            self._collection = self.left_value
-        elif self._is_collection_through():
-            owned_by_owned, owned = self._collection_name.split('_on_')
-            owned_object = self._retrieve_owned_object(self.left_value, owned)
-            owned_by_owned_object = self._retrieve_owned_object(owned_object, owned_by_owned)
-            if not utils.is_iterable(owned_by_owned_object):
-                if callable(getattr(owned_object, owned_by_owned)):
-                    raise TypeError("target's '{}()' does not return an iterable".format(owned_by_owned))
-                else:
-                    raise TypeError("target's '{}' is not an iterable".format(owned_by_owned))
-            self._collection = owned_by_owned_object
-        else:
-            raise TypeError("target does not have a '{}' collection, nor it is an iterable".format(
-                self._collection_name))
+        key = (type(left_value), self._collection_name)
+        plan = _have_plans.get(key)
+        collection = _UNSET if plan is None else self._follow(left_value, plan)
+        if collection is _UNSET:
+            for plan in self._plans(left_value):
+                collection = self._follow(left_value, plan)
+                if collection is not _UNSET:
+                    utils.remember(_have_plans, _have_plan_order, key, plan, HAVE_PLAN_CACHE_SIZE)
+                    break
+            else:
+                raise TypeError("target does not have a '{}' collection, nor it is an iterable".format(
+                    self._collection_name))
+        self._collection = collection
+        self._count = utils.count(collection, self._count_limit())
         return self._compare()
 
-    def _retrieve_owned_object(self, object_, owned):
-        owned_object = getattr(object_, owned)
+    def _plans(self, left_value):
+        '''Returns the ways the collection can be found in the target, in order of preference.'''
+        if utils.has_iterable_type(left_value):
+            return ((_DIRECT,),)
+        splitted = self._collection_name.split('_on_')
+        if len(splitted) == 2:
+            return ((_ATTRIBUTE, self._collection_name), (_CHAIN, splitted[1], splitted[0]))
+        return ((_ATTRIBUTE, self._collection_name),)
+
+    def _follow(self, left_value, plan):
+        '''Gets the collection of the target following a plan, calling each method on the way once. Returns _UNSET
+        when the target doesn't have the first attribute of the plan, before calling anything.'''
+        kind = plan[0]
+        if kind == _DIRECT:
+            return left_value
+        if kind == _ATTRIBUTE:
+            collection = getattr(left_value, plan[1], _UNSET)
+            if collection is _UNSET or utils.has_iterable_type(collection):
+                return collection
+            if not callable(collection):
+                raise TypeError("target's %r is not an iterable" % plan[1])
+            collection = collection()
+            if not utils.has_iterable_type(collection):
+                raise TypeError("target's '%s()' does not return an iterable" % plan[1])
+            return collection
+
+        _, owned, owned_by_owned = plan
+        owned_object = getattr(left_value, owned, _UNSET)
+        if owned_object is _UNSET:
+            return _UNSET
         if callable(owned_object):
             owned_object = owned_object()
-        return owned_object
-
-    def _is_collection_through(self):
-        splitted = self._collection_name.split('_on_')
-        if len(splitted) == 1:
-            return False
-        owned_by_owned, owned = splitted
-
-        if not hasattr(self.left_value, owned):
-            return False
-        owned_object = self._retrieve_owned_object(self.left_value, owned)
-        return hasattr(owned_object, owned_by_owned)
+        collection = getattr(owned_object, owned_by_owned, _UNSET)
+        if collection is _UNSET:
+            raise TypeError("target does not have a '{}' collection, nor it is an iterable".format(
+                self._collection_name))
+        if callable(collection):
+            collection = collection()
+            if not utils.has_iterable_type(collection):
+                raise TypeError("target's '{}()' does not return an iterable".format(owned_by_owned))
+        elif not utils.has_iterable_type(collection):
+            raise TypeError("target's '{}' is not an iterable".format(owned_by_owned))
+        return collection
+
+    def _count_limit(self):
+        # One element past the expected count is enough to know the collection has more than it.
+        return self.right_value + 1
 
     def _compare(self):
-        return self.right_value == len(self._collection)
+        return self._count == self.right_value
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected %r %r, got %r" % (self.right_value,
-            self._humanized_collection_name, len(self._collection)))
+        raise Should_NotSatisfied(utils.message("expected {!r} {!r}, got {!r}", self.right_value,
+            self._humanized_collection_name, self._count))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected target not to have %d %r, got %r" % (
+        raise ShouldNot_NotSatisfied(utils.message("expected target not to have {} {!r}, got {!r}",
             self.right_value,
-            self._humanized_collection_name, len(self._collection)))
+            self._humanized_collection_name, self._count))
+
+def _same(input_value):
+    return input_value
+
+class snapshot_strategy:
+    '''How `change` keeps the observed result from before the action, to compare it with the result after it.
+    *before* takes the snapshot, and *after* turns the later result into something comparable with it. When the
+    snapshots aren't *comparable* (like fingerprints), `change` can only tell if the result changed.'''
+
+    __slots__ = ('name', 'before', 'after', 'comparable')
+
+    def __init__(self, name, before, after=None, comparable=True):
+        self.name = name
+        self.before = before
+        self.after = before if after is None else after
+        self.comparable = comparable
+
+SHALLOW_COPY = snapshot_strategy('shallow copy', copy.copy, _same)
+DEEP_COPY = snapshot_strategy('deep copy', copy.deepcopy, _same)
+LENGTH = snapshot_strategy('length', len)
+def _fingerprint(input_value):
+    # Results whose contents can't be fingerprinted, like objects hashed by identity, are deep-copied instead.
+    result = utils.fingerprint(input_value)
+    return copy.deepcopy(input_value) if result is None else result
+
+FINGERPRINT = snapshot_strategy('fingerprint', _fingerprint, comparable=False)
+
+def version_attribute(name):
+    '''Returns a snapshot strategy keeping a version counter attribute of the observed result, e.g. one that its
+    class increments on each modification.'''
+    return snapshot_strategy("'{}'".format(name), lambda input_value: getattr(input_value, name))
 
 class change(matcher):
-    '''Checks for changes on the result of a given function, method or lambda.'''
+    '''Checks for changes on the result of a given function, method or lambda.
+    The result from before the action is kept through a *snapshot* strategy: a shallow copy by default, or a deep
+    copy, its length, its fingerprint or a version counter attribute, which don't duplicate large results.'''
 
-    def __init__(self, right_value):
+    __slots__ = ('_by', '_from_to', '_only_to', 'left_value', '_before_result', '_after_result',
+                 '_expected_difference', '_actual_difference', '_from_value', '_to_value',
+                 '_failure_on_to_initial_value', '_snapshot')
+
+    def __init__(self, right_value, snapshot=SHALLOW_COPY):
         self._by = None
         self._from_to = False
         self._only_to = False
+        self._snapshot = snapshot
         self.right_value = self._to_callable(right_value)
 
     def should_match(self, left_value=None):
         self.left_value = self._to_callable(left_value)
-        self._before_result = copy.copy(self.right_value())
-        self.left_value()
-        self._after_result = self.right_value()
+        self._before_result = self._snapshot.before(self.right_value())
+        utils.not_awaitable(self.left_value())
+        self._after_result = self._snapshot.after(self.right_value())
+        return self._compare()
 
+    async def should_match_async(self, left_value=None):
+        # Both the action and the observed function can be coroutine functions.
+        if utils.is_awaitable(left_value, True):
+            action = left_value
+            self.left_value = lambda: action
+        else:
+            self.left_value = self._to_callable(left_value)
+        self._before_result = self._snapshot.before(await utils.awaited(self.right_value()))
+        await utils.awaited(self.left_value())
+        self._after_result = self._snapshot.after(await utils.awaited(self.right_value()))
+        return self._compare()
+
+    def _compare(self):
         if self._by is not None:
             self._actual_difference = self._after_result - self._before_result
             return self._by.comparison(self._expected_difference, self._actual_difference)
@@ -481,53 +1152,74 @@ class change(matcher):
     
     def message_for_failed_should(self, left):
         if self._by is not None:
-            raise Should_NotSatisfied('result should have changed {} {}, but was changed by {}'.format(
-                self._by.name, self._expected_difference, self._actual_difference))
+            raise Should_NotSatisfied(utils.message('{} should have changed {} {}, but was changed by {}', 
+                self._subject(), self._by.name, self._expected_difference, self._actual_difference))
         elif self._from_to:
-            raise Should_NotSatisfied('result should have changed from {} to {}, but was changed from {} to {}'.format(
-                self._from_value, self._to_value, self._before_result, self._after_result))
+            raise Should_NotSatisfied(utils.message('{} should have changed from {} to {}, but was changed from {} to {}', 
+                self._subject(), self._from_value, self._to_value, self._before_result, self._after_result))
         elif self._only_to:
             if self._failure_on_to_initial_value:
-                raise Should_NotSatisfied('result should have been changed to {}, but is now {}'.format(
-                    self._to_value, self._before_result))
+                raise Should_NotSatisfied(utils.message('{} should have been changed to {}, but is now {}', 
+                    self._subject(), self._to_value, self._before_result))
             else:
-                raise Should_NotSatisfied('result should have changed to {}, but was changed to {}'.format(
-                    self._to_value, self._after_result))
+                raise Should_NotSatisfied(utils.message('{} should have changed to {}, but was changed to {}', 
+                    self._subject(), self._to_value, self._after_result))
         else:
-            raise Should_NotSatisfied('result should have changed, but is still {}'.format(
-                self._before_result))
+            if not self._snapshot.comparable:
+                raise Should_NotSatisfied(utils.message("{} should have changed, but is still the same",
+                    self._subject()))
+            raise Should_NotSatisfied(utils.message('{} should have changed, but is still {}', 
+                self._subject(), self._before_result))
 
     def message_for_failed_should_not(self, left):
         if self._from_to:
-            raise ShouldNot_NotSatisfied('result should not have changed from {} to {}'.format(
-                  self._from_value, self._to_value))
+            raise ShouldNot_NotSatisfied(utils.message('{} should not have changed from {} to {}', 
+                  self._subject(), self._from_value, self._to_value))
         elif self._only_to:
-            raise ShouldNot_NotSatisfied('result should not have changed to {}'.format(self._to_value))
+            raise ShouldNot_NotSatisfied(utils.message('{} should not have changed to {}', self._subject(), self._to_value))
         else:
-            raise ShouldNot_NotSatisfied('should not have changed, but did change from {} to {}'.format(
+            if not self._snapshot.comparable:
+                raise ShouldNot_NotSatisfied(utils.message("{} should not have changed, but did change",
+                    self._subject()))
+            raise ShouldNot_NotSatisfied(utils.message('should not have changed, but did change from {} to {}', 
                 self._before_result, self._after_result))
 
+    def _subject(self):
+        if self._snapshot.after is _same:
+            return 'result'
+        return "result's " + self._snapshot.name
+
+    def _comparing(self, method_name):
+        if not self._snapshot.comparable:
+            raise TypeError("change can't check {}() with the {} snapshot, which only tells if the result changed"
+                .format(method_name, self._snapshot.name))
+
     def by(self, difference):
+        self._comparing('by')
         self._expected_difference = difference
         self._by = change._By(lambda exp_dif, act_dif: act_dif == exp_dif)
         return self
 
     def  by_at_least(self, difference):
+        self._comparing('by_at_least')
         self._expected_difference = difference
         self._by = change._By(lambda exp_dif, act_dif: act_dif >= exp_dif, 'at least')
         return self
 
     def by_at_most(self, difference):
+        self._comparing('by_at_most')
         self._expected_difference = difference
         self._by = change._By(lambda exp_dif, act_dif: act_dif <= exp_dif, 'at most')
         return self
 
     def from_(self, from_value):
+        self._comparing('from_')
         self._from_value = from_value
         self._from_to = True
         return self
 
     def to(self, to_value):
+        self._comparing('to')
         self._only_to = not self._from_to
         self._to_value = to_value
         return self
@@ -542,55 +1234,51 @@ class change(matcher):
                 'or a iterable having a callable as its first element')
 
     class _By(object):
+        __slots__ = ('name', 'comparison')
+
         def __init__(self, comparison, name=''):
             self.name = ('by ' + name).strip()
             self.comparison = comparison
 
-class include_keys(matcher):
+class include_keys(_collection_matcher):
     '''Checks if a dictionary includes all given keys.'''
 
+    __slots__ = ()
+
     def __init__(self, *right_value):
-        self.right_value = right_value
+        _collection_matcher.__init__(self, right_value)
 
     def should_match(self, left_value=None):
         if type(left_value) != dict:
             raise TypeError("target must be a dictionary")
-        self._non_present_keys  = set(self.right_value) - set(left_value.keys())
-
-        return (len(self._non_present_keys) == 0)
+        return not self._missing(left_value)
 
     def should_not_match(self, left_value=None):
-        self._non_present_keys  = set(self.right_value) - set(left_value.keys())
-        self._present_keys      = set(self.right_value) - self._non_present_keys
-
-        return (len(self._present_keys) == 0)
+        return not self._includes_any(left_value)
 
     def message_for_failed_should(self, left):
-        r = utils.keys_in_phrase(self._non_present_keys, "key")
-        raise Should_NotSatisfied("expected target to include {}".format(r))
+        r = utils.lazy(utils.keys_in_phrase, self._missing(left), "key")
+        raise Should_NotSatisfied(utils.message("expected target to include {}", r))
 
     def message_for_failed_should_not(self, left):
-        r = utils.keys_in_phrase(self._present_keys, "key")
-        raise ShouldNot_NotSatisfied("expected target to not include {}".format(r))
+        r = utils.lazy(utils.keys_in_phrase, self._found(left), "key")
+        raise ShouldNot_NotSatisfied(utils.message("expected target to not include {}", r))
 
-class include_values(matcher):
+class include_values(_collection_matcher):
     '''Checks if a dictionary includes all given values.'''
 
+    __slots__ = ()
+
     def __init__(self, *right_value):
-        self.right_value = right_value
+        _collection_matcher.__init__(self, right_value)
 
     def should_match(self, left_value=None):
         self.check_left_value(left_value)
-        self._non_present_keys  = set(self.right_value) - set(left_value.values())
-
-        return (len(self._non_present_keys) == 0)
+        return not self._missing(left_value.values())
 
     def should_not_match(self, left_value=None):
         self.check_left_value(left_value)
-        self._non_present_keys  = set(self.right_value) - set(left_value.values())
-        self._present_keys      = set(self.right_value) - self._non_present_keys
-
-        return (len(self._present_keys) == 0)
+        return not self._includes_any(left_value.values())
     
     def check_left_value(self, left_value):
         if type(left_value) is not dict:
@@ -598,45 +1286,80 @@ class include_values(matcher):
 
 
     def message_for_failed_should(self, left):
-        r = utils.keys_in_phrase(self._non_present_keys, "value")
-        raise Should_NotSatisfied("expected target to include {}".format(r))
+        r = utils.lazy(utils.keys_in_phrase, self._missing(left.values()), "value")
+        raise Should_NotSatisfied(utils.message("expected target to include {}", r))
 
     def message_for_failed_should_not(self, left):
-        r = utils.keys_in_phrase(self._present_keys, "value")
-        raise ShouldNot_NotSatisfied("expected target to not include {}".format(r))
+        r = utils.lazy(utils.keys_in_phrase, self._found(left.values()), "value")
+        raise ShouldNot_NotSatisfied(utils.message("expected target to not include {}", r))
 
 class respond_to(matcher):
     '''Checks if an object has a given attribute or method.'''
 
+    __slots__ = ()
+
     def should_match(self, left_value=None):
         return hasattr(left_value, self.right_value)
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected {} to respond to '{}'".format(left, self.right_value))
+        raise Should_NotSatisfied(utils.message("expected {} to respond to '{}'", left, self.right_value))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected {} not to respond to '{}'".format(left, self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("expected {} not to respond to '{}'", left, self.right_value))
+
+def _attribute_report(differences):
+    lines = []
+    for name, left_attribute, right_attribute in differences[:utils.MAX_ITEMS]:
+        if left_attribute is utils.NOT_SET:
+            lines.append("{}: missing, expected {}".format(name, utils.shorten(right_attribute, True)))
+        elif right_attribute is utils.NOT_SET:
+            lines.append("{}: unexpected {}".format(name, utils.shorten(left_attribute, True)))
+        else:
+            lines.append("{}: expected {}, got {}".format(name, utils.shorten(right_attribute, True),
+                utils.shorten(left_attribute, True)))
+    if len(differences) > utils.MAX_ITEMS:
+        lines.append("...({} more)".format(len(differences) - utils.MAX_ITEMS))
+    if len(lines) == 1:
+        return ", but attribute " + lines[0]
+    return ", but {} attributes differ:\n  {}".format(len(differences), "\n  ".join(lines))
 
 class have_same_attribute_values_as(matcher):
-    '''Verifies if an object have the same attribute values as another one.'''
-
-    def should_match(self, left_value=None):
-        found_different_attribute = False
+    '''Verifies if an object have the same attribute values as another one.
+    Attributes kept in *__dict__*, declared through *__slots__* or listed in *_fields* are compared, whichever
+    object they are set on. The check stops at the first different attribute, unless *full_report* is set, in which
+    case the failure message lists all of them.'''
 
-        for key in self.right_value.__dict__.keys():
-            got = left_value.__dict__.get(key)
-            expected =  self.right_value.__dict__.get(key)
-            if got != expected:
-                found_different_attribute = True
-                break
+    __slots__ = ('full_report',)
 
-        return found_different_attribute == False
+    def __init__(self, right_value, full_report=False):
+        self.right_value = right_value
+        self.full_report = full_report
 
-    def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected {} to have the same attribute values as {}".format(self.right_value, left))
+    def should_match(self, left_value=None):
+        right_value = self.right_value
+        right_class = type(right_value)
+        if type(left_value) is right_class and not utils.attribute_plan(right_class):
+            # Most objects only have a __dict__, compared at once.
+            left_dict = getattr(left_value, '__dict__', None)
+            if left_dict is not None and left_dict == getattr(right_value, '__dict__', None):
+                return True
+        differences = utils.attribute_differences(left_value, right_value)
+        if self.full_report:
+            differences = list(differences)
+            return utils.unmatched(differences) if differences else True
+        for difference in differences:
+            return utils.unmatched((difference,))
+        return True
+
+    def message_for_failed_should(self, left, differences=None):
+        if differences is None:
+            outcome = self.should_match(left)
+            differences = outcome.details if outcome is not True else ()
+        raise Should_NotSatisfied(utils.message("expected {} to have the same attribute values as {}{}", self.right_value, left,
+            utils.lazy(_attribute_report, differences)))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected {} to have not the same attribute values as {}".format(self.right_value, left))
+        raise ShouldNot_NotSatisfied(utils.message("expected {} to have not the same attribute values as {}", self.right_value, left))
 
 
 be_empty = _be_empty(None)
@@ -645,35 +1368,47 @@ class have_at_least(have):
     '''The same as *have*, but checking if the element count is greater than or equal to the given value.
     Works for collections with syntax sugar, object attributes, or methods.'''
 
+    __slots__ = ()
+
+    def _count_limit(self):
+        return self.right_value
+
     def _compare(self):
-        return self.right_value <= len(self._collection)
+        return self._count >= self.right_value
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected %r %r, got %r" % (self.right_value,
-            self._humanized_collection_name, len(self._collection)))
+        raise Should_NotSatisfied(utils.message("expected {!r} {!r}, got {!r}", self.right_value,
+            self._humanized_collection_name, self._count))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected target not to have at least %d %r, got %r" % (
+        raise ShouldNot_NotSatisfied(utils.message("expected target not to have at least {} {!r}, got {!r}",
             self.right_value,
-            self._humanized_collection_name, len(self._collection)))
+            self._humanized_collection_name, self._count))
 
 class have_at_most(have):
     '''The same as *have*, but checking if the element count is less than or equal to the given value.
     Works for collections with syntax sugar, object attributes, or methods.'''
 
+    __slots__ = ()
+
+    def _count_limit(self):
+        return self.right_value + 1
+
     def _compare(self):
-        return self.right_value >= len(self._collection)
+        return self._count <= self.right_value
 
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied("expected %r %r, got %r" % (self.right_value,
-            self._humanized_collection_name, len(self._collection)))
+        raise Should_NotSatisfied(utils.message("expected {!r} {!r}, got {!r}", self.right_value,
+            self._humanized_collection_name, self._count))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied("expected target not to have at most %d %r, got %r" % (
+        raise ShouldNot_NotSatisfied(utils.message("expected target not to have at most {} {!r}, got {!r}",
             self.right_value,
-            self._humanized_collection_name, len(self._collection)))
+            self._humanized_collection_name, self._count))
 
 class simple_matcher(matcher):
+    __slots__ = ('custom',)
+
     def __init__(self, right_value):
         self.right_value = right_value
         self.custom = self.matcher()
@@ -682,7 +1417,340 @@ class simple_matcher(matcher):
         return self.custom[0](left_value, self.right_value)
     
     def message_for_failed_should(self, left):
-        raise Should_NotSatisfied(self.custom[1] % (left, 'not ', self.right_value))
+        raise Should_NotSatisfied(utils.message("{}", utils.lazy(self._render, left, 'not ')))
 
     def message_for_failed_should_not(self, left):
-        raise ShouldNot_NotSatisfied(self.custom[1] % (left, '', self.right_value))
+        raise ShouldNot_NotSatisfied(utils.message("{}", utils.lazy(self._render, left, '')))
+
+    def _render(self, left, negation):
+        try:
+            return self.custom[1] % (utils.bounded(left), negation, utils.bounded(self.right_value))
+        except TypeError:
+            # placeholders like '%d' need the values themselves
+            return self.custom[1] % (left, negation, self.right_value)
+
+def _children_report(messages):
+    return "\n".join(["  - {}".format(message) for message in messages])
+
+class _combinator(matcher):
+    '''Base for matchers combining others over the same left value. The children are kept as a tuple in *right_value*
+    and evaluated in order, stopping as soon as the outcome is known.'''
+
+    __slots__ = ()
+
+    # Combinators whose children are merged into this one when nested in it, e.g. all_of(all_of(a, b), c)
+    # becomes all_of(a, b, c).
+    _flattens = ()
+
+    def __init__(self, *matchers):
+        children = []
+        for child in matchers:
+            if type(child) in self._flattens:
+                children.extend(child.right_value)
+            else:
+                children.append(child)
+        self.right_value = tuple(children)
+
+    # Both return the failed children with their outcomes, as (child, outcome) pairs, when they don't hold.
+
+    def _all_hold(self, left_value, positive):
+        for child in self.right_value:
+            outcome = child.should_match(left_value) if positive else child.should_not_match(left_value)
+            if not outcome:
+                return utils.unmatched(((child, outcome),))
+        return True
+
+    def _any_holds(self, left_value, positive):
+        failed = []
+        for child in self.right_value:
+            outcome = child.should_match(left_value) if positive else child.should_not_match(left_value)
+            if outcome:
+                return True
+            failed.append((child, outcome))
+        return utils.unmatched(failed)
+
+    def _failure(self, exception, template, left, positive, failed, holds):
+        if failed is None:
+            failed = holds(left, positive).details
+        # The children messages are collected right away, as they may depend on the state of their last evaluation.
+        messages = [utils.failure_message(
+            child.message_for_failed_should if positive else child.message_for_failed_should_not, left, outcome)
+            for child, outcome in failed]
+        raise exception(utils.message(template + ":\n{}", left, len(self.right_value), len(messages),
+            utils.lazy(_children_report, messages)))
+
+class all_of(_combinator):
+    '''Checks that the value satisfies every given matcher. With `should_not`, that it fails at least one of them.'''
+
+    __slots__ = ()
+
+    def should_match(self, left_value=None):
+        return self._all_hold(left_value, True)
+
+    def should_not_match(self, left_value=None):
+        return self._any_holds(left_value, False)
+
+    def message_for_failed_should(self, left, failed=None):
+        self._failure(Should_NotSatisfied, "expected '{}' to satisfy all of {} matchers, but {} failed", left,
+            True, failed, self._all_hold)
+
+    def message_for_failed_should_not(self, left, failed=None):
+        self._failure(ShouldNot_NotSatisfied, "expected '{}' not to satisfy all of {} matchers, but {} did", left,
+            False, failed, self._any_holds)
+
+class any_of(_combinator):
+    '''Checks that the value satisfies at least one of the given matchers. With `should_not`, that it fails all of them.'''
+
+    __slots__ = ()
+
+    def should_match(self, left_value=None):
+        return self._any_holds(left_value, True)
+
+    def should_not_match(self, left_value=None):
+        return self._all_hold(left_value, False)
+
+    def message_for_failed_should(self, left, failed=None):
+        self._failure(Should_NotSatisfied, "expected '{}' to satisfy any of {} matchers, but {} failed", left,
+            True, failed, self._any_holds)
+
+    def message_for_failed_should_not(self, left, failed=None):
+        self._failure(ShouldNot_NotSatisfied, "expected '{}' not to satisfy any of {} matchers, but {} did", left,
+            False, failed, self._all_hold)
+
+class none_of(_combinator):
+    '''Checks that the value satisfies none of the given matchers (each of them as with `should_not`). With `should_not`,
+    that it satisfies at least one of them.'''
+
+    __slots__ = ()
+
+    def should_match(self, left_value=None):
+        return self._all_hold(left_value, False)
+
+    def should_not_match(self, left_value=None):
+        return self._any_holds(left_value, True)
+
+    def message_for_failed_should(self, left, failed=None):
+        self._failure(Should_NotSatisfied, "expected '{}' to satisfy none of {} matchers, but {} did", left,
+            False, failed, self._all_hold)
+
+    def message_for_failed_should_not(self, left, failed=None):
+        self._failure(ShouldNot_NotSatisfied, "expected '{}' to satisfy some of {} matchers, but {} failed", left,
+            True, failed, self._any_holds)
+
+all_of._flattens = (all_of,)
+any_of._flattens = (any_of,)
+none_of._flattens = (any_of,)
+
+class eventually(matcher):
+    '''Polls a callable until the values it returns satisfy a matcher, or until *timeout_ms* run out. With
+    `should_not`, it checks that they never do: it polls until the timeout, and fails as soon as one of them does.
+    The callable is called again after *interval_ms*, which grows by a factor of *backoff* after each attempt, up to
+    *max_interval_ms*. It sleeps in between, or awaits with `should_async`, where the callable can also be a
+    coroutine function.'''
+
+    __slots__ = ('timeout_ms', 'interval_ms', 'backoff', 'max_interval_ms')
+
+    def __init__(self, matcher, timeout_ms=1000, interval_ms=10, backoff=2, max_interval_ms=None):
+        if interval_ms <= 0 or backoff < 1:
+            raise ValueError("eventually needs a positive interval_ms and a backoff of at least 1")
+        self.right_value = matcher
+        self.timeout_ms = timeout_ms
+        self.interval_ms = interval_ms
+        self.backoff = backoff
+        self.max_interval_ms = max_interval_ms
+
+    def should_match(self, left_value=None):
+        return self._poll(left_value, True)
+
+    def should_not_match(self, left_value=None):
+        return self._poll(left_value, False)
+
+    async def should_match_async(self, left_value=None):
+        return await self._poll_async(left_value, True)
+
+    async def should_not_match_async(self, left_value=None):
+        return await self._poll_async(left_value, False)
+
+    def _poll(self, left_value, positive):
+        function = self._function(left_value)
+        start = utils.ticks_ms()
+        interval = self.interval_ms
+        attempts = 1
+        while True:
+            observed = utils.not_awaitable(function())
+            delay, outcome = self._attempt(observed, positive, start, interval, attempts)
+            if delay is None:
+                return outcome
+            utils.sleep_ms(delay)
+            interval = self._grown(interval)
+            attempts += 1
+
+    async def _poll_async(self, left_value, positive):
+        function = self._function(left_value)
+        start = utils.ticks_ms()
+        interval = self.interval_ms
+        attempts = 1
+        while True:
+            observed = await utils.awaited(function())
+            delay, outcome = self._attempt(observed, positive, start, interval, attempts)
+            if delay is None:
+                return outcome
+            await asyncio.sleep(delay / 1000)
+            interval = self._grown(interval)
+            attempts += 1
+
+    def _function(self, left_value):
+        if type(left_value) is tuple:
+            return lambda: left_value[0](*left_value[1:])
+        return left_value
+
+    def _attempt(self, observed, positive, start, interval, attempts):
+        '''Returns how long to wait before the next attempt, or None and the outcome when polling is over: when the
+        observed value satisfies the matcher, or when the time is up.'''
+        held = self.right_value.should_match(observed)
+        elapsed_ms = utils.ticks_diff(utils.ticks_ms(), start)
+        remaining = self.timeout_ms - elapsed_ms
+        if not held and remaining > 0:
+            return min(interval, remaining), None
+        if bool(held) == positive:
+            return None, True
+        return None, utils.unmatched((attempts, elapsed_ms, observed, held))
+
+    def _grown(self, interval):
+        interval *= self.backoff
+        if self.max_interval_ms is not None and interval > self.max_interval_ms:
+            return self.max_interval_ms
+        return interval
+
+    def message_for_failed_should(self, left, details=None):
+        template = "expected '{}' to eventually satisfy the matcher within {} ms"
+        if details is None:
+            # Polling again would take as long as the expectation did.
+            raise Should_NotSatisfied(utils.message(template + ".", left, self.timeout_ms))
+        attempts, elapsed_ms, observed, held = details
+        last_message = utils.failure_message(self.right_value.message_for_failed_should, observed, held)
+        raise Should_NotSatisfied(utils.message(template + ", but the last of {} attempts, after {} ms, got '{}': {}",
+            left, self.timeout_ms, attempts, elapsed_ms, observed, last_message))
+
+    def message_for_failed_should_not(self, left, details=None):
+        template = "expected '{}' never to satisfy the matcher within {} ms"
+        if details is None:
+            raise ShouldNot_NotSatisfied(utils.message(template + ".", left, self.timeout_ms))
+        attempts, elapsed_ms, observed, held = details
+        last_message = utils.failure_message(self.right_value.message_for_failed_should_not, observed)
+        raise ShouldNot_NotSatisfied(utils.message(template + ", but attempt {}, after {} ms, got '{}': {}", left,
+            self.timeout_ms, attempts, elapsed_ms, observed, last_message))
+
+MEDIAN = 'median'
+P95 = 'p95'
+
+_STATISTICS = {MEDIAN: 0.5, P95: 0.95}
+
+def _distribution(samples, scale, unit):
+    measures = [samples[0], utils.percentile(samples, 0.5), utils.percentile(samples, 0.95), samples[-1]]
+    if scale != 1:
+        measures = [measure / scale for measure in measures]
+    return "min {1} {0}, median {2} {0}, p95 {3} {0}, max {4} {0}, over {5} runs".format(unit, *(measures +
+        [len(samples)]))
+
+class _budget_matcher(matcher):
+    '''Base for matchers measuring a callable over several runs, after some warmup runs, and comparing a statistic
+    of the measures (the median or the 95th percentile) with a budget. Like with `throw`, a function with
+    parameters can be given as a tuple.'''
+
+    __slots__ = ('repeat', 'warmup', 'statistic')
+
+    def __init__(self, right_value, repeat, warmup, statistic):
+        if statistic not in _STATISTICS:
+            raise ValueError("unknown statistic '{}', use MEDIAN or P95".format(statistic))
+        if repeat < 1:
+            raise ValueError("repeat must be at least 1")
+        self.right_value = right_value
+        self.repeat = repeat
+        self.warmup = warmup
+        self.statistic = statistic
+
+    def _evaluate(self, left_value):
+        '''Returns the sorted measures and the statistic observed.'''
+        function = self._to_callable(left_value)
+        for _ in range(self.warmup):
+            utils.not_awaitable(function())
+        samples = sorted(self._measure(function))
+        return samples, utils.percentile(samples, _STATISTICS[self.statistic])
+
+    def should_match(self, left_value=None):
+        measures = self._evaluate(left_value)
+        return True if measures[1] < self.right_value else utils.unmatched(measures)
+
+    def should_not_match(self, left_value=None):
+        measures = self._evaluate(left_value)
+        return True if measures[1] >= self.right_value else utils.unmatched(measures)
+
+    def _measure(self, function):
+        raise NotImplementedError()
+
+    def _to_callable(self, obj):
+        if callable(obj):
+            return obj
+        if utils.is_iterable(obj) and len(obj) >= 1 and callable(obj[0]):
+            return lambda: obj[0](*obj[1:])
+        raise TypeError('parameter passed to {} must be a callable or an iterable having a callable as its first '
+            'element'.format(type(self).__name__))
+
+    def _failure(self, exception, template, left, measures, scale, unit):
+        samples, observed = measures or self._evaluate(left)
+        budget = self.right_value
+        if scale != 1:
+            budget /= scale
+            observed /= scale
+        raise exception(utils.message(template, left, budget, self.statistic, observed,
+            utils.lazy(_distribution, samples, scale, unit)))
+
+class run_faster_than(_budget_matcher):
+    '''Checks that a callable runs faster than a time budget, in milliseconds (*ms*) or microseconds (*us*), over
+    *repeat* runs following *warmup* runs.'''
+
+    __slots__ = ()
+
+    def __init__(self, ms=None, us=None, repeat=10, warmup=1, statistic=MEDIAN):
+        if (ms is None) == (us is None):
+            raise TypeError("run_faster_than takes either ms or us")
+        _budget_matcher.__init__(self, us if ms is None else ms * 1000, repeat, warmup, statistic)
+
+    def _measure(self, function):
+        samples = []
+        for _ in range(self.repeat):
+            start = utils.ticks_us()
+            result = function()
+            samples.append(utils.ticks_diff(utils.ticks_us(), start))
+            utils.not_awaitable(result)
+        return samples
+
+    def message_for_failed_should(self, left, measures=None):
+        self._failure(Should_NotSatisfied, "expected {} to run faster than {} ms ({}), got {} ms ({})", left,
+            measures, 1000, 'ms')
+
+    def message_for_failed_should_not(self, left, measures=None):
+        self._failure(ShouldNot_NotSatisfied, "expected {} not to run faster than {} ms ({}), got {} ms ({})", left,
+            measures, 1000, 'ms')
+
+class allocate_less_than(_budget_matcher):
+    '''Checks that a callable allocates less memory than a budget, in bytes, over *repeat* runs following *warmup*
+    runs. Memory is measured with `gc.mem_alloc()` on MicroPython and `tracemalloc` on CPython, where it's the peak
+    of memory in use during each run.'''
+
+    __slots__ = ()
+
+    def __init__(self, bytes, repeat=10, warmup=1, statistic=MEDIAN):
+        _budget_matcher.__init__(self, bytes, repeat, warmup, statistic)
+
+    def _measure(self, function):
+        return utils.allocation_samples(function, self.repeat)
+
+    def message_for_failed_should(self, left, measures=None):
+        self._failure(Should_NotSatisfied, "expected {} to allocate less than {} bytes ({}), got {} bytes ({})", left,
+            measures, 1, 'bytes')
+
+    def message_for_failed_should_not(self, left, measures=None):
+        self._failure(ShouldNot_NotSatisfied, "expected {} not to allocate less than {} bytes ({}), got {} bytes ({})",
+            left, measures, 1, 'bytes')
@@ -0,0 +1,262 @@
+'''
+Test runner for suites written with uShould-DSL, for both MicroPython and CPython.
+
+Tests are discovered in the given modules: methods starting with *test_* of the (public) classes defined there,
+and functions starting with *test_*. Each test method runs on a new instance of its class, after its *set_up*
+method (and before its *tear_down* method), if they exist. A failing test doesn't stop the run.
+
+    python -m ushould_dsl.runner tests other_tests --slowest 10 --processes 4
+'''
+from .exceptions import Should_NotSatisfied, ShouldNot_NotSatisfied, Expectations_NotSatisfied
+from . import utils, snapshots
+import sys
+
+PASSED = 'ok'
+FAILED = 'FAIL'
+ERROR = 'ERROR'
+
+_FAILURES = (Should_NotSatisfied, ShouldNot_NotSatisfied, Expectations_NotSatisfied, AssertionError)
+
+class TestResult:
+    '''Outcome of a single test. *elapsed_us* is the time spent by the test itself, in microseconds.'''
+
+    __slots__ = ('test_id', 'status', 'elapsed_us', 'details')
+
+    def __init__(self, test_id, status, elapsed_us, details=None):
+        self.test_id = test_id
+        self.status = status
+        self.elapsed_us = elapsed_us
+        self.details = details
+
+    def __getstate__(self):
+        return (self.test_id, self.status, self.elapsed_us, self.details)
+
+    def __setstate__(self, state):
+        self.test_id, self.status, self.elapsed_us, self.details = state
+
+def _is_test_class(obj, module_name):
+    if not utils.isclass(obj) or getattr(obj, '__module__', module_name) != module_name:
+        return False
+    return any(name.startswith('test_') for name in dir(obj))
+
+def discover(modules):
+    '''
+        Finds the tests of the given modules.
+
+        Parameters
+        ----------
+        first : list
+            modules, or their names.
+
+        Returns
+        -------
+        list
+            the test ids ('module.Class.test_name' or 'module.test_name'), in a deterministic order.
+    '''
+    test_ids = []
+    for module in modules:
+        if isinstance(module, str):
+            module = _import(module)
+        module_name = module.__name__
+        for name in sorted(dir(module)):
+            if name.startswith('_'):
+                continue
+            obj = getattr(module, name)
+            if name.startswith('test_') and utils.isfunction(obj):
+                test_ids.append('{}.{}'.format(module_name, name))
+            elif _is_test_class(obj, module_name):
+                for method_name in sorted(dir(obj)):
+                    if method_name.startswith('test_') and utils.isfunction(getattr(obj, method_name)):
+                        test_ids.append('{}.{}.{}'.format(module_name, name, method_name))
+    return test_ids
+
+def _import(module_name):
+    module = sys.modules.get(module_name)
+    if module is None:
+        module = __import__(module_name)
+        for part in module_name.split('.')[1:]:
+            module = getattr(module, part)
+    return module
+
+def _resolve(test_id):
+    '''Returns the test function and its class (or None), from a test id.'''
+    parts = test_id.split('.')
+    for length in range(len(parts) - 1, 0, -1):
+        module_name = '.'.join(parts[:length])
+        try:
+            obj = _import(module_name)
+        except ImportError:
+            continue
+        owner = None
+        for part in parts[length:]:
+            owner = obj
+            obj = getattr(obj, part)
+        return obj, owner if utils.isclass(owner) else None
+    raise ImportError("can't find test '{}'".format(test_id))
+
+def _format_exception(exception):
+    try:
+        import traceback
+        return ''.join(traceback.format_exception(type(exception), exception, exception.__traceback__))
+    except (ImportError, AttributeError):
+        pass
+    try:
+        import io
+        output = io.StringIO()
+        sys.print_exception(exception, output)
+        return output.getvalue()
+    except (ImportError, AttributeError):
+        return '{}: {}\n'.format(type(exception).__name__, exception)
+
+def run_test(test_id):
+    '''
+        Runs a single test, catching its failure.
+
+        Returns
+        -------
+        TestResult
+            the outcome of the test.
+    '''
+    try:
+        function, test_class = _resolve(test_id)
+        if test_class is not None:
+            instance = test_class()
+            set_up = getattr(instance, 'set_up', None)
+            tear_down = getattr(instance, 'tear_down', None)
+            test = getattr(instance, function.__name__)
+        else:
+            set_up = tear_down = None
+            test = function
+    except Exception as exception:
+        return TestResult(test_id, ERROR, 0, _format_exception(exception))
+
+    status = PASSED
+    details = None
+    start = utils.ticks_us()
+    try:
+        if set_up is not None:
+            set_up()
+        try:
+            test()
+        finally:
+            if tear_down is not None:
+                tear_down()
+    except _FAILURES as exception:
+        status = FAILED
+        details = _format_exception(exception)
+    except Exception as exception:
+        status = ERROR
+        details = _format_exception(exception)
+    elapsed_us = utils.ticks_diff(utils.ticks_us(), start)
+    return TestResult(test_id, status, elapsed_us, details)
+
+def _run_in_processes(test_ids, processes):
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+    except ImportError:
+        return None
+    with ProcessPoolExecutor(max_workers=processes or None) as executor:
+        # map() yields the results in the order of test_ids, whichever process finishes first.
+        return list(executor.map(run_test, test_ids))
+
+def run(modules, slowest=5, processes=1, verbose=False, stream=None):
+    '''
+        Discovers and runs the tests of the given modules, printing a report.
+
+        Parameters
+        ----------
+        modules : list
+            modules, or their names.
+        slowest : int
+            how many of the slowest tests are listed in the report.
+        processes : int
+            how many processes run tests in parallel, where *concurrent.futures* is available (CPython).
+            1 runs them in the current process, 0 uses one process per CPU.
+        verbose : bool
+            prints a line per test instead of a character.
+
+        Returns
+        -------
+        list
+            the TestResult of every test, in the order they were discovered.
+    '''
+    write = (stream or sys.stdout).write
+    test_ids = discover(modules)
+
+    start = utils.ticks_us()
+    results = None
+    if processes != 1 and len(test_ids) > 1:
+        results = _run_in_processes(test_ids, processes)
+        if results is not None:
+            for result in results:
+                _report_progress(write, result, verbose)
+    if results is None:
+        results = []
+        for test_id in test_ids:
+            result = run_test(test_id)
+            _report_progress(write, result, verbose)
+            results.append(result)
+    elapsed_us = utils.ticks_diff(utils.ticks_us(), start)
+    # Writes the index of the snapshots recorded by the tests, so the next run doesn't read their records.
+    snapshots.close_default_store()
+
+    _report(write, results, elapsed_us, slowest)
+    return results
+
+def _report_progress(write, result, verbose):
+    if verbose:
+        write("{} ... {}\n".format(result.test_id, result.status))
+    else:
+        write({PASSED: '.', FAILED: 'F', ERROR: 'E'}[result.status])
+
+def _report(write, results, elapsed_us, slowest):
+    separator = "----------------------------------------------------------------------\n"
+    write("\n")
+    for result in results:
+        if result.status != PASSED:
+            write("======================================================================\n")
+            write("{}: {}\n".format(result.status, result.test_id))
+            write(separator)
+            write(result.details)
+
+    if slowest and results:
+        write(separator)
+        write("Slowest {} tests:\n".format(min(slowest, len(results))))
+        by_time = sorted(results, key=lambda result: result.elapsed_us, reverse=True)
+        for result in by_time[:slowest]:
+            write("  {:>10.3f}ms  {}\n".format(result.elapsed_us / 1000, result.test_id))
+
+    failures = len([result for result in results if result.status == FAILED])
+    errors = len([result for result in results if result.status == ERROR])
+    write(separator)
+    write("Ran {} tests in {:.3f}s\n".format(len(results), elapsed_us / 1000000))
+    if failures or errors:
+        write("\nFAILED (failures={}, errors={})\n".format(failures, errors))
+    else:
+        write("\nOK\n")
+
+def main(args):
+    modules = []
+    slowest = 5
+    processes = 1
+    verbose = False
+
+    args = list(args)
+    while args:
+        option = args.pop(0)
+        if option == '--slowest':
+            slowest = int(args.pop(0))
+        elif option == '--processes':
+            processes = int(args.pop(0))
+        elif option in ('-v', '--verbose'):
+            verbose = True
+        else:
+            modules.append(option)
+
+    results = run(modules, slowest=slowest, processes=processes, verbose=verbose)
+    return 0 if all(result.status == PASSED for result in results) else 1
+
+if __name__ == '__main__':
+    if '' not in sys.path:
+        sys.path.insert(0, '')
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,391 @@
+'''
+Schemas checked by `conform_to`, for both MicroPython and CPython.
+
+A schema is declared with plain values, compiled once into a tree of checks by `Schema`:
+
+    Schema({
+        'id': int,                                  # a key holding a value of the given type(s)
+        'name': matching('[a-z_]+$'),               # a string matching a regular expression
+        optional('score'): in_range(0, 100),        # a key that may be missing, holding a number in a range
+        'state': one_of('on', 'off'),               # one of the given values
+        'parent': nullable(int),                    # None, or what the inner schema accepts
+        'readings': [{'at': int, 'value': float}],  # a list of elements conforming to the inner schema
+        'tags': list_of(str, max_length=8),         # ... with bounds on its length
+        'meta': record({'v': int}, extra=False),    # a dictionary with no other keys than the declared ones
+    })
+
+Payloads are then walked in a single iterative pass, so deep payloads don't exhaust the stack, and every violation
+is reported with its path.
+'''
+from . import utils
+
+class optional:
+    '''Declares a key of a record that may be missing.'''
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+class nullable:
+    '''Accepts None, besides the values accepted by the given schema.'''
+
+    __slots__ = ('schema',)
+
+    def __init__(self, schema):
+        self.schema = schema
+
+class record:
+    '''A dictionary with the given keys (see `optional`). Other keys are accepted unless *extra* is False.'''
+
+    __slots__ = ('fields', 'extra')
+
+    def __init__(self, fields, extra=True):
+        self.fields = fields
+        self.extra = extra
+
+class list_of:
+    '''A list (or tuple) of elements conforming to the given schema, and of a length within the given bounds.'''
+
+    __slots__ = ('schema', 'min_length', 'max_length')
+
+    def __init__(self, schema, min_length=None, max_length=None):
+        self.schema = schema
+        self.min_length = min_length
+        self.max_length = max_length
+
+class in_range:
+    '''A number (of the given *types*) between *minimum* and *maximum*, inclusive.'''
+
+    __slots__ = ('minimum', 'maximum', 'types')
+
+    def __init__(self, minimum=None, maximum=None, types=(int, float)):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.types = types
+
+class matching:
+    '''A string matching a regular expression from its start, like `be_like`.'''
+
+    __slots__ = ('pattern',)
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+class one_of:
+    '''One of the given values.'''
+
+    __slots__ = ('choices',)
+
+    def __init__(self, *choices):
+        self.choices = choices
+
+# Kinds of the compiled checks. The containers come last, so that `kind >= _RECORD` tells them apart.
+_TYPE = 0
+_RANGE = 1
+_PATTERN = 2
+_CHOICE = 3
+_RECORD = 4
+_LIST = 5
+
+_SEQUENCES = (list, tuple)
+
+# Stands for the value of a missing key, in the violations.
+MISSING = object()
+
+def _type_names(types):
+    return ' or '.join([kind.__name__ for kind in types])
+
+class _check:
+    '''
+        A compiled check. Values of a type in *exact* conform to it without calling `conforms`, which is how most
+        values of a valid payload are checked.
+    '''
+
+    __slots__ = ('kind', 'exact', 'nullable')
+
+    def __init__(self, kind, exact=()):
+        self.kind = kind
+        self.exact = exact
+        self.nullable = False
+
+class _type_check(_check):
+    __slots__ = ('types', 'bool_excluded')
+
+    def __init__(self, types):
+        self.types = types
+        # bool is a subclass of int, but True isn't a valid int in a JSON-like payload.
+        self.bool_excluded = int in types and bool not in types
+        _check.__init__(self, _TYPE, tuple([kind for kind in types if kind is not object]))
+
+    def conforms(self, input_value):
+        if input_value is None and self.nullable:
+            return True
+        if self.bool_excluded and isinstance(input_value, bool):
+            return False
+        return isinstance(input_value, self.types)
+
+    def describe(self, input_value):
+        return "expected {}, got {}".format(_type_names(self.types), utils.shorten(input_value, True))
+
+class _range_check(_check):
+    __slots__ = ('minimum', 'maximum', 'types')
+
+    def __init__(self, spec):
+        self.minimum = spec.minimum
+        self.maximum = spec.maximum
+        self.types = spec.types
+        _check.__init__(self, _RANGE)
+
+    def conforms(self, input_value):
+        if input_value is None and self.nullable:
+            return True
+        if not isinstance(input_value, self.types) or isinstance(input_value, bool):
+            return False
+        return (self.minimum is None or input_value >= self.minimum) and \
+            (self.maximum is None or input_value <= self.maximum)
+
+    def describe(self, input_value):
+        if self.maximum is None:
+            bounds = "at least {}".format(self.minimum)
+        elif self.minimum is None:
+            bounds = "at most {}".format(self.maximum)
+        else:
+            bounds = "between {} and {}".format(self.minimum, self.maximum)
+        return "expected {} {}, got {}".format(_type_names(self.types), bounds, utils.shorten(input_value, True))
+
+class _pattern_check(_check):
+    __slots__ = ('pattern', 'source')
+
+    def __init__(self, spec):
+        self.pattern = utils.compile_pattern(spec.pattern)
+        self.source = utils.pattern_source(spec.pattern)
+        _check.__init__(self, _PATTERN)
+
+    def conforms(self, input_value):
+        if input_value is None and self.nullable:
+            return True
+        return isinstance(input_value, str) and self.pattern.match(input_value) is not None
+
+    def describe(self, input_value):
+        return "expected a string like {}, got {}".format(utils.shorten(self.source, True),
+            utils.shorten(input_value, True))
+
+class _choice_check(_check):
+    __slots__ = ('choices',)
+
+    def __init__(self, spec):
+        self.choices = spec.choices
+        _check.__init__(self, _CHOICE)
+
+    def conforms(self, input_value):
+        if input_value is None and self.nullable:
+            return True
+        return input_value in self.choices
+
+    def describe(self, input_value):
+        return "expected one of {}, got {}".format(utils.shorten(list(self.choices)),
+            utils.shorten(input_value, True))
+
+class _record_check(_check):
+    __slots__ = ('fields', 'keys', 'extra')
+
+    def __init__(self, spec):
+        # (key, check, required) triples, holding the schemas of the fields until `_compile` replaces them.
+        self.fields = tuple([
+            (key.key, schema, False) if isinstance(key, optional) else (key, schema, True)
+            for key, schema in spec.fields.items()
+        ])
+        self.keys = frozenset([field[0] for field in self.fields])
+        self.extra = spec.extra
+        _check.__init__(self, _RECORD)
+
+    def describe(self, input_value):
+        if input_value is MISSING:
+            return "missing"
+        return "expected a dictionary, got {}".format(utils.shorten(input_value, True))
+
+class _list_check(_check):
+    __slots__ = ('item', 'min_length', 'max_length')
+
+    def __init__(self, spec):
+        self.item = spec.schema
+        self.min_length = spec.min_length
+        self.max_length = spec.max_length
+        _check.__init__(self, _LIST)
+
+    def describe(self, input_value):
+        if not isinstance(input_value, _SEQUENCES):
+            return "expected a list, got {}".format(utils.shorten(input_value, True))
+        if self.min_length is not None and len(input_value) < self.min_length:
+            return "expected at least {} elements, got {}".format(self.min_length, len(input_value))
+        return "expected at most {} elements, got {}".format(self.max_length, len(input_value))
+
+def _compile(spec):
+    # The tree is built level by level, so nested schemas don't exhaust the stack either.
+    root = _compile_node(spec)
+    pending = [root]
+    while pending:
+        check = pending.pop()
+        if check.kind == _RECORD:
+            check.fields = tuple([(key, _compile_node(schema), required) for key, schema, required in check.fields])
+            pending.extend([field for key, field, required in check.fields if field.kind >= _RECORD])
+        elif check.kind == _LIST:
+            check.item = _compile_node(check.item)
+            if check.item.kind >= _RECORD:
+                pending.append(check.item)
+    return root
+
+def _compile_node(spec):
+    if isinstance(spec, nullable):
+        check = _compile_node(spec.schema)
+        check.nullable = True
+        return check
+    if isinstance(spec, dict):
+        return _record_check(record(spec))
+    if isinstance(spec, list):
+        if len(spec) != 1:
+            raise ValueError("a list in a schema must hold the schema of its elements, got {}".format(spec))
+        return _list_check(list_of(spec[0]))
+    if utils.isclass(spec):
+        return _type_check((spec,))
+    if isinstance(spec, tuple) and spec and all([utils.isclass(kind) for kind in spec]):
+        return _type_check(spec)
+    if isinstance(spec, record):
+        return _record_check(spec)
+    if isinstance(spec, list_of):
+        return _list_check(spec)
+    if isinstance(spec, in_range):
+        return _range_check(spec)
+    if isinstance(spec, matching):
+        return _pattern_check(spec)
+    if isinstance(spec, one_of):
+        return _choice_check(spec)
+    raise TypeError("unsupported schema: {}".format(utils.shorten(spec, True)))
+
+def _elements(check, elements, path):
+    index = 0
+    for element in elements:
+        yield check, element, (path, index)
+        index += 1
+
+class Schema:
+    '''
+        A schema (see the module), compiled once to validate any number of payloads.
+    '''
+
+    __slots__ = ('spec', '_root')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._root = _compile(spec)
+
+    def violations(self, payload, limit=None):
+        '''
+            Validates a payload.
+
+            Parameters
+            ----------
+            first : object
+                the payload, e.g. decoded from JSON.
+            second : int
+                stops after that many violations, if given.
+
+            Returns
+            -------
+            list
+                the violations, as (path, check, value) triples in the order of the payload, where path is given
+                to `utils.render_path`, value is MISSING for a missing key, and check is None for an unexpected key.
+                `describe` turns them into text.
+        '''
+        found = []
+        report = found.append
+        # Each entry iterates over the (check, value, path) triples of the containers still to be walked; paths
+        # are (parent, key) pairs, only turned into text for the violations reported.
+        stack = [iter(((self._root, payload, None),))]
+        while stack:
+            try:
+                check, input_value, path = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+
+            kind = check.kind
+            if kind == _RECORD:
+                if type(input_value) is not dict and not isinstance(input_value, dict):
+                    if input_value is not None or not check.nullable:
+                        report((path, check, input_value))
+                    continue
+                nested = None
+                present = 0
+                for key, field, required in check.fields:
+                    try:
+                        item = input_value[key]
+                    except KeyError:
+                        if required:
+                            report(((path, key), check, MISSING))
+                        continue
+                    present += 1
+                    if field.kind >= _RECORD:
+                        if nested is None:
+                            nested = []
+                        nested.append((field, item, (path, key)))
+                    elif type(item) not in field.exact and not field.conforms(item):
+                        report(((path, key), field, item))
+                # Keys beyond the declared ones found are unexpected, even when optional ones are missing.
+                if not check.extra and len(input_value) > present:
+                    keys = check.keys
+                    for key in input_value:
+                        if key not in keys:
+                            report(((path, key), None, input_value[key]))
+                if nested is not None:
+                    stack.append(iter(nested))
+
+            elif kind == _LIST:
+                if not isinstance(input_value, _SEQUENCES):
+                    if input_value is not None or not check.nullable:
+                        report((path, check, input_value))
+                    continue
+                if (check.min_length is not None and len(input_value) < check.min_length) or \
+                        (check.max_length is not None and len(input_value) > check.max_length):
+                    report((path, check, input_value))
+                item = check.item
+                if item.kind >= _RECORD:
+                    stack.append(_elements(item, input_value, path))
+                else:
+                    # Elements that aren't containers are checked right away, without going through the stack.
+                    exact = item.exact
+                    index = 0
+                    for element in input_value:
+                        if type(element) not in exact and not item.conforms(element):
+                            report(((path, index), item, element))
+                            if limit is not None and len(found) >= limit:
+                                return found
+                        index += 1
+
+            elif type(input_value) not in check.exact and not check.conforms(input_value):
+                report((path, check, input_value))
+
+            if limit is not None and len(found) >= limit:
+                return found[:limit]
+        return found
+
+    def conforms(self, payload):
+        '''Tells if a payload has no violation.'''
+        return not self.violations(payload, 1)
+
+def describe(violation):
+    '''Describes a violation returned by `Schema.violations`, e.g. "['readings'][3]['at']: expected int, got '3'".'''
+    path, check, input_value = violation
+    if check is None:
+        description = "unexpected key"
+    else:
+        description = check.describe(input_value)
+    return "{}: {}".format(utils.render_path(path), description)
+
+def report(violations):
+    '''Describes violations, one per line, up to `utils.MAX_ITEMS` of them.'''
+    lines = ["  " + describe(violation) for violation in violations[:utils.MAX_ITEMS]]
+    if len(violations) > utils.MAX_ITEMS:
+        lines.append("  ...({} more)".format(len(violations) - utils.MAX_ITEMS))
+    return "{} violation{}:\n{}".format(len(violations), '' if len(violations) == 1 else 's', "\n".join(lines))
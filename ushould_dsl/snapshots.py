@@ -0,0 +1,300 @@
+'''
+Store of the snapshots checked by `match_snapshot`, kept in a single compact file, for both MicroPython and CPython.
+
+The file is a log of entries, each a record of a snapshot or an index of the records before it, after a header
+pointing to the last index written:
+
+    magic, index offset, count | entry (kind, length, data)...
+
+A record holds the name of a snapshot and its value, serialized as JSON; an index holds the name, offset and length
+of each snapshot. When the store is opened, only the last index and the records written after it are read; each
+snapshot is then read with a single seek, whatever the size of the store.
+
+Snapshots are only ever appended, and the header is only updated once a new index is completely written, so a store
+interrupted while writing keeps the snapshots written before. The index is written when the store is flushed or
+closed, once for all the snapshots stored since it was last written; the default store is closed by `runner.run`
+and at exit. `compact()` copies the snapshots still indexed to a new file,
+which then replaces the store.
+'''
+try:
+    import json
+except ImportError:
+    import ujson as json
+
+try:
+    import struct
+except ImportError:
+    import ustruct as struct
+
+try:
+    import os
+except ImportError:
+    import uos as os
+
+try:
+    import errno
+except ImportError:
+    import uerrno as errno
+
+try:
+    import atexit
+except ImportError:
+    atexit = None
+
+DEFAULT_PATH = 'snapshots.bin'
+
+_MAGIC = b'USN2'
+_POINTER = '<II'
+_HEADER_SIZE = len(_MAGIC) + struct.calcsize(_POINTER)
+_ENTRY = '<BI'
+_ENTRY_SIZE = struct.calcsize(_ENTRY)
+_NAME_LENGTH = '<H'
+_NAME_LENGTH_SIZE = struct.calcsize(_NAME_LENGTH)
+_LOCATION = '<II'
+_LOCATION_SIZE = struct.calcsize(_LOCATION)
+
+# Kinds of entries.
+_RECORD = 1
+_INDEX = 2
+
+def _entry(kind, data):
+    return struct.pack(_ENTRY, kind, len(data)) + data
+
+def _record(name, payload):
+    encoded = name.encode('utf-8')
+    return _entry(_RECORD, struct.pack(_NAME_LENGTH, len(encoded)) + encoded + payload)
+
+def _payload_offset(offset, name):
+    '''Returns where the payload of a record written at *offset* starts.'''
+    return offset + _ENTRY_SIZE + _NAME_LENGTH_SIZE + len(name.encode('utf-8'))
+
+def _index(index):
+    parts = []
+    for name, location in index.items():
+        encoded = name.encode('utf-8')
+        parts.append(struct.pack(_NAME_LENGTH, len(encoded)))
+        parts.append(encoded)
+        parts.append(struct.pack(_LOCATION, *location))
+    return _entry(_INDEX, b''.join(parts))
+
+def _parse_index(data):
+    index = {}
+    position = 0
+    while position < len(data):
+        name_length = struct.unpack(_NAME_LENGTH, data[position:position + _NAME_LENGTH_SIZE])[0]
+        position += _NAME_LENGTH_SIZE
+        name = data[position:position + name_length].decode('utf-8')
+        position += name_length
+        index[name] = struct.unpack(_LOCATION, data[position:position + _LOCATION_SIZE])
+        position += _LOCATION_SIZE
+    return index
+
+def _replace(source, target):
+    # os.replace is atomic on CPython; MicroPython's rename may refuse to overwrite a file.
+    replace = getattr(os, 'replace', None)
+    if replace is not None:
+        replace(source, target)
+        return
+    try:
+        os.remove(target)
+    except OSError:
+        pass
+    os.rename(source, target)
+
+class SnapshotStore:
+    '''
+        Snapshots by name, stored in the file at *path* (created on the first write).
+        With *update*, `match_snapshot` replaces the snapshots that don't match, instead of failing.
+    '''
+
+    __slots__ = ('path', 'update', '_file', '_index', '_end', '_unindexed', '_partial')
+
+    def __init__(self, path=DEFAULT_PATH, update=False):
+        self.path = path
+        self.update = update
+        self._file = None
+        self._index = None
+        self._end = _HEADER_SIZE
+        self._unindexed = 0
+        self._partial = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+        return False
+
+    def flush(self):
+        '''Writes the index of the snapshots stored since it was last written, so that the next time the store is
+        opened, their records don't have to be read.'''
+        if self._unindexed:
+            self._write_index()
+
+    def close(self):
+        '''Writes the index (see `flush`), and closes the file of the store.'''
+        self.flush()
+        self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._index = None
+        self._unindexed = 0
+
+    def _open(self):
+        if self._index is not None:
+            return
+        try:
+            self._file = open(self.path, 'r+b')
+        except OSError as error:
+            # Any other error (e.g. a denied permission) mustn't be taken for an empty store, which would be
+            # overwritten by the next snapshot.
+            if not error.args or error.args[0] != errno.ENOENT:
+                raise
+            self._index = {}
+            self._end = _HEADER_SIZE
+            return
+        self._read_index()
+
+    def _read_index(self):
+        file = self._file
+        file.seek(0, 2)
+        size = file.tell()
+        file.seek(0)
+        header = file.read(_HEADER_SIZE)
+        if header[:len(_MAGIC)] != _MAGIC or len(header) < _HEADER_SIZE:
+            raise ValueError("'{}' is not a snapshot store".format(self.path))
+        index_offset = struct.unpack(_POINTER, header[len(_MAGIC):])[0]
+        self._index = {}
+        # The records written after the last index are indexed as they are read.
+        position = index_offset or _HEADER_SIZE
+        while position + _ENTRY_SIZE <= size:
+            file.seek(position)
+            kind, length = struct.unpack(_ENTRY, file.read(_ENTRY_SIZE))
+            end = position + _ENTRY_SIZE + length
+            if end > size or kind not in (_RECORD, _INDEX):
+                # An entry left incomplete by an interrupted write, overwritten by the next one.
+                break
+            if kind == _INDEX:
+                self._index = _parse_index(file.read(length))
+                self._unindexed = 0
+            else:
+                name_length = struct.unpack(_NAME_LENGTH, file.read(_NAME_LENGTH_SIZE))[0]
+                name = file.read(name_length).decode('utf-8')
+                self._index[name] = (_payload_offset(position, name), length - _NAME_LENGTH_SIZE - name_length)
+                self._unindexed += 1
+            position = end
+        # What an interrupted write left is only dropped by the next write, so that reading never changes the file.
+        self._partial = position < size
+        self._end = position
+
+    def _seek_end(self):
+        file = self._file
+        if self._partial:
+            # New entries might not entirely cover what an interrupted write left.
+            truncate = getattr(file, 'truncate', None)
+            if truncate is not None:
+                file.seek(self._end)
+                truncate()
+            self._partial = False
+        file.seek(self._end)
+
+    def names(self):
+        '''Returns the names of the stored snapshots.'''
+        self._open()
+        return list(self._index)
+
+    def __contains__(self, name):
+        self._open()
+        return name in self._index
+
+    def get(self, name):
+        '''Returns the snapshot of the given name, raising KeyError if there isn't one.'''
+        self._open()
+        offset, length = self._index[name]
+        self._file.seek(offset)
+        return json.loads(self._file.read(length).decode('utf-8'))
+
+    def put(self, name, input_value):
+        '''Stores a snapshot, replacing the one with the same name. Only its record is written: the index is
+        written once, when the store is closed.'''
+        self._open()
+        payload = json.dumps(input_value).encode('utf-8')
+        if self._file is None:
+            self._file = open(self.path, 'w+b')
+            self._file.write(_MAGIC + struct.pack(_POINTER, 0, 0))
+        self._seek_end()
+        file = self._file
+        file.write(_record(name, payload))
+        self._index[name] = (_payload_offset(self._end, name), len(payload))
+        self._end = file.tell()
+        self._unindexed += 1
+        file.flush()
+
+    def _write_index(self):
+        file = self._file
+        index_offset = self._end
+        self._seek_end()
+        file.write(_index(self._index))
+        self._end = file.tell()
+        file.flush()
+        # The header only points to the new index once it is completely written.
+        file.seek(len(_MAGIC))
+        file.write(struct.pack(_POINTER, index_offset, len(self._index)))
+        file.flush()
+        self._unindexed = 0
+
+    def compact(self):
+        '''Rewrites the store without the records of replaced snapshots. They are copied one by one to a new file,
+        which replaces the store once it is complete.'''
+        self._open()
+        if self._file is None:
+            return
+        temporary = self.path + '.tmp'
+        index = {}
+        with open(temporary, 'wb') as target:
+            target.write(_MAGIC + struct.pack(_POINTER, 0, 0))
+            end = _HEADER_SIZE
+            for name, (offset, length) in self._index.items():
+                self._file.seek(offset)
+                payload = self._file.read(length)
+                target.write(_record(name, payload))
+                index[name] = (_payload_offset(end, name), length)
+                end = target.tell()
+            target.write(_index(index))
+            target.seek(len(_MAGIC))
+            target.write(struct.pack(_POINTER, end, len(index)))
+        self._close_file()
+        _replace(temporary, self.path)
+
+    @staticmethod
+    def normalize(input_value):
+        '''Returns a value as it would be read back from the store (e.g. tuples become lists).'''
+        return json.loads(json.dumps(input_value))
+
+_default_store = None
+
+def default_store():
+    '''Returns the store used by `match_snapshot` when it isn't given one, at DEFAULT_PATH unless set with `use_store`.'''
+    global _default_store
+    if _default_store is None:
+        _default_store = SnapshotStore()
+    return _default_store
+
+def use_store(path=DEFAULT_PATH, update=False):
+    '''Sets the store used by `match_snapshot` when it isn't given one, and returns it.'''
+    global _default_store
+    close_default_store()
+    _default_store = SnapshotStore(path, update)
+    return _default_store
+
+def close_default_store():
+    '''Closes the default store, writing its index. Called by `runner.run`, and at exit where *atexit* is
+    available.'''
+    if _default_store is not None:
+        _default_store.close()
+
+if atexit is not None:
+    atexit.register(close_default_store)
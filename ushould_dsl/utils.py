@@ -1,3 +1,41 @@
+import re
+from .exceptions import Should_NotSatisfied, ShouldNot_NotSatisfied
+
+try:
+    from array import array as _array
+except ImportError:
+    _array = None
+
+try:
+    import hashlib as _hashlib
+except ImportError:
+    try:
+        import uhashlib as _hashlib
+    except ImportError:
+        _hashlib = None
+
+PATTERN_CACHE_SIZE = 32
+_pattern_cache = {}
+# The keys of _pattern_cache, from the least to the most recently used.
+_pattern_order = []
+
+ATTRIBUTE_PLAN_CACHE_SIZE = 64
+_attribute_plans = {}
+# The keys of _attribute_plans, from the oldest, see `remember`.
+_attribute_plan_order = []
+
+INFINITY = float('inf')
+
+def _float_epsilon():
+    # MicroPython ports may use single precision floats.
+    epsilon = 1.0
+    while 1.0 + epsilon / 2 != 1.0:
+        epsilon /= 2
+    return epsilon
+
+# Rounding error tolerated by comparisons between floats, relative to their magnitude.
+FLOAT_SLACK = 4 * _float_epsilon()
+
 def isfunction(obj):
     '''
         Method based on the "inspect" micropython library.
@@ -52,11 +90,14 @@ def exception_type(input_value):
     return None
 
 def keys_in_phrase(keys, name):
-    keys = list(keys)
+    keys = [shorten(x) for x in keys]
     if len(keys) == 0:
         return ""
     elif len(keys) == 1:
         return "{} '{}'".format(name, keys[-1])
+    elif len(keys) > MAX_ITEMS:
+        shown = ", ".join(["'{}'".format(x) for x in keys[:MAX_ITEMS]])
+        return "{}s {} and {} other {}s".format(name, shown, len(keys) - MAX_ITEMS, name)
     else:
         first_term = keys.pop(0)
         last_term = keys.pop(-1)
@@ -85,3 +126,988 @@ def is_iterable(obj):
     except:
         pass
     return False
+
+async def _coroutine():
+    pass
+
+# MicroPython implements coroutines as generators, without an __await__ method, so they can't be told apart from the
+# generators of regular functions there.
+_coroutine_object = _coroutine()
+_BARE_COROUTINE_TYPES = () if hasattr(_coroutine_object, '__await__') else (type(_coroutine_object),)
+_coroutine_object.close()
+del _coroutine_object
+
+def is_awaitable(obj, expected=False):
+    '''
+        Checks if an object can be awaited: a coroutine, a task, a future...
+
+        On MicroPython, a coroutine is a generator, which is only taken for a coroutine where an awaitable is
+        *expected* (e.g. in `should_async`); elsewhere, it's taken for the plain generator it may be.
+
+        Parameters
+        ----------
+        first : object
+            the object to be verified.
+        second : bool
+            whether an awaitable is expected.
+
+        Returns
+        -------
+        bool
+            True if the object can be awaited.
+    '''
+    return hasattr(obj, '__await__') or (expected and isinstance(obj, _BARE_COROUTINE_TYPES))
+
+async def awaited(obj):
+    '''
+        Awaits an object if it's awaitable, returning its result, or returns the object itself otherwise.
+    '''
+    if is_awaitable(obj, True):
+        return await obj
+    return obj
+
+def not_awaitable(obj):
+    '''
+        Returns the result of a synchronous call, refusing the awaitables returned by coroutine functions, which
+        would never run. The awaitable is closed first, so that it isn't reported as never awaited. On MicroPython,
+        coroutines can't be told apart from generators, which are returned as is.
+    '''
+    if is_awaitable(obj):
+        close = getattr(obj, 'close', None)
+        if close is not None:
+            close()
+        raise TypeError("got an awaitable, which must be checked with should_async or should_not_async")
+    return obj
+
+_iterable_types = {}
+_iterable_type_order = []
+
+def has_iterable_type(obj):
+    '''
+        Checks if an object is iterable, like `is_iterable`, but probing each type only once.
+    '''
+    try:
+        return _iterable_types[type(obj)]
+    except KeyError:
+        return remember(_iterable_types, _iterable_type_order, type(obj), is_iterable(obj),
+            ATTRIBUTE_PLAN_CACHE_SIZE)
+
+class unmatched:
+    '''
+        Returned by *should_match* or *should_not_match* instead of False, with the *details* of the evaluation
+        that the failure message needs. They are given to the message method as a second argument, so the message
+        doesn't depend on state kept on the matcher, which may be shared by threads or tasks (e.g. by
+        `should.compile`).
+    '''
+
+    __slots__ = ('details',)
+
+    def __init__(self, details):
+        self.details = details
+
+    def __bool__(self):
+        return False
+
+class explained:
+    '''A message method of a matcher, bound to the details of an `unmatched` evaluation.'''
+
+    __slots__ = ('message_for_failure', 'details')
+
+    def __init__(self, message_for_failure, details):
+        self.message_for_failure = message_for_failure
+        self.details = details
+
+    def __call__(self, left_value):
+        return self.message_for_failure(left_value, self.details)
+
+def explain(message_for_failure, outcome):
+    '''
+        Returns the message method to call for an evaluation that didn't match: bound to its details when it
+        returned `unmatched`, as is otherwise.
+    '''
+    if isinstance(outcome, unmatched):
+        return explained(message_for_failure, outcome.details)
+    return message_for_failure
+
+def failure_message(message_for_failure, left_value, outcome=False):
+    '''
+        Runs one of the *message_for_failed_should* and *message_for_failed_should_not* methods of a
+        matcher, catching the exception it raises.
+
+        Parameters
+        ----------
+        first : callable
+            the bound method building the failure.
+        second : object
+            the left value of the failed expectation.
+        third : object
+            what the failed evaluation returned, see `unmatched`.
+
+        Returns
+        -------
+        object
+            the failure message, which may be a `message` that is only rendered when converted to a string.
+    '''
+    try:
+        explain(message_for_failure, outcome)(left_value)
+    except (Should_NotSatisfied, ShouldNot_NotSatisfied) as exception:
+        if len(exception.args) == 1:
+            if isinstance(exception.args[0], static_message):
+                return exception.args[0].copy()
+            return exception.args[0]
+        return str(exception)
+    return ''
+
+def bounds(input_value):
+    '''
+        Finds the smallest and the greatest elements of ranges, bytes, bytearrays, memoryviews and arrays
+        without running Python code for each element.
+
+        Parameters
+        ----------
+        first : object
+            the sequence to be inspected.
+
+        Returns
+        -------
+        tuple or None
+            return (smallest, greatest) or None if the object is empty, is not one of those types, or holds
+            a NaN (which can't be ordered).
+    '''
+    if isinstance(input_value, range):
+        if len(input_value) == 0:
+            return None
+        first, last = input_value[0], input_value[-1]
+        return (first, last) if first <= last else (last, first)
+
+    if isinstance(input_value, (bytes, bytearray)):
+        if len(input_value) == 0:
+            return None
+        return (min(input_value), max(input_value))
+
+    if isinstance(input_value, memoryview) or (_array is not None and isinstance(input_value, _array)):
+        if len(input_value) == 0:
+            return None
+        if isinstance(input_value[0], float):
+            total = sum(input_value)
+            if total != total:
+                return None
+        return (min(input_value), max(input_value))
+
+    return None
+
+def element_type(input_value):
+    '''
+        Finds the type shared by every element of ranges, bytes, bytearrays and arrays.
+
+        Parameters
+        ----------
+        first : object
+            the sequence to be inspected.
+
+        Returns
+        -------
+        type or None
+            return the elements' type or None if it can't be known without iterating the sequence.
+    '''
+    if isinstance(input_value, (range, bytes, bytearray)):
+        return int
+    if _array is not None and isinstance(input_value, _array):
+        typecode = getattr(input_value, 'typecode', None)
+        if typecode is not None:
+            if typecode in 'fd':
+                return float
+            if typecode in 'uw':
+                return str
+            return int
+    return None
+
+_LOOKUP_TYPES = (set, frozenset, dict, type({}.keys()))
+
+def has_fast_lookup(input_value):
+    '''
+        Checks if membership on an object is a hash lookup (sets, dictionaries and their key views), instead
+        of a linear search.
+
+        Parameters
+        ----------
+        first : object
+            the object to be verified.
+
+        Returns
+        -------
+        bool
+            return True if `x in input_value` doesn't iterate it.
+    '''
+    return isinstance(input_value, _LOOKUP_TYPES)
+
+def split_hashable(input_value):
+    '''
+        Splits the elements of an iterable between the hashable ones, that can be looked up in constant time,
+        and the unhashable ones (lists, dictionaries, ...), that must be compared one by one.
+
+        Parameters
+        ----------
+        first : iterable
+            the elements to be split.
+
+        Returns
+        -------
+        tuple
+            return a frozenset with the hashable elements and a tuple with the unhashable ones, without duplicates.
+    '''
+    hashable = set()
+    unhashable = []
+    for element in input_value:
+        try:
+            hashable.add(element)
+        except TypeError:
+            if element not in unhashable:
+                unhashable.append(element)
+    return frozenset(hashable), tuple(unhashable)
+
+class count:
+    '''
+        Counts the elements of an iterable, through len() when it's available. Iterators are consumed one
+        element at a time, without being stored, and only until *limit* elements were seen.
+
+        It compares and formats like the number of elements counted. When the count stopped at the limit it
+        reads "at least N", as the iterator may have more elements.
+    '''
+
+    __slots__ = ('value', 'exact')
+
+    def __init__(self, input_value, limit=None):
+        try:
+            self.value = len(input_value)
+            self.exact = True
+            return
+        except TypeError:
+            pass
+        self.value = 0
+        self.exact = limit is None or limit > 0
+        if not self.exact:
+            return
+        for _ in input_value:
+            self.value += 1
+            if self.value == limit:
+                self.exact = False
+                return
+
+    def __eq__(self, other):
+        return self.exact and self.value == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __le__(self, other):
+        return self.exact and self.value <= other
+
+    def __ge__(self, other):
+        return self.value >= other
+
+    def __repr__(self):
+        if self.exact:
+            return repr(self.value)
+        return "at least {}".format(self.value)
+
+    __str__ = __repr__
+
+def compile_pattern(pattern, flags=0):
+    '''
+        Compiles a regular expression, sharing the compiled object between matchers through a bounded
+        least recently used cache (MicroPython's *re* module doesn't cache compiled patterns).
+
+        Parameters
+        ----------
+        first : str, bytes or compiled pattern
+            the regular expression. Objects that were already compiled are returned untouched.
+        second : int
+            the flags to compile the pattern with.
+
+        Returns
+        -------
+        object
+            the compiled pattern.
+    '''
+    if not isinstance(pattern, (str, bytes)):
+        return pattern
+
+    key = (pattern, flags) if flags else pattern
+    compiled = _pattern_cache.get(key)
+    if compiled is None:
+        compiled = re.compile(pattern, flags) if flags else re.compile(pattern)
+        # MicroPython's dictionaries don't keep the insertion order, so the order of use is kept apart.
+        while len(_pattern_order) >= PATTERN_CACHE_SIZE:
+            _pattern_cache.pop(_pattern_order.pop(0), None)
+        _pattern_cache[key] = compiled
+    elif _pattern_order[-1] == key:
+        return compiled
+    else:
+        try:
+            _pattern_order.remove(key)
+        except ValueError:
+            # Evicted by another thread meanwhile.
+            _pattern_cache[key] = compiled
+    _pattern_order.append(key)
+    return compiled
+
+def pattern_source(pattern):
+    '''
+        Returns the text of a regular expression, whether it's compiled or not.
+    '''
+    if isinstance(pattern, (str, bytes)):
+        return pattern
+    return getattr(pattern, 'pattern', pattern)
+
+# Stands for an attribute an object doesn't have.
+NOT_SET = object()
+
+def _declared_names(cls, names):
+    for base in getattr(cls, '__bases__', ()):
+        _declared_names(base, names)
+    slots = cls.__dict__.get('__slots__', ()) if hasattr(cls, '__dict__') else ()
+    if isinstance(slots, str):
+        slots = (slots,)
+    fields = cls.__dict__.get('_fields', ()) if hasattr(cls, '__dict__') else ()
+    for name in tuple(fields) + tuple(slots):
+        if name not in ('__dict__', '__weakref__') and name not in names:
+            names.append(name)
+
+def attribute_plan(cls):
+    '''
+        Returns the names of the attributes declared by a class and its bases, through *__slots__* or a *_fields*
+        list (like named tuples), caching them per class. Attributes kept in the *__dict__* of instances aren't
+        included, since they can differ from one instance to another.
+    '''
+    try:
+        return _attribute_plans[cls]
+    except KeyError:
+        pass
+    names = []
+    _declared_names(cls, names)
+    return remember(_attribute_plans, _attribute_plan_order, cls, tuple(names), ATTRIBUTE_PLAN_CACHE_SIZE)
+
+def remember(cache, order, key, value, size):
+    '''
+        Stores a value in a cache holding up to *size* entries, evicting the oldest ones first. *order* lists the
+        keys of the cache from the oldest, since MicroPython's dictionaries don't keep the insertion order.
+        Returns the value.
+    '''
+    if key not in cache:
+        while len(order) >= size:
+            try:
+                cache.pop(order.pop(0), None)
+            except IndexError:
+                # Emptied by another thread.
+                break
+        order.append(key)
+    cache[key] = value
+    return value
+
+def attribute_differences(left_value, right_value):
+    '''
+        Compares the attributes of two objects, both the declared ones (see `attribute_plan`) and the ones kept in
+        their *__dict__*, whichever object they are set on.
+
+        Returns
+        -------
+        generator
+            (name, left attribute, right attribute) for each attribute that differs, NOT_SET standing for the
+            attributes an object doesn't have.
+    '''
+    left_class = type(left_value)
+    right_class = type(right_value)
+    names = attribute_plan(right_class)
+    if left_class is not right_class:
+        names = names + tuple(name for name in attribute_plan(left_class) if name not in names)
+    for name in names:
+        left_attribute = getattr(left_value, name, NOT_SET)
+        right_attribute = getattr(right_value, name, NOT_SET)
+        if left_attribute != right_attribute:
+            yield name, left_attribute, right_attribute
+
+    left_dict = getattr(left_value, '__dict__', None) or {}
+    right_dict = getattr(right_value, '__dict__', None) or {}
+    if left_dict == right_dict:
+        return
+    # MicroPython ignores __slots__, so declared attributes may be kept in __dict__ too.
+    for name, right_attribute in right_dict.items():
+        left_attribute = left_dict.get(name, NOT_SET)
+        if left_attribute != right_attribute and name not in names:
+            yield name, left_attribute, right_attribute
+    for name, left_attribute in left_dict.items():
+        if name not in right_dict and name not in names:
+            yield name, left_attribute, NOT_SET
+
+_BUFFER_TYPES = (bytearray, memoryview) + ((_array,) if _array is not None else ())
+
+# Values hashed as they are, without looking further.
+_SCALAR_TYPES = (int, float, str, bytes, bool, type(None))
+_CONTAINER_TYPES = (list, tuple, dict, set, frozenset)
+
+_OBJECT_HASH = getattr(object, '__hash__', None)
+
+# Fingerprints of containers are kept within small integers, which MicroPython doesn't allocate, even on 32 bits:
+# the state times 31 stays below 2**30.
+_FINGERPRINT_MASK = 0x1FFFFFF
+
+# Marks mixed into a fingerprint around the elements of a container, and for a container met again.
+_OPENED = 0x1A2B3C
+_CLOSED = 0x0C3B2A
+_MET_AGAIN = 0x15A5A5
+
+_NEGATIVE = 0x0B1E55
+_FINGERPRINT_BITS = 25
+
+def _mix(state, value):
+    # A multiply-xorshift step, which depends on the position of each value, unlike a rotation of the state.
+    state = ((state ^ (value & _FINGERPRINT_MASK)) * 31) & _FINGERPRINT_MASK
+    return state ^ (state >> 11)
+
+def _mix_int(state, value):
+    # Folds every bit of an integer into the state, 25 at a time, and its sign.
+    if value < 0:
+        value = ~value
+        state = _mix(state, _NEGATIVE)
+    while True:
+        state = _mix(state, value)
+        value >>= _FINGERPRINT_BITS
+        if not value:
+            return state
+
+def _entries(dictionary):
+    for key, item in dictionary.items():
+        yield key
+        yield item
+
+def _elements_of(container):
+    return _entries(container) if isinstance(container, dict) else iter(container)
+
+def _hashed_by_identity(input_value):
+    '''Tells if a value is an instance of a class hashed by identity, with attributes whose changes its hash ignores.'''
+    if isclass(input_value) or isfunction(input_value) or type(input_value) is type(re):
+        return False
+    kind = type(input_value)
+    if getattr(kind, '__hash__', _OBJECT_HASH) is not _OBJECT_HASH:
+        return False
+    return hasattr(input_value, '__dict__') or bool(attribute_plan(kind))
+
+def fingerprint(input_value):
+    '''
+        Returns a fingerprint of the contents of a value, without copying it: numbers, strings and bytes are their
+        own fingerprint, other hashable values are hashed, buffers (bytearray, memoryview, array) are digested with
+        sha256, and the other containers are fingerprinted element by element. Two equal fingerprints mean the contents are, very likely, the same.
+
+        Containers are walked without recursion, and a container met again (e.g. in a cycle) is only fingerprinted
+        by the order in which it was first met.
+
+        Returns None when the contents can't be fingerprinted: when the value holds instances of classes hashed by
+        identity (neither defining *__hash__* nor *__eq__*), whose attributes may change, or objects that can
+        neither be hashed nor iterated.
+    '''
+    if type(input_value) in _SCALAR_TYPES:
+        return input_value
+    if isinstance(input_value, _BUFFER_TYPES) and _hashlib is not None:
+        return _hashlib.sha256(input_value).digest()
+    if not isinstance(input_value, _CONTAINER_TYPES):
+        try:
+            hashed = hash(input_value)
+        except TypeError:
+            if not has_iterable_type(input_value):
+                return None
+        else:
+            return None if _hashed_by_identity(input_value) else hashed
+
+    state = 0
+    length = 0
+    # The order in which the containers were met, by id. They are kept alive until the end, so ids aren't reused.
+    met = {id(input_value): 0}
+    containers = [input_value]
+    # Iterators over the containers being walked, and the number of elements walked in each.
+    stack = [_elements_of(input_value)]
+    counts = [0]
+    while stack:
+        try:
+            element = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            state = _mix(_mix(state, _CLOSED), counts.pop())
+            continue
+        counts[-1] += 1
+        if len(stack) == 1:
+            length += 1
+
+        element_type = type(element)
+        if element_type is int:
+            # Integers are mixed in themselves, since their hashes collide (e.g. hash(-1) == hash(-2) on CPython).
+            state = _mix_int(state, element)
+            continue
+        if element_type in _SCALAR_TYPES:
+            state = _mix_int(state, hash(element))
+            continue
+        if isinstance(element, _BUFFER_TYPES) and _hashlib is not None:
+            state = _mix_int(state, hash(_hashlib.sha256(element).digest()))
+            continue
+        if not isinstance(element, _CONTAINER_TYPES):
+            try:
+                hashed = hash(element)
+            except TypeError:
+                if not has_iterable_type(element):
+                    return None
+            else:
+                if _hashed_by_identity(element):
+                    return None
+                state = _mix_int(state, hashed)
+                continue
+
+        order = met.get(id(element))
+        if order is not None:
+            state = _mix(_mix(state, _MET_AGAIN), order)
+            continue
+        met[id(element)] = len(containers)
+        containers.append(element)
+        state = _mix(_mix(state, _OPENED), hash(element_type))
+        stack.append(_elements_of(element))
+        counts.append(0)
+    return (type(input_value), length, state)
+
+# Budget used to render the values shown in failure messages, see `set_repr_budget`.
+MAX_CHARS = 1000
+MAX_ITEMS = 50
+MAX_DEPTH = 4
+
+def set_repr_budget(max_chars=None, max_items=None, max_depth=None):
+    '''
+        Changes how much of the values is shown in failure messages by all matchers.
+
+        Parameters
+        ----------
+        max_chars : int
+            maximum length of the text rendered for a value.
+        max_items : int
+            maximum number of elements rendered for each collection.
+        max_depth : int
+            maximum nesting level rendered for collections within collections.
+    '''
+    global MAX_CHARS, MAX_ITEMS, MAX_DEPTH
+    if max_chars is not None:
+        MAX_CHARS = max_chars
+    if max_items is not None:
+        MAX_ITEMS = max_items
+    if max_depth is not None:
+        MAX_DEPTH = max_depth
+
+_CONTAINER_BRACKETS = {list: ('[', ']'), tuple: ('(', ')'), set: ('{', '}'), frozenset: ('frozenset({', '})'), dict: ('{', '}')}
+
+def _shorten_into(input_value, quoted, depth, parts, budget):
+    if budget[0] <= 0:
+        return
+
+    value_type = type(input_value)
+    if value_type in _CONTAINER_BRACKETS:
+        if len(input_value) == 0:
+            parts.append(repr(input_value))
+            return
+        opening, closing = _CONTAINER_BRACKETS[value_type]
+        if depth <= 0:
+            parts.append(opening + '...' + closing)
+            return
+
+        parts.append(opening)
+        count = 0
+        for element in input_value:
+            if count == MAX_ITEMS:
+                parts.append(', ...({} more)'.format(len(input_value) - count))
+                break
+            if budget[0] <= 0:
+                break
+            if count:
+                parts.append(', ')
+            if value_type is dict:
+                _shorten_into(element, True, depth - 1, parts, budget)
+                parts.append(': ')
+                element = input_value[element]
+            _shorten_into(element, True, depth - 1, parts, budget)
+            count += 1
+        if value_type is tuple and len(input_value) == 1:
+            parts.append(',')
+        parts.append(closing)
+        return
+
+    if _array is not None and value_type is _array and len(input_value) > MAX_ITEMS:
+        parts.append("array('{}', ".format(getattr(input_value, 'typecode', '?')))
+        _shorten_into(list(input_value[:MAX_ITEMS]), True, depth, parts, budget)
+        parts[-1] = ', ...({} more)])'.format(len(input_value) - MAX_ITEMS)
+        return
+
+    if value_type in (str, bytes, bytearray) and len(input_value) > MAX_CHARS:
+        input_value = input_value[:MAX_CHARS]
+        text = repr(input_value) if quoted or value_type is not str else input_value
+        text += '...'
+    else:
+        text = repr(input_value) if quoted else str(input_value)
+    parts.append(text)
+    budget[0] -= len(text)
+
+def shorten(input_value, quoted=False):
+    '''
+        Renders an object like *str()* does (or *repr()*, if quoted), but within the budget defined by
+        `set_repr_budget`: long strings are cut, and only the first elements of large or deeply nested
+        lists, tuples, sets, dictionaries and arrays are shown.
+
+        Parameters
+        ----------
+        first : object
+            the object to be rendered.
+        second : bool
+            whether to render the object like *repr()* does.
+
+        Returns
+        -------
+        str
+            the rendered object.
+    '''
+    parts = []
+    _shorten_into(input_value, quoted, MAX_DEPTH, parts, [MAX_CHARS])
+    text = ''.join(parts)
+    if len(text) > MAX_CHARS:
+        text = text[:MAX_CHARS] + '...'
+    return text
+
+class bounded:
+    '''Wraps a message argument, so it is shortened both by '{}' and '{!r}' fields.'''
+
+    __slots__ = ('value',)
+
+    def __init__(self, input_value):
+        self.value = input_value
+
+    def __str__(self):
+        return shorten(self.value)
+
+    def __repr__(self):
+        return shorten(self.value, quoted=True)
+
+class lazy:
+    '''
+        Text built by calling a function only when it's converted to a string.
+        Used as an argument of `message`, it's rendered as is, without being shortened.
+    '''
+
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+class message:
+    '''
+        A failure message, rendered from a *str.format()* template only when it's converted to a string.
+        Arguments are shortened according to the budget defined by `set_repr_budget`.
+    '''
+
+    __slots__ = ('template', 'args', '_rendered')
+
+    def __init__(self, template, *args):
+        self.template = template
+        self.args = args
+        self._rendered = None
+
+    def __str__(self):
+        if self._rendered is None:
+            self._rendered = self.template.format(
+                *[arg if isinstance(arg, lazy) else bounded(arg) for arg in self.args])
+        return self._rendered
+
+    def __repr__(self):
+        return repr(str(self))
+
+class static_message:
+    '''
+        The message of a preallocated failure (see `enable_static_failures`): a template and the two operands of a
+        comparison, set in place by every failure. It's rendered like a `message` when converted to a string, or as
+        its bare template when there isn't enough memory left for that.
+    '''
+
+    __slots__ = ('template', 'left', 'right')
+
+    def __init__(self):
+        self.template = ''
+        self.left = None
+        self.right = None
+
+    def copy(self):
+        '''Returns a `message` that isn't changed by the next failure.'''
+        return message(self.template, self.left, self.right)
+
+    def __str__(self):
+        try:
+            return str(self.copy())
+        except MemoryError:
+            return self.template
+
+    def __repr__(self):
+        return repr(str(self))
+
+def missing_summary(missing, total):
+    '''
+        Describes which of the expected elements are missing, e.g. "missing 3 of 10000 elements: [1, 2, 3]".
+    '''
+    return "missing {} of {} elements: {}".format(len(missing), total, shorten(missing))
+
+# Kinds of difference yielded by `differences`.
+DIFFERENT_VALUE = 'value'
+DIFFERENT_LENGTH = 'length'
+MISSING = 'missing'
+UNEXPECTED = 'unexpected'
+
+_SETS = (set, frozenset)
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+# The children of a pair of containers are only yielded when they are containers too, or when they differ, so
+# that equal scalars don't cost a trip through the walk of `differences`.
+
+def _dict_children(path, left, right):
+    for key in right:
+        if key in left:
+            left_child = left[key]
+            right_child = right[key]
+            if left_child is right_child:
+                continue
+            if not isinstance(left_child, _CONTAINERS) and right_child == left_child:
+                continue
+            yield ((path, key), left_child, right_child)
+
+def _sequence_children(path, left, right):
+    index = 0
+    for left_child, right_child in zip(left, right):
+        if left_child is not right_child and \
+                (isinstance(left_child, _CONTAINERS) or not right_child == left_child):
+            yield ((path, index), left_child, right_child)
+        index += 1
+
+def differences(left_value, right_value):
+    '''
+        Walks two nested structures of dictionaries, lists, tuples and sets side by side, yielding their
+        differences as they are found. The walk is iterative, so deep structures don't exhaust the stack, and
+        a pair of containers isn't compared again inside itself, so cycles are supported.
+
+        Parameters
+        ----------
+        first : object
+            the actual value.
+        second : object
+            the expected value.
+
+        Returns
+        -------
+        generator
+            yields (path, kind, actual, expected) tuples, where path is given to `render_path` and kind is one of
+            DIFFERENT_VALUE, DIFFERENT_LENGTH (actual and expected are lengths), MISSING and UNEXPECTED (actual or
+            expected is the missing or unexpected dictionary value or set element).
+    '''
+    # Each entry iterates over the (path, actual, expected) triples still to be compared inside a pair of
+    # containers; paths are (parent, key) pairs, only turned into text for the differences reported.
+    stack = [iter(((None, left_value, right_value),))]
+    containers = [None]
+    # The pairs of containers being compared, to detect cycles.
+    ancestors = set()
+    while stack:
+        try:
+            path, left, right = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            ancestors.discard(containers.pop())
+            continue
+
+        if left is right:
+            continue
+
+        if isinstance(left, dict) and isinstance(right, dict):
+            pair = (id(left), id(right))
+            if pair in ancestors:
+                continue
+            for key in right:
+                if key not in left:
+                    yield ((path, key), MISSING, None, right[key])
+            for key in left:
+                if key not in right:
+                    yield ((path, key), UNEXPECTED, left[key], None)
+            ancestors.add(pair)
+            containers.append(pair)
+            stack.append(_dict_children(path, left, right))
+
+        elif (isinstance(left, list) and isinstance(right, list)) or \
+                (isinstance(left, tuple) and isinstance(right, tuple)):
+            pair = (id(left), id(right))
+            if pair in ancestors:
+                continue
+            if len(left) != len(right):
+                yield (path, DIFFERENT_LENGTH, len(left), len(right))
+            ancestors.add(pair)
+            containers.append(pair)
+            stack.append(_sequence_children(path, left, right))
+
+        elif isinstance(left, _SETS) and isinstance(right, _SETS):
+            if left != right:
+                for element in right:
+                    if element not in left:
+                        yield (path, MISSING, None, element)
+                for element in left:
+                    if element not in right:
+                        yield (path, UNEXPECTED, element, None)
+
+        elif not right == left:
+            yield (path, DIFFERENT_VALUE, left, right)
+
+def render_path(path):
+    '''
+        Renders a path yielded by `differences`, e.g. "['readings'][3]". Only its last MAX_ITEMS keys are shown.
+    '''
+    keys = []
+    depth = 0
+    while path is not None:
+        path, key = path
+        depth += 1
+        if depth <= MAX_ITEMS:
+            keys.append(key)
+    if not keys:
+        return 'value'
+    keys.reverse()
+    text = ''.join(['[{}]'.format(shorten(key, True)) for key in keys])
+    if depth > MAX_ITEMS:
+        text = '...({} levels)'.format(depth - MAX_ITEMS) + text
+    return text
+
+def _describe_difference(path, kind, left, right):
+    where = render_path(path)
+    if kind == DIFFERENT_LENGTH:
+        return "{}: expected {} elements, got {}".format(where, right, left)
+    if kind == MISSING:
+        return "{}: missing {}".format(where, shorten(right, True))
+    if kind == UNEXPECTED:
+        return "{}: unexpected {}".format(where, shorten(left, True))
+    description = "{}: expected {}, got {}".format(where, shorten(right, True), shorten(left, True))
+    if isinstance(left, str) and isinstance(right, str):
+        index = 0
+        while index < len(left) and index < len(right) and left[index] == right[index]:
+            index += 1
+        description += " (first difference at index {})".format(index)
+    return description
+
+def diff_report(left_value, right_value):
+    '''
+        Describes the differences between two nested structures, one per line, up to MAX_ITEMS of them.
+    '''
+    lines = []
+    total = 0
+    for difference in differences(left_value, right_value):
+        total += 1
+        if total <= MAX_ITEMS:
+            lines.append("  " + _describe_difference(*difference))
+    if total > MAX_ITEMS:
+        lines.append("  ...({} more)".format(total - MAX_ITEMS))
+    return "{} difference{}:\n{}".format(total, '' if total == 1 else 's', "\n".join(lines))
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter_ns as _perf_counter_ns
+
+    def ticks_us():
+        '''
+            Microseconds from an arbitrary point, like *time.ticks_us()* from MicroPython.
+        '''
+        return _perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        '''
+            Difference between two values of `ticks_us`, like *time.ticks_diff()* from MicroPython.
+        '''
+        return end - start
+
+try:
+    from time import ticks_ms, sleep_ms
+except ImportError:
+    from time import monotonic as _monotonic, sleep as _sleep
+
+    def ticks_ms():
+        '''
+            Milliseconds from an arbitrary point, like *time.ticks_ms()* from MicroPython.
+        '''
+        return int(_monotonic() * 1000)
+
+    def sleep_ms(milliseconds):
+        '''
+            Sleeps for the given milliseconds, like *time.sleep_ms()* from MicroPython.
+        '''
+        _sleep(milliseconds / 1000)
+
+def allocated_bytes(function, repeat=1):
+    '''
+        Measures the memory allocated by calls to a function, using *gc.mem_alloc()* on MicroPython
+        (with the garbage collector disabled meanwhile) and *tracemalloc* on CPython.
+
+        Parameters
+        ----------
+        first : callable
+            the function to be called, without arguments.
+        second : int
+            how many times the function is called.
+
+        Returns
+        -------
+        int
+            the average bytes allocated per call. On CPython, memory freed before the call returns isn't
+            counted twice: it's the peak of memory in use during the call.
+    '''
+    return sum(allocation_samples(function, repeat)) // repeat
+
+def allocation_samples(function, repeat=1):
+    '''
+        Measures the memory allocated by each of *repeat* calls to a function, like `allocated_bytes`.
+
+        Returns
+        -------
+        list
+            the bytes allocated by each call.
+    '''
+    import gc
+    samples = []
+    if hasattr(gc, 'mem_alloc'):
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                before = gc.mem_alloc()
+                function()
+                samples.append(gc.mem_alloc() - before)
+            return samples
+        finally:
+            gc.enable()
+
+    import tracemalloc
+    started = tracemalloc.is_tracing()
+    if not started:
+        tracemalloc.start()
+    try:
+        for _ in range(repeat):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function()
+            samples.append(tracemalloc.get_traced_memory()[1] - before)
+        return samples
+    finally:
+        if not started:
+            tracemalloc.stop()
+
+def percentile(sorted_samples, fraction):
+    '''
+        Returns the sample below which the given fraction of the (sorted) samples are, by the nearest rank.
+    '''
+    rank = -(-len(sorted_samples) * fraction // 1)
+    return sorted_samples[max(int(rank), 1) - 1]